@@ -0,0 +1,53 @@
+"""Throughput of retrieve_batch against a per-query retrieve loop.
+
+The fake provider sleeps --embed-latency-ms per call, standing in for the
+embedding HTTP round trip that batching saves.
+
+    python -m bench.batch_retrieve --chunks 50000 --queries 500 --embed-latency-ms 40
+"""
+from __future__ import annotations
+import argparse
+import json
+import numpy as np
+
+from bench.common import use_temp_data_dir, FakeEmbeddings, synthetic_chunks, Timer
+
+use_temp_data_dir()
+
+from rag.store import create_kb  # noqa: E402
+from rag.ingest import write_document  # noqa: E402
+from rag.query import retrieve, retrieve_batch  # noqa: E402
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--mode", default="dense")
+    ap.add_argument("--embed-latency-ms", type=float, default=40.0)
+    args = ap.parse_args()
+
+    chunks = synthetic_chunks(args.chunks, size=200)
+    kb = create_kb("batch-bench").kb_id
+    write_document(kb, "corpus.txt", "text/plain", 0, chunks, FakeEmbeddings().embed_texts(chunks))
+    rng = np.random.default_rng(1)
+    queries = [chunks[i][:80] for i in rng.choice(args.chunks, args.queries, replace=False)]
+
+    emb = FakeEmbeddings(latency_ms=args.embed_latency_ms)
+    with Timer() as loop:
+        one = [retrieve(kb, q, emb, top_k=args.top_k, mode=args.mode) for q in queries]
+    with Timer() as batch:
+        many = retrieve_batch(kb, queries, emb, top_k=args.top_k, mode=args.mode)
+    same = sum([r["vector_ord"] for r in a] == [r["vector_ord"] for r in b] for a, b in zip(one, many))
+    print(json.dumps({
+        "chunks": args.chunks,
+        "queries": args.queries,
+        "mode": args.mode,
+        "loop_qps": args.queries / loop.seconds,
+        "batch_qps": args.queries / batch.seconds,
+        "speedup": loop.seconds / batch.seconds,
+        "identical_results": same / args.queries,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Shared helpers for the offline benchmarks (run from backend/: python -m bench.<name>)."""
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+
+def use_temp_data_dir() -> str:
+    # must run before anything imports rag.store, which reads DATA_DIR at import time
+    path = tempfile.mkdtemp(prefix="ragbench-")
+    os.environ["DATA_DIR"] = path
+    return path
+
+class FakeEmbeddings:
+    """Deterministic stand-in for rag.embeddings.Embeddings (vectors seeded by text hash).
+
+    `latency_ms` is slept once per call to model a provider round trip.
+    """
+
+    def __init__(self, dim: int = 384, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(t.encode("utf-8")).digest()[:8], "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        return out
+
+def synthetic_chunks(n: int, size: int = 600, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    words = ["index", "vector", "chunk", "查询", "文档", "模型", "E-1042", "latency", "数据库", "page"]
+    out = []
+    for i in range(n):
+        picks = rng.integers(0, len(words), size=size // 6)
+        out.append(f"#{i} " + " ".join(words[j] for j in picks))
+    return out
+
+class Timer:
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.t0
+
+def percentiles(samples_ms: list[float], points=(50, 95, 99)) -> dict:
+    if not samples_ms:
+        return {f"p{p}_ms": None for p in points}
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {f"p{p}_ms": round(float(np.percentile(arr, p)), 3) for p in points}
@@ -0,0 +1,62 @@
+"""OpenAI-provider embedding throughput vs. concurrency against the local stand-in server.
+
+"legacy" is the previous scheme: fixed batches of 96 texts, one request at a time.
+With --rate-limit-rps the stand-in answers 429s and the retry path is exercised.
+
+    python -m bench.embed_concurrency --texts 20000 --concurrency 1,2,4,8,16
+"""
+from __future__ import annotations
+import argparse
+import json
+import numpy as np
+from openai import OpenAI
+
+from bench.common import Timer, synthetic_chunks
+from bench.standin import StandinConfig, _vector, start_standin
+from rag.embeddings import Embeddings, EmbeddingsConfig
+
+def legacy(client: OpenAI, texts: list[str]) -> np.ndarray:
+    vectors = []
+    for i in range(0, len(texts), 96):
+        resp = client.embeddings.create(model="standin", input=texts[i:i + 96])
+        vectors.extend(item.embedding for item in resp.data)
+    return np.array(vectors, dtype=np.float32)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--texts", type=int, default=20000)
+    ap.add_argument("--concurrency", default="1,2,4,8,16")
+    ap.add_argument("--batch-tokens", type=int, default=32000)
+    ap.add_argument("--embed-latency-ms", type=float, default=80.0)
+    ap.add_argument("--ms-per-1k-tokens", type=float, default=2.0)
+    ap.add_argument("--rate-limit-rps", type=float, default=0.0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    # mixed chunk sizes: short table rows up to full 900-char chunks
+    texts = [t[:int(n)] for t, n in zip(synthetic_chunks(args.texts, size=900), rng.integers(60, 900, args.texts))]
+    scfg = StandinConfig(embed_latency_ms=args.embed_latency_ms, embed_ms_per_1k_tokens=args.ms_per_1k_tokens,
+                         rate_limit_rps=args.rate_limit_rps)
+    server, url = start_standin(scfg)
+    check = [0, len(texts) // 2, len(texts) - 1]
+    runs = []
+
+    with Timer() as t:
+        legacy(OpenAI(api_key="x", base_url=url + "/v1", max_retries=8), texts)
+    runs.append({"scheme": "legacy-96", "concurrency": 1, "texts_per_s": round(len(texts) / t.seconds, 1)})
+
+    for c in (int(x) for x in args.concurrency.split(",")):
+        emb = Embeddings(EmbeddingsConfig(
+            provider="openai", openai_api_key="x", openai_model="standin", local_model="",
+            openai_base_url=url + "/v1", batch_tokens=args.batch_tokens, concurrency=c,
+        ))
+        with Timer() as t:
+            out = emb.embed_texts(texts)
+        ordered = all(np.allclose(out[i], _vector(texts[i].strip(), scfg.dim), atol=1e-4) for i in check)
+        runs.append({"scheme": "packed", "concurrency": c, "texts_per_s": round(len(texts) / t.seconds, 1),
+                     "ordered": ordered, **emb.provider_stats()})
+    server.shutdown()
+    print(json.dumps({"texts": args.texts, "runs": runs}, indent=2))
+
+if __name__ == "__main__":
+    main()
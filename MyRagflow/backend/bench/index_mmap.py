@@ -0,0 +1,105 @@
+"""Heap vs. memory-mapped index loading (INDEX_MMAP) across several worker processes.
+
+Builds one KB with --vectors random vectors, then for each mode starts --workers
+processes that each load the index the way a fresh app worker does (get_index),
+run --queries searches and report their load time, search latency and memory
+from /proc/self/smaps_rollup. The workers stay alive until every one of them
+has reported, so `pss_mb` (proportional set size) shows how much of the index
+they share. Linux only; the index file is in the page cache, so load times are
+a warm-cache cold start.
+
+    python -m bench.index_mmap --vectors 200000 --kind hnsw --workers 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+from bench.common import use_temp_data_dir, percentiles
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def _smaps_mb() -> dict:
+    fields = {}
+    for line in Path("/proc/self/smaps_rollup").read_text().splitlines()[1:]:
+        key, value = line.split(":", 1)
+        fields[key] = int(value.split()[0]) / 1024
+    return {"rss_mb": round(fields["Rss"], 1), "pss_mb": round(fields["Pss"], 1),
+            "private_mb": round(fields["Private_Clean"] + fields["Private_Dirty"], 1)}
+
+def worker(kb: str, queries: int, top_k: int):
+    from rag.index import get_index, search
+
+    t0 = time.perf_counter()
+    idx = get_index(kb)
+    load_ms = (time.perf_counter() - t0) * 1000
+    rng = np.random.default_rng(os.getpid())
+    lat = []
+    for q in rng.standard_normal((queries, idx.d), dtype=np.float32):
+        t0 = time.perf_counter()
+        search(kb, q[None, :], top_k)
+        lat.append((time.perf_counter() - t0) * 1000)
+    print(json.dumps({"load_ms": round(load_ms, 2), "search": percentiles(lat), **_smaps_mb()}), flush=True)
+    sys.stdin.read()  # hold the mapping until the parent has heard from every worker
+
+def run_mode(kb: str, mmap: bool, args) -> dict:
+    env = {**os.environ, "INDEX_MMAP": "1" if mmap else "0"}
+    cmd = [sys.executable, "-m", "bench.index_mmap", "--worker", kb,
+           "--queries", str(args.queries), "--top-k", str(args.top_k)]
+    procs = [subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              text=True) for _ in range(args.workers)]
+    try:
+        reports = [json.loads(p.stdout.readline()) for p in procs]
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+    return {
+        "mmap": mmap,
+        "load_ms_max": max(r["load_ms"] for r in reports),
+        "search_p50_ms": float(np.median([r["search"]["p50_ms"] for r in reports])),
+        "rss_mb_per_worker": round(float(np.mean([r["rss_mb"] for r in reports])), 1),
+        "pss_mb_total": round(sum(r["pss_mb"] for r in reports), 1),
+        "private_mb_total": round(sum(r["private_mb"] for r in reports), 1),
+    }
+
+def build(args) -> tuple[str, int]:
+    from rag.store import create_kb, faiss_path
+    from rag.index import get_index, index_add, set_index_config, _kind_of
+
+    kb = create_kb("mmap-bench").kb_id
+    if args.kind != "auto":
+        set_index_config(kb, args.kind)
+    rng = np.random.default_rng(0)
+    for start in range(0, args.vectors, 50_000):
+        n = min(50_000, args.vectors - start)
+        index_add(kb, rng.standard_normal((n, args.dim), dtype=np.float32), list(range(start, start + n)))
+    print(f"built {_kind_of(get_index(kb))} index", file=sys.stderr, flush=True)
+    return kb, faiss_path(kb).stat().st_size
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--kind", default="flat", help="auto|flat|hnsw|ivf|ivfpq")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        return worker(args.worker, args.queries, args.top_k)
+    use_temp_data_dir()
+    kb, size = build(args)
+    runs = [run_mode(kb, mmap, args) for mmap in (False, True)]
+    print(json.dumps({"vectors": args.vectors, "dim": args.dim, "kind": args.kind, "workers": args.workers,
+                      "index_file_mb": round(size / 2**20, 1), "runs": runs}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the legacy per-row ingest write path with the single-transaction bulk path.
+
+    python -m bench.ingest_write --sizes 10000,100000
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+import uuid
+import numpy as np
+
+from bench.common import use_temp_data_dir, synthetic_chunks, Timer
+
+use_temp_data_dir()
+os.environ.setdefault("INDEX_ANN_THRESHOLD", str(10**9))  # measure the write path, not an HNSW build
+
+from rag.store import create_kb, insert_doc, count_chunks, _kb_session  # noqa: E402
+from rag.index import index_add  # noqa: E402
+from rag.ingest import write_document  # noqa: E402
+
+def legacy_write(kb_id: str, chunks: list[str], vectors: np.ndarray):
+    # the pre-bulk sequence: separate commits, one execute per chunk
+    doc_id = insert_doc(kb_id, "doc.txt", "text/plain", 0)
+    start = count_chunks(kb_id)
+    created_at = int(time.time())
+    with _kb_session(kb_id) as conn:
+        for i, text in enumerate(chunks):
+            conn.execute(
+                "INSERT INTO chunks(chunk_id, doc_id, chunk_index, text, created_at, vector_ord) VALUES(?,?,?,?,?,?)",
+                (uuid.uuid4().hex[:16], doc_id, i, text, created_at, start + i),
+            )
+    index_add(kb_id, vectors, list(range(start, start + len(chunks))))
+
+def bulk_write(kb_id: str, chunks: list[str], vectors: np.ndarray):
+    write_document(kb_id, "doc.txt", "text/plain", 0, chunks, vectors)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--dim", type=int, default=384)
+    args = ap.parse_args()
+
+    results = []
+    for n in [int(x) for x in args.sizes.split(",")]:
+        chunks = synthetic_chunks(n)
+        vectors = np.random.default_rng(0).standard_normal((n, args.dim), dtype=np.float32)
+        for name, fn in (("legacy", legacy_write), ("bulk", bulk_write)):
+            kb = create_kb(f"{name}-{n}").kb_id
+            with Timer() as t:
+                fn(kb, chunks, vectors)
+            results.append({"path": name, "chunks": n, "seconds": t.seconds, "chunks_per_s": n / t.seconds})
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
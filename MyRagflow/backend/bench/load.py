@@ -0,0 +1,250 @@
+"""End-to-end HTTP load test of the app against the local stand-in LLM/embedding server.
+
+Starts bench.standin and the app (uvicorn) as subprocesses, with the app's
+Settings pointed at the stand-in through the environment (DeepSeek chat,
+OpenAI-compatible embeddings and openai_compat vision) and a temp DATA_DIR.
+Then, for each scenario and concurrency level, it keeps that many requests in
+flight and reports p50/p95/p99 latency, throughput and errors; chat also
+reports time to the first SSE `delta`, upload the submit latency next to the
+time until the ingest job is done.
+
+    python -m bench.load --scenarios chat,upload,vision --concurrency 1,8,32,64 --requests 200
+
+Answer and vision caches are off unless --caches is given, so every request
+reaches the stand-in. Pass --app-url to load an already running app instead
+(it must be configured against a stand-in by the caller).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import httpx
+
+from bench.common import percentiles, synthetic_chunks
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout_s: float = 60.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args[2]} exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout_s}s")
+
+def start_standin(args) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "bench.standin", "--port", str(port),
+           "--ttft-ms", str(args.ttft_ms), "--tokens-per-s", str(args.tokens_per_s),
+           "--answer-tokens", str(args.answer_tokens), "--embed-latency-ms", str(args.embed_latency_ms),
+           "--vision-latency-ms", str(args.vision_latency_ms)]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    _wait_ready(url + "/stats", proc)
+    return proc, url
+
+def start_app(args, standin_url: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATA_DIR": tempfile.mkdtemp(prefix="ragload-"),
+        "APP_ENV": "bench",
+        "DEEPSEEK_API_KEY": "standin",
+        "DEEPSEEK_BASE_URL": standin_url + "/v1",
+        "DEEPSEEK_MODEL": "standin",
+        "EMBEDDINGS_PROVIDER": "openai",
+        "OPENAI_API_KEY": "standin",
+        "OPENAI_BASE_URL": standin_url + "/v1",
+        "OPENAI_EMBEDDING_MODEL": "standin",
+        "EMBED_WARMUP": "false",
+        "VISION_PROVIDER": "openai_compat",
+        "VISION_BASE_URL": standin_url + "/v1",
+        "VISION_API_KEY": "standin",
+        "VISION_MODEL": "standin",
+        "INGEST_WORKERS": str(args.ingest_workers),
+        "INGEST_PER_KB": str(args.ingest_workers),
+    })
+    if not args.caches:
+        env.update({"ANSWER_CACHE_ENABLED": "false", "VISION_CACHE_ENABLED": "false", "EMBED_CACHE_ENABLED": "false"})
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    _wait_ready(url + "/api/health", proc)
+    return proc, url
+
+def _png(seed: int, size: int = 256) -> bytes:
+    from PIL import Image
+    img = Image.new("RGB", (size, size), ((seed * 37) % 256, (seed * 91) % 256, (seed * 13) % 256))
+    img.putpixel((seed % size, (seed // size) % size), (255, 255, 255))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def _text_doc(seed: int, chunks: int) -> bytes:
+    return "\n\n".join(synthetic_chunks(chunks, size=600, seed=seed)).encode("utf-8")
+
+async def _wait_job(client: httpx.AsyncClient, kb_id: str, job_id: str, poll_s: float = 0.05) -> bool:
+    while True:
+        r = await client.get(f"/api/kbs/{kb_id}/jobs/{job_id}")
+        status = r.json()["data"]["status"]
+        if status in ("done", "failed"):
+            return status == "done"
+        await asyncio.sleep(poll_s)
+
+async def chat_once(client: httpx.AsyncClient, kb_id: str, i: int, args) -> dict:
+    # a distinct question per request, so no two requests share an answer-cache key
+    body = {"kb_id": kb_id, "message": f"问题 {i}: 文档里关于 index {i % 97} 和 latency 说了什么？", "mode": args.mode}
+    t0 = time.perf_counter()
+    ttft = None
+    ok = False
+    async with client.stream("POST", "/api/chat/stream", json=body) as r:
+        if r.status_code == 200:
+            async for line in r.aiter_lines():
+                if ttft is None and line == "event: delta":
+                    ttft = time.perf_counter() - t0
+                elif line == "event: final":
+                    ok = True
+    return {"ok": ok and ttft is not None, "latency": time.perf_counter() - t0, "ttft": ttft}
+
+async def upload_once(client: httpx.AsyncClient, kb_id: str, i: int, args) -> dict:
+    files = {"file": (f"load-{i}.txt", _text_doc(10_000 + i, args.upload_chunks), "text/plain")}
+    t0 = time.perf_counter()
+    r = await client.post(f"/api/kbs/{kb_id}/upload", files=files)
+    submit = time.perf_counter() - t0
+    if r.status_code != 200:
+        return {"ok": False, "latency": submit, "submit": submit}
+    done = await _wait_job(client, kb_id, r.json()["data"]["job_id"])
+    return {"ok": done, "latency": time.perf_counter() - t0, "submit": submit}
+
+async def vision_once(client: httpx.AsyncClient, kb_id: str, i: int, args) -> dict:
+    files = {"image": (f"img-{i}.png", _png(i), "image/png")}
+    t0 = time.perf_counter()
+    r = await client.post("/api/vision/analyze", files=files, data={"prompt": "describe"})
+    return {"ok": r.status_code == 200 and r.json().get("ok"), "latency": time.perf_counter() - t0}
+
+SCENARIOS = {"chat": chat_once, "upload": upload_once, "vision": vision_once}
+
+async def run_level(client: httpx.AsyncClient, kb_id: str, fn, concurrency: int, total: int, args, offset: int):
+    counter = iter(range(total))
+    samples: list[dict] = []
+
+    async def worker():
+        for i in counter:
+            try:
+                samples.append(await fn(client, kb_id, offset + i, args))
+            except httpx.HTTPError as e:
+                samples.append({"ok": False, "latency": None, "error": type(e).__name__})
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    good = [s for s in samples if s["ok"]]
+    out = {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(good),
+        "throughput_rps": round(len(good) / wall, 2),
+        "latency": percentiles([s["latency"] * 1000 for s in good]),
+    }
+    if any("ttft" in s for s in good):
+        out["ttft"] = percentiles([s["ttft"] * 1000 for s in good if s.get("ttft") is not None])
+    if any("submit" in s for s in good):
+        out["submit"] = percentiles([s["submit"] * 1000 for s in good])
+    return out
+
+async def drive(app_url: str, args) -> dict:
+    levels = [int(x) for x in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels) + 8, max_keepalive_connections=max(levels) + 8)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout_s, limits=limits) as client:
+        kb_id = (await client.post("/api/kbs", json={"name": "load-test"})).json()["data"]["kb_id"]
+        # seed the KB so chat retrieval has something to search
+        for d in range(args.seed_docs):
+            files = {"file": (f"seed-{d}.txt", _text_doc(d, args.upload_chunks), "text/plain")}
+            job = (await client.post(f"/api/kbs/{kb_id}/upload", files=files)).json()["data"]
+            await _wait_job(client, kb_id, job["job_id"])
+
+        results = {}
+        offset = 0
+        for name in args.scenarios.split(","):
+            runs = []
+            for c in levels:
+                total = max(args.requests, c)
+                runs.append(await run_level(client, kb_id, SCENARIOS[name], c, total, args, offset))
+                offset += total
+                print(f"{name} c={c} done", file=sys.stderr, flush=True)
+            results[name] = runs
+        return results
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default="chat,upload,vision")
+    ap.add_argument("--concurrency", default="1,8,32,64")
+    ap.add_argument("--requests", type=int, default=100, help="requests per level (at least the concurrency)")
+    ap.add_argument("--mode", default="hybrid", help="retrieval mode for chat")
+    ap.add_argument("--seed-docs", type=int, default=5)
+    ap.add_argument("--upload-chunks", type=int, default=40, help="~600-char paragraphs per uploaded document")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--ingest-workers", type=int, default=2)
+    ap.add_argument("--caches", action="store_true", help="leave answer/vision/embedding caches on")
+    ap.add_argument("--timeout-s", type=float, default=300.0)
+    ap.add_argument("--app-url", default=None, help="load an already running app instead of starting one")
+    ap.add_argument("--ttft-ms", type=float, default=300.0)
+    ap.add_argument("--tokens-per-s", type=float, default=50.0)
+    ap.add_argument("--answer-tokens", type=int, default=60)
+    ap.add_argument("--embed-latency-ms", type=float, default=50.0)
+    ap.add_argument("--vision-latency-ms", type=float, default=800.0)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    procs = []
+    try:
+        standin_url = None
+        if args.app_url:
+            app_url = args.app_url.rstrip("/")
+        else:
+            standin, standin_url = start_standin(args)
+            procs.append(standin)
+            app, app_url = start_app(args, standin_url)
+            procs.append(app)
+        results = asyncio.run(drive(app_url, args))
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "scenarios": results,
+        }
+        if standin_url:
+            report["standin"] = httpx.get(standin_url + "/stats").json()["counters"]
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
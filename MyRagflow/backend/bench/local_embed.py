@@ -0,0 +1,61 @@
+"""Local (fastembed) embedding throughput across batch size, thread and worker settings.
+
+Needs fastembed and the model files (downloaded on first use). Reports the cold
+model load + first call, then texts/s for every combination, CPU only.
+
+    python -m bench.local_embed --texts 4000 --batch-sizes 32,256 --threads 0,1,4 --parallel 1,0
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import os
+
+from bench.common import Timer, synthetic_chunks
+from rag.embeddings import Embeddings, EmbeddingsConfig
+
+def make(model: str, batch_size: int, threads: int, parallel: int) -> Embeddings:
+    return Embeddings(EmbeddingsConfig(
+        provider="local", openai_api_key=None, openai_model="", local_model=model,
+        local_batch_size=batch_size, local_threads=threads or None,
+        local_parallel=None if parallel == 1 else parallel, local_parallel_min=0,
+    ))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    ap.add_argument("--texts", type=int, default=4000)
+    ap.add_argument("--chars", type=int, default=600)
+    ap.add_argument("--batch-sizes", default="32,128,256")
+    ap.add_argument("--threads", default="0,1,4")
+    ap.add_argument("--parallel", default="1,0")
+    args = ap.parse_args()
+    texts = synthetic_chunks(args.texts, size=args.chars)
+    ints = lambda s: [int(x) for x in s.split(",")]  # noqa: E731
+
+    cold = make(args.model, 256, 0, 1)
+    with Timer() as load:
+        cold.warmup()
+    with Timer() as first:
+        cold.embed_texts([texts[0]])
+
+    runs = []
+    for bs, th, par in itertools.product(ints(args.batch_sizes), ints(args.threads), ints(args.parallel)):
+        emb = make(args.model, bs, th, par)
+        emb.warmup()
+        with Timer() as t:
+            emb.embed_texts(texts)
+        runs.append({"batch_size": bs, "threads": th or "default", "parallel": "off" if par == 1 else (par or "all"),
+                     "texts_per_s": round(len(texts) / t.seconds, 1)})
+    runs.sort(key=lambda r: -r["texts_per_s"])
+    print(json.dumps({
+        "model": args.model,
+        "cpus": os.cpu_count(),
+        "texts": args.texts,
+        "cold_load_s": round(load.seconds, 2),
+        "first_call_after_warmup_ms": round(first.seconds * 1000, 1),
+        "runs": runs,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
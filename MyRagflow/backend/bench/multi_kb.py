@@ -0,0 +1,62 @@
+"""Latency of one query over a growing number of KBs: retrieve_multi vs. a per-KB loop.
+
+"loop" is what a client had to do before: call retrieve once per KB (one
+embedding round trip each, sequentially) and merge the lists itself.
+"multi" embeds once, searches the KBs in parallel and hydrates once per KB.
+The fake provider sleeps --embed-latency-ms per call.
+
+    python -m bench.multi_kb --kbs 1,2,4,8,16 --chunks 20000 --queries 100
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+
+from bench.common import use_temp_data_dir, FakeEmbeddings, percentiles, synthetic_chunks
+
+use_temp_data_dir()
+
+from rag.store import create_kb  # noqa: E402
+from rag.ingest import write_document  # noqa: E402
+from rag.query import retrieve, retrieve_multi  # noqa: E402
+
+def loop(kb_ids: list[str], query: str, emb, top_k: int, mode: str):
+    hits = [h for kb in kb_ids for h in retrieve(kb, query, emb, top_k, mode)]
+    return sorted(hits, key=lambda h: -h["score"])[:top_k]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--kbs", default="1,2,4,8,16")
+    ap.add_argument("--chunks", type=int, default=20000, help="chunks per KB")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--mode", default="dense")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--embed-latency-ms", type=float, default=40.0)
+    args = ap.parse_args()
+
+    levels = [int(x) for x in args.kbs.split(",")]
+    writer = FakeEmbeddings(dim=args.dim)
+    kb_ids = []
+    for i in range(max(levels)):
+        kb = create_kb(f"kb-{i}").kb_id
+        chunks = synthetic_chunks(args.chunks, size=200, seed=i * 1_000_003)
+        write_document(kb, f"doc-{i}.txt", "text/plain", 0, chunks, writer.embed_texts(chunks))
+        kb_ids.append(kb)
+
+    emb = FakeEmbeddings(dim=args.dim, latency_ms=args.embed_latency_ms)
+    queries = [f"chunk {i} 查询 latency" for i in range(args.queries)]
+    runs = []
+    for n in levels:
+        for name, fn in (("loop", loop), ("multi", lambda *a: retrieve_multi(*a)[0])):
+            lat = []
+            for q in queries:
+                t0 = time.perf_counter()
+                fn(kb_ids[:n], q, emb, args.top_k, args.mode)
+                lat.append((time.perf_counter() - t0) * 1000)
+            runs.append({"kbs": n, "path": name, **percentiles(lat)})
+    print(json.dumps({"chunks_per_kb": args.chunks, "mode": args.mode,
+                      "embed_latency_ms": args.embed_latency_ms, "runs": runs}, indent=2))
+
+if __name__ == "__main__":
+    main()
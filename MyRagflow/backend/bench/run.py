@@ -0,0 +1,220 @@
+"""Component benchmark suite for the ingest, index and retrieval hot paths.
+
+Per corpus size (1k to 1M chunks) it measures, with deterministic fake
+embeddings and a fresh temp DATA_DIR:
+
+  chunk      split_segments / chunk_text throughput on a document of that size
+  insert     insert_documents (chunks + FTS rows), chunks/s
+  index_add  index_add in ingest-sized batches, vectors/s, and the index kind reached
+  save/load  save_index and load_index from disk (best of 3)
+  search     single-query search latency percentiles
+  hydrate    fetch_chunks_by_ord latency percentiles for top-k hits
+  retrieve   end-to-end dense retrieve (embed + search + hydrate) percentiles
+
+Results are written as JSON; with --baseline the run is compared metric by
+metric against a previous output and regressions beyond --tolerance are
+listed (exit status 1 with --fail-on-regression); latency changes under
+--min-delta-ms are treated as noise.
+
+    python -m bench.run --sizes 1000,10000,100000 --out bench-results.json
+    python -m bench.run --sizes 1000,10000 --baseline bench-results.json --fail-on-regression
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+from bench.common import use_temp_data_dir, FakeEmbeddings, percentiles, synthetic_chunks, Timer
+
+use_temp_data_dir()
+
+from rag.store import NewDoc, create_kb, fetch_chunks_by_ord, insert_documents  # noqa: E402
+from rag.index import (  # noqa: E402
+    _kind_of, get_index, index_add, invalidate_index, load_index, save_index, search, set_index_config,
+)
+from rag.query import retrieve  # noqa: E402
+from utils.text_splitter import chunk_text  # noqa: E402
+
+DOC_CHUNKS = 1000  # chunks per synthetic document
+
+def corpus(n: int, chars: int, seed: int = 0):
+    """Yield (doc_no, chunks) for n chunks split into documents of DOC_CHUNKS."""
+    for start in range(0, n, DOC_CHUNKS):
+        texts = synthetic_chunks(min(DOC_CHUNKS, n - start), size=chars, seed=seed + start)
+        yield start // DOC_CHUNKS, [f"{start + i} {t}" for i, t in enumerate(texts)]
+
+def bench_chunking(n: int, chars: int, chunk_size: int, overlap: int) -> dict:
+    # one document as long as the corpus, capped so 1M-chunk runs stay in memory
+    paras = synthetic_chunks(min(n, 20_000), size=chars, seed=1)
+    text = "\n\n".join(paras)
+    best = float("inf")
+    for _ in range(3):
+        with Timer() as t:
+            out = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
+        best = min(best, t.seconds)
+    return {"mb": round(len(text) / 1e6, 2), "chunks": len(out),
+            "mb_per_s": round(len(text) / 1e6 / best, 2), "chunks_per_s": round(len(out) / best, 1)}
+
+def bench_size(n: int, args, emb: FakeEmbeddings, rng: np.random.Generator) -> dict:
+    kb = create_kb(f"bench-{n}").kb_id
+    if args.index_kind != "auto":
+        set_index_config(kb, args.index_kind)
+
+    insert_s = add_s = 0.0
+    batch_texts: list[str] = []
+    batch_ords: list[int] = []
+
+    def flush():
+        nonlocal add_s
+        vecs = emb.embed_texts(batch_texts)
+        t0 = time.perf_counter()
+        index_add(kb, vecs, batch_ords)
+        add_s += time.perf_counter() - t0
+        batch_texts.clear()
+        batch_ords.clear()
+
+    for doc_no, chunks in corpus(n, args.chars):
+        t0 = time.perf_counter()
+        with insert_documents(kb, [NewDoc(f"doc-{doc_no}.txt", "text/plain", 0, chunks)]) as written:
+            pass
+        insert_s += time.perf_counter() - t0
+        batch_texts.extend(chunks)
+        batch_ords.extend(written[0][1])
+        if len(batch_texts) >= args.add_batch:
+            flush()
+    if batch_texts:
+        flush()
+
+    idx = get_index(kb)
+    kind = _kind_of(idx)
+    save_s = load_s = float("inf")
+    for _ in range(3):  # single-shot timings: keep the best of a few
+        with Timer() as t:
+            save_index(kb, idx)
+        save_s = min(save_s, t.seconds)
+        with Timer() as t:
+            load_index(kb)
+        load_s = min(load_s, t.seconds)
+    invalidate_index(kb)
+    get_index(kb)  # warm the cache for the query phase
+
+    qvecs = rng.standard_normal((args.queries, emb.dim), dtype=np.float32)
+    search_ms, hydrate_ms, hits = [], [], []
+    for q in qvecs:
+        t0 = time.perf_counter()
+        _, ords = search(kb, q[None, :], args.top_k)
+        search_ms.append((time.perf_counter() - t0) * 1000)
+        hits.append([o for o in ords if o >= 0])
+    for ords in hits:
+        t0 = time.perf_counter()
+        fetch_chunks_by_ord(kb, ords)
+        hydrate_ms.append((time.perf_counter() - t0) * 1000)
+
+    queries = [f"{int(i)} index chunk" for i in rng.integers(0, n, args.queries)]
+    retrieve_ms = []
+    for query in queries:
+        t0 = time.perf_counter()
+        retrieve(kb, query, emb, args.top_k)
+        retrieve_ms.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "index_kind": kind,
+        "insert_chunks_per_s": round(n / insert_s, 1),
+        "index_add_vectors_per_s": round(n / add_s, 1),
+        "index_save_ms": round(save_s * 1000, 2),
+        "index_load_ms": round(load_s * 1000, 2),
+        "search": percentiles(search_ms),
+        "hydrate": percentiles(hydrate_ms),
+        "retrieve": percentiles(retrieve_ms),
+    }
+
+def _flatten(d: dict, prefix: str = "") -> dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = float(v)
+    return out
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 0.0) -> list[dict]:
+    """Per-metric change vs. the baseline; `*_per_s` is higher-is-better, everything else lower-is-better.
+
+    Latencies that moved by less than `min_delta_ms` are never flagged: sub-ms
+    timings jitter by more than any sensible tolerance.
+    """
+    cur, base = _flatten(results["sizes"]), _flatten(baseline.get("sizes", {}))
+    rows = []
+    for key in sorted(cur.keys() & base.keys()):
+        old, new = base[key], cur[key]
+        if not old or key.endswith((".mb", ".chunks")):
+            continue
+        change = (new - old) / old
+        worse = -change if key.endswith("_per_s") else change
+        noise = key.endswith("_ms") and abs(new - old) < min_delta_ms
+        rows.append({"metric": key, "baseline": old, "current": new, "change": round(change, 4),
+                     "regression": worse > tolerance and not noise})
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000", help="corpus sizes in chunks, e.g. 1000,...,1000000")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--chars", type=int, default=400, help="characters per synthetic chunk")
+    ap.add_argument("--chunk-size", type=int, default=900)
+    ap.add_argument("--overlap", type=int, default=120)
+    ap.add_argument("--add-batch", type=int, default=10_000, help="vectors per index_add call")
+    ap.add_argument("--index-kind", default="auto", help="auto|flat|hnsw|ivf|ivfpq")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--out", default=None, help="write the JSON results here (stdout otherwise)")
+    ap.add_argument("--baseline", default=None, help="previous --out file to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    ap.add_argument("--min-delta-ms", type=float, default=0.25, help="ignore latency changes smaller than this")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    emb = FakeEmbeddings(dim=args.dim)
+    rng = np.random.default_rng(0)
+    sizes = {}
+    for n in (int(x) for x in args.sizes.split(",")):
+        res = {"chunk": bench_chunking(n, args.chars, args.chunk_size, args.overlap)}
+        res.update(bench_size(n, args, emb, rng))
+        sizes[str(n)] = res
+        print(f"{n} chunks done", file=sys.stderr, flush=True)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created_at": int(time.time()),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "fail_on_regression")},
+        },
+        "sizes": sizes,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            rows = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        results["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance, "metrics": rows}
+        regressions = [r for r in rows if r["regression"]]
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    for r in regressions:
+        print(f"REGRESSION {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})", file=sys.stderr)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Text splitter time and peak memory: the previous chunk_text vs. the streaming splitter.
+
+Inputs are multi-MB documents; "dense-paragraphs" has a blank line every few
+dozen chars, where the old soft cut could land at the chunk start and, with a
+large overlap, step backwards (it is stopped after --max-chunks).
+
+    python -m bench.splitter --mb 4 --chunk-size 900 --overlap 120
+"""
+from __future__ import annotations
+import argparse
+import json
+import tracemalloc
+
+from bench.common import Timer, synthetic_chunks
+from utils.text_splitter import estimate_tokens, split_segments
+
+def legacy_chunk_text(text: str, chunk_size: int, overlap: int, max_chunks: int) -> tuple[list[str], bool]:
+    """The splitter before the rewrite, with a chunk cap so non-terminating inputs can be reported."""
+    text = (text or "").replace("\r\n", "\n").strip()
+    chunk_size = max(200, int(chunk_size))
+    overlap = max(0, min(int(overlap), chunk_size - 1))
+    chunks: list[str] = []
+    start, n = 0, len(text)
+    while start < n:
+        if len(chunks) >= max_chunks:
+            return chunks, False
+        end = min(n, start + chunk_size)
+        if end < n:
+            window = 220
+            cut = text.rfind("\n\n", start, end)
+            if cut != -1 and end - cut < window:
+                end = cut
+            else:
+                cut = text.rfind(". ", start, end)
+                if cut != -1 and end - cut < window:
+                    end = cut + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= n:
+            break
+        start = max(0, end - overlap)
+    return chunks, True
+
+def corpus(kind: str, mb: float) -> str:
+    target = int(mb * 1024 * 1024)
+    if kind == "prose":
+        paras = synthetic_chunks(max(1, target // 600), size=600)
+        return "\n\n".join(p.replace(" page", ". page") for p in paras)[:target]
+    if kind == "dense-paragraphs":
+        return ("short line of text\n\n" * (target // 20 + 1))[:target]
+    if kind == "no-boundaries":
+        return ("x" * target)
+    raise ValueError(kind)
+
+def measure(fn) -> tuple[object, float, float]:
+    # timed without tracing (tracemalloc slows allocation-heavy code), then re-run for the peak
+    with Timer() as t:
+        out = fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, t.seconds, peak / 1024 / 1024
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=4.0)
+    ap.add_argument("--chunk-size", type=int, default=900)
+    ap.add_argument("--overlap", type=int, default=120)
+    ap.add_argument("--max-chunks", type=int, default=200_000)
+    ap.add_argument("--corpora", default="prose,dense-paragraphs,no-boundaries")
+    args = ap.parse_args()
+
+    runs = []
+    for kind in args.corpora.split(","):
+        text = corpus(kind, args.mb)
+        for overlap in (args.overlap, args.chunk_size - 1):
+            (old, finished), old_s, old_mb = measure(
+                lambda: legacy_chunk_text(text, args.chunk_size, overlap, args.max_chunks))
+            new, new_s, new_mb = measure(
+                lambda: sum(1 for _ in split_segments([text], args.chunk_size, overlap, len)))
+            est, est_s, _ = measure(
+                lambda: sum(1 for _ in split_segments([text], args.chunk_size // 4, overlap // 4, estimate_tokens)))
+            runs.append({
+                "corpus": kind, "overlap": overlap,
+                "legacy": {"chunks": len(old), "terminated": finished, "s": round(old_s, 3),
+                           "peak_mb": round(old_mb, 1)},
+                "streaming": {"chunks": new, "s": round(new_s, 3), "peak_mb": round(new_mb, 1)},
+                "streaming_estimate_tokens": {"chunks": est, "s": round(est_s, 3)},
+            })
+    print(json.dumps({"mb": args.mb, "chunk_size": args.chunk_size, "runs": runs}, indent=2))
+
+if __name__ == "__main__":
+    main()
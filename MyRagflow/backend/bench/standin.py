@@ -0,0 +1,198 @@
+"""Local stand-in for the OpenAI-compatible and Ollama endpoints the app calls.
+
+Serves /v1/embeddings, /v1/chat/completions (streaming or not, text or vision)
+and Ollama's /api/chat with configurable latency, token rate and rate limiting,
+so ingest, chat and vision can be benchmarked offline. Embeddings are
+deterministic per text.
+
+    python -m bench.standin --port 9100 --embed-latency-ms 80 --ttft-ms 400 --tokens-per-s 40
+
+or in-process: `server, url = start_standin(StandinConfig(...))`.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+@dataclass
+class StandinConfig:
+    dim: int = 256
+    embed_latency_ms: float = 50.0     # per request
+    embed_ms_per_1k_tokens: float = 5.0
+    ttft_ms: float = 300.0             # chat: time to first token
+    tokens_per_s: float = 50.0         # chat: streaming rate after the first token
+    answer_tokens: int = 60
+    vision_latency_ms: float = 800.0   # extra latency when the request carries an image
+    rate_limit_rps: float = 0.0        # requests/s before 429s (0 = unlimited)
+
+class _Bucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        """0 if allowed, otherwise seconds until a token is available."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.t) * self.rate)
+            self.t = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+def _vector(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim, dtype=np.float32)
+    return np.round(v / np.linalg.norm(v), 5).tolist()
+
+def _has_image(messages: list[dict]) -> bool:
+    for m in messages:
+        if m.get("images"):
+            return True
+        c = m.get("content")
+        if isinstance(c, list) and any(p.get("type") == "image_url" for p in c if isinstance(p, dict)):
+            return True
+    return False
+
+def make_handler(cfg: StandinConfig, counters: dict):
+    bucket = _Bucket(cfg.rate_limit_rps)
+    lock = threading.Lock()
+
+    def count(key: str):
+        with lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with lock:
+                    self._json(200, {"config": asdict(cfg), "counters": dict(counters)})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            wait = bucket.take()
+            if wait:
+                count("rate_limited")
+                return self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                  {"Retry-After": f"{wait:.3f}"})
+            try:
+                if self.path.endswith("/embeddings"):
+                    self._embeddings(body)
+                elif self.path.endswith("/chat/completions"):
+                    self._chat(body)
+                elif self.path.rstrip("/") == "/api/chat":
+                    self._ollama(body)
+                else:
+                    self._json(404, {"error": "not found"})
+            except (BrokenPipeError, ConnectionResetError):
+                count("disconnects")
+
+        def _embeddings(self, body: dict):
+            count("embeddings")
+            texts = body.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            tokens = sum(len(t) // 4 + 1 for t in texts)
+            time.sleep((cfg.embed_latency_ms + cfg.embed_ms_per_1k_tokens * tokens / 1000) / 1000)
+            self._json(200, {
+                "object": "list",
+                "model": body.get("model", "standin"),
+                "data": [{"object": "embedding", "index": i, "embedding": _vector(t, cfg.dim)}
+                         for i, t in enumerate(texts)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def _answer_tokens(self) -> list[str]:
+            return [f"tok{i} " for i in range(cfg.answer_tokens)]
+
+        def _chat(self, body: dict):
+            vision = _has_image(body.get("messages") or [])
+            count("vision" if vision else "chat")
+            first = (cfg.ttft_ms + (cfg.vision_latency_ms if vision else 0.0)) / 1000
+            step = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0
+            tokens = self._answer_tokens()
+            model = body.get("model", "standin")
+            if not body.get("stream"):
+                time.sleep(first + step * len(tokens))
+                return self._json(200, {
+                    "id": "standin", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens)}}],
+                })
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(first)
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(step)
+                ev = {"id": "standin", "object": "chat.completion.chunk", "created": 0, "model": model,
+                      "choices": [{"index": 0, "delta": {"content": tok}, "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(ev)}\n\n".encode())
+            self._chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _ollama(self, body: dict):
+            count("vision" if _has_image(body.get("messages") or []) else "chat")
+            tokens = self._answer_tokens()
+            step = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0
+            time.sleep((cfg.ttft_ms + cfg.vision_latency_ms) / 1000 + step * len(tokens))
+            self._json(200, {"model": body.get("model"), "done": True,
+                             "message": {"role": "assistant", "content": "".join(tokens)}})
+
+    return Handler
+
+def start_standin(cfg: StandinConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+    """Serve in a daemon thread; returns (server, base_url). Stop with server.shutdown()."""
+    cfg = cfg or StandinConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(cfg, {}))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    for name, field in StandinConfig.__dataclass_fields__.items():
+        ap.add_argument("--" + name.replace("_", "-"), type=type(field.default), default=field.default)
+    args = ap.parse_args()
+    cfg = StandinConfig(**{k: getattr(args, k) for k in StandinConfig.__dataclass_fields__})
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(cfg, {}))
+    print(f"stand-in listening on http://{args.host}:{args.port} (OpenAI base_url: .../v1)", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
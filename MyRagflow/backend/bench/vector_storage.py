@@ -0,0 +1,86 @@
+"""Recall and latency of compressed vector storage vs. the float32 index.
+
+For each storage type (float32, float16, sq8) one KB is built from the same
+clustered synthetic vectors (so nearest neighbours are meaningful, unlike pure
+noise). Each KB is then queried with rescoring off and at every --rescore
+factor. Recall@k is measured against an exact float32 scan. Sizes are the
+index file, the bytes per vector code and the float32 copy kept for rescoring.
+
+    python -m bench.vector_storage --vectors 200000 --dim 1536 --kind flat --rescore 2,4
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+import numpy as np
+
+from bench.common import use_temp_data_dir, percentiles
+
+use_temp_data_dir()
+
+from rag.store import create_kb, set_kv, vectors_path  # noqa: E402
+from rag.index import (  # noqa: E402
+    STORAGE_TYPES, _index_policy, _normalize, get_index_config, index_add, search_batch, set_index_config,
+)
+
+def clustered(n: int, dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 200), dim), dtype=np.float32)
+    return centers[rng.integers(0, len(centers), n)] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+
+def run(kb: str, queries: np.ndarray, truth: np.ndarray, top_k: int) -> dict:
+    search_batch(kb, queries[:5], top_k)  # load the index outside the timed loop
+    lat, hits = [], 0
+    for q, t in zip(queries, truth):
+        t0 = time.perf_counter()
+        _, ords = search_batch(kb, q[None, :], top_k)
+        lat.append((time.perf_counter() - t0) * 1000)
+        hits += len(set(ords[0][:top_k]) & set(t.tolist()))
+    return {"recall": round(hits / (len(queries) * top_k), 4), **percentiles(lat)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--kind", default="flat", help="flat|hnsw|ivf")
+    ap.add_argument("--rescore", default="2,4", help="shortlist factors to try besides 0 (off)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=10)
+    args = ap.parse_args()
+
+    # queries are held-out points from the same clusters
+    data = _normalize(clustered(args.vectors + args.queries, args.dim, seed=0))
+    vecs, queries = data[:args.vectors], data[args.vectors:]
+    truth = np.argsort(-(queries @ vecs.T), axis=1)[:, :args.top_k]
+    factors = [0] + [int(x) for x in args.rescore.split(",") if x]
+
+    results = []
+    for storage in STORAGE_TYPES:
+        kb = create_kb(f"storage-{storage}").kb_id
+        rescore = max(factors) if storage != "float32" else 0  # float32 needs no exact copy
+        set_index_config(kb, args.kind, {"storage": storage, "rescore": rescore})
+        t0 = time.perf_counter()
+        for start in range(0, args.vectors, 20_000):
+            end = min(start + 20_000, args.vectors)
+            index_add(kb, vecs[start:end], list(range(start, end)))
+        build_s = time.perf_counter() - t0
+        cfg = get_index_config(kb)
+        params = _index_policy(kb)[1]
+        for factor in factors if storage != "float32" else [0]:
+            # rescore is read at search time: switch it without rebuilding the index
+            set_kv(kb, "index_params", json.dumps({**params, "rescore": factor}))
+            results.append({
+                "storage": cfg["storage"], "rescore": factor, "kind": cfg["active"],
+                "bytes_per_vector": cfg["bytes_per_vector"],
+                "index_mb": round(cfg["index_bytes"] / 2**20, 1),
+                "float32_copy_mb": round(vectors_path(kb).stat().st_size / 2**20, 1)
+                if cfg["float32_copy"] else 0.0,
+                "build_s": round(build_s, 2),
+                **run(kb, queries, truth, args.top_k),
+            })
+            print(f"{storage} rescore={factor} done", file=sys.stderr, flush=True)
+    print(json.dumps({"vectors": args.vectors, "dim": args.dim, "top_k": args.top_k, "runs": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
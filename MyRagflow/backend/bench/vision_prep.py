@@ -0,0 +1,86 @@
+"""Payload size and latency of vision calls with and without image preprocessing.
+
+Synthetic phone-sized photos are sent to a fake provider whose latency is a fixed
+model time plus upload time of the base64 body at --uplink-mbps. The second pass
+over the same images shows the result cache.
+
+    python -m bench.vision_prep --images 10 --size 4032x3024 --uplink-mbps 20
+"""
+from __future__ import annotations
+import argparse
+import base64
+import io
+import json
+import time
+import numpy as np
+from PIL import Image
+
+from bench.common import use_temp_data_dir, Timer
+
+use_temp_data_dir()
+
+from llm.image_prep import ImagePrepConfig  # noqa: E402
+from llm.vision_cache import VisionCache  # noqa: E402
+from llm.vision_pipeline import VisionPipeline  # noqa: E402
+from rag.store import DATA_DIR  # noqa: E402
+
+class FakeVision:
+    def __init__(self, model_ms: float, uplink_mbps: float):
+        self.model = "fake-vision"
+        self.model_ms = model_ms
+        self.uplink = uplink_mbps * 1e6 / 8
+        self.body_bytes = 0
+
+    def analyze(self, image_bytes: bytes, prompt: str, mime: str | None = None) -> str:
+        body = len(base64.b64encode(image_bytes))
+        self.body_bytes += body
+        time.sleep(self.model_ms / 1000 + body / self.uplink)
+        return f"{len(image_bytes)} bytes"
+
+def synthetic_photo(w: int, h: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    # smooth gradients plus sensor-like noise, saved the way phones do (q=95)
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([(x * 255 / w), (y * 255 / h), ((x + y) * 127 / (w + h))], axis=-1)
+    px = np.clip(base + rng.normal(0, 12, size=base.shape), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(px).save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=10)
+    ap.add_argument("--size", default="4032x3024")
+    ap.add_argument("--max-edge", type=int, default=1568)
+    ap.add_argument("--model-ms", type=float, default=800.0)
+    ap.add_argument("--uplink-mbps", type=float, default=20.0)
+    args = ap.parse_args()
+    w, h = (int(v) for v in args.size.split("x"))
+    images = [synthetic_photo(w, h, i) for i in range(args.images)]
+
+    raw = FakeVision(args.model_ms, args.uplink_mbps)
+    with Timer() as t_raw:
+        for b in images:
+            raw.analyze(b, "describe")
+
+    client = FakeVision(args.model_ms, args.uplink_mbps)
+    pipe = VisionPipeline(VisionCache(DATA_DIR / "vision_cache.sqlite", 10000), ImagePrepConfig(max_edge=args.max_edge))
+    with Timer() as t_prep:
+        for b in images:
+            pipe.analyze("fake", client, b, "describe")
+    with Timer() as t_cached:
+        for b in images:
+            pipe.analyze("fake", client, b, "describe")
+
+    stats = pipe.stats()
+    print(json.dumps({
+        "images": args.images,
+        "size": args.size,
+        "raw": {"body_bytes": raw.body_bytes, "avg_ms": t_raw.seconds * 1000 / args.images},
+        "prepared": {"body_bytes": client.body_bytes, "avg_ms": t_prep.seconds * 1000 / args.images,
+                     "avg_prep_ms": stats["avg_prep_ms"], "payload_ratio": stats["payload_ratio"]},
+        "cached": {"avg_ms": t_cached.seconds * 1000 / args.images, "hit_rate": stats["cache"]["hit_rate"]},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Command-line tools that run without the HTTP server.
+
+    python cli.py ingest-dir <kb_id> <directory> [--chunk-size 900] [--overlap 120]
+    python cli.py ingest-dir --create "My KB" <directory>
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from settings import settings, make_embeddings
+from rag.store import init_storage, create_kb, kb_exists
+from rag.bulk import ingest_many, iter_files, walk_dir
+
+def cmd_ingest_dir(args) -> int:
+    init_storage()
+    if args.create:
+        kb_id = create_kb(args.create).kb_id
+        print(f"created KB {kb_id}", file=sys.stderr)
+    else:
+        kb_id = args.kb_id
+        if not kb_id or not kb_exists(kb_id):
+            print(f"KB not found: {kb_id}", file=sys.stderr)
+            return 2
+    root = Path(args.directory)
+    # the CLI has no vision client, so images (which are ingested as captions) are left out
+    paths = walk_dir(root, images=False)
+    print(f"{len(paths)} files under {root} (images skipped)", file=sys.stderr)
+
+    t0 = time.time()
+    done = 0
+
+    def on_doc(name: str, err: str | None):
+        nonlocal done
+        done += 1
+        if err:
+            print(f"  failed: {name}: {err}", file=sys.stderr)
+        elif done % 100 == 0:
+            print(f"  {done} docs ({done / (time.time() - t0):.1f}/s)", file=sys.stderr)
+
+    res = ingest_many(
+        kb_id,
+        iter_files(paths, settings.MAX_BULK_UPLOAD_MB * 1024 * 1024, images=False),
+        make_embeddings(settings),
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        on_doc=on_doc,
+    )
+    res["kb_id"] = kb_id
+    res["seconds"] = round(time.time() - t0, 2)
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 1 if res["failed"] and not res["docs"] else 0
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="cli.py")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ingest-dir", help="bulk-ingest every supported file (and zip/tar) under a directory")
+    p.add_argument("kb_id", nargs="?")
+    p.add_argument("directory")
+    p.add_argument("--create", metavar="NAME", help="create a new KB with this name instead of using kb_id")
+    p.add_argument("--chunk-size", type=int, default=settings.DEFAULT_CHUNK_SIZE)
+    p.add_argument("--overlap", type=int, default=settings.DEFAULT_CHUNK_OVERLAP)
+    p.set_defaults(func=cmd_ingest_dir)
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
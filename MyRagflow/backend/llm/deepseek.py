@@ -1,40 +1,61 @@
 from __future__ import annotations
+import asyncio
 from dataclasses import dataclass
-from typing import Generator
-from openai import OpenAI
+from typing import AsyncGenerator
+import httpx
+from openai import AsyncOpenAI
 
 @dataclass
 class DeepSeekConfig:
     api_key: str
     base_url: str
     model: str
+    max_concurrency: int = 64     # completions in flight; further chats wait for a slot
+    max_connections: int = 100
+    max_keepalive: int = 32
+    timeout_s: float = 120.0
 
 class DeepSeek:
     def __init__(self, cfg: DeepSeekConfig):
         base = (cfg.base_url or "").rstrip("/")
         # If user passes https://api.deepseek.com, OpenAI client appends /v1 automatically? It doesn't.
         # So we accept both; OpenAI client works if base_url already includes /v1; otherwise it also works for some providers.
-        self.client = OpenAI(api_key=cfg.api_key, base_url=base)
+        # One pooled keep-alive HTTP client is shared by every chat request.
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=cfg.max_connections,
+                                max_keepalive_connections=cfg.max_keepalive),
+            timeout=httpx.Timeout(cfg.timeout_s, connect=10.0),
+        )
+        self.client = AsyncOpenAI(api_key=cfg.api_key, base_url=base, http_client=self.http)
         self.model = cfg.model
+        self._slots = asyncio.Semaphore(max(1, cfg.max_concurrency))
 
-    def stream(self, messages: list[dict], temperature: float = 0.2) -> Generator[str, None, None]:
-        # OpenAI-compatible streaming
-        try:
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-            )
-            for ev in stream:
-                delta = ev.choices[0].delta
-                if delta and getattr(delta, "content", None):
-                    yield delta.content
-        except Exception:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=False,
-            )
-            yield (resp.choices[0].message.content or "")
+    async def stream(self, messages: list[dict], temperature: float = 0.2) -> AsyncGenerator[str, None]:
+        # OpenAI-compatible streaming. Closing this generator (client disconnect) closes
+        # the upstream response, which aborts the generation on the provider side.
+        async with self._slots:
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                )
+                try:
+                    async for ev in stream:
+                        delta = ev.choices[0].delta if ev.choices else None
+                        if delta and getattr(delta, "content", None):
+                            yield delta.content
+                finally:
+                    await stream.close()
+            except Exception:
+                resp = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=False,
+                )
+                yield (resp.choices[0].message.content or "")
+
+    async def aclose(self):
+        await self.http.aclose()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import io
+from PIL import Image, ImageOps
+
+# formats every provider accepts as-is (OpenAI: png/jpeg/webp/gif, Ollama: png/jpeg)
+_PASSTHROUGH = {"image/jpeg", "image/png"}
+
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+]
+
+@dataclass
+class ImagePrepConfig:
+    max_edge: int = 1568       # longest side sent to the model, in pixels
+    jpeg_quality: int = 85
+    passthrough_bytes: int = 512 * 1024  # small jpeg/png within max_edge are sent untouched
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    orig_bytes: int
+    orig_mime: str
+
+def sniff_image_mime(b: bytes) -> str | None:
+    if b[:4] == b"RIFF" and b[8:12] == b"WEBP":
+        return "image/webp"
+    if b[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftypavif"):
+        return "image/heic" if b[8:12] != b"avif" else "image/avif"
+    for magic, mime in _MAGIC:
+        if b.startswith(magic):
+            return mime
+    return None
+
+def prepare_image(b: bytes, cfg: ImagePrepConfig | None = None) -> PreparedImage:
+    """Normalize an upload for a vision model: fix orientation, cap the longest edge
+    at `max_edge` and re-encode as JPEG (PNG when there is transparency).
+
+    Raises ValueError for bytes Pillow cannot decode.
+    """
+    cfg = cfg or ImagePrepConfig()
+    orig_mime = sniff_image_mime(b) or "application/octet-stream"
+    try:
+        img = Image.open(io.BytesIO(b))
+        img.load()
+    except Exception as e:
+        raise ValueError(f"Unsupported or corrupt image ({orig_mime})") from e
+
+    w, h = img.size
+    rotated = (img.getexif() or {}).get(0x0112, 1) not in (1, None)
+    if (orig_mime in _PASSTHROUGH and max(w, h) <= cfg.max_edge and not rotated
+            and len(b) <= cfg.passthrough_bytes):
+        return PreparedImage(b, orig_mime, w, h, len(b), orig_mime)
+
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > cfg.max_edge:
+        img.thumbnail((cfg.max_edge, cfg.max_edge), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha:
+        img.save(out, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=cfg.jpeg_quality, optimize=True)
+        mime = "image/jpeg"
+    data = out.getvalue()
+    if orig_mime in _PASSTHROUGH and len(data) >= len(b) and img.size == (w, h) and not rotated:
+        # re-encoding didn't help; keep the original bytes
+        return PreparedImage(b, orig_mime, w, h, len(b), orig_mime)
+    return PreparedImage(data, mime, img.size[0], img.size[1], len(b), orig_mime)
@@ -7,13 +7,21 @@ import httpx
 class OllamaVisionConfig:
     base_url: str  # e.g. http://host.docker.internal:11434
     model: str     # e.g. llava:7b, qwen2-vl:7b
+    timeout_s: float = 120.0
+    max_connections: int = 16
 
 class OllamaVision:
     def __init__(self, cfg: OllamaVisionConfig):
         self.base_url = (cfg.base_url or "http://localhost:11434").rstrip("/")
         self.model = cfg.model or "llava:7b"
+        # one keep-alive pool for all calls instead of a new connection per image
+        self.client = httpx.Client(
+            timeout=cfg.timeout_s,
+            limits=httpx.Limits(max_connections=cfg.max_connections, max_keepalive_connections=cfg.max_connections),
+        )
 
-    def analyze(self, image_bytes: bytes, prompt: str) -> str:
+    def analyze(self, image_bytes: bytes, prompt: str, mime: str | None = None) -> str:
+        # Ollama sniffs the format itself; mime is accepted for interface parity
         b64 = base64.b64encode(image_bytes).decode("utf-8")
         payload = {
             "model": self.model,
@@ -23,8 +31,10 @@ class OllamaVision:
             ],
             "stream": False
         }
-        with httpx.Client(timeout=120) as client:
-            r = client.post(f"{self.base_url}/api/chat", json=payload)
-            r.raise_for_status()
-            data = r.json()
+        r = self.client.post(f"{self.base_url}/api/chat", json=payload)
+        r.raise_for_status()
+        data = r.json()
         return (data.get("message", {}) or {}).get("content", "") or ""
+
+    def close(self):
+        self.client.close()
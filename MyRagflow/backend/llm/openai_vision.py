@@ -3,6 +3,8 @@ from dataclasses import dataclass
 import base64
 from openai import OpenAI
 
+from .image_prep import sniff_image_mime
+
 @dataclass
 class VisionConfig:
     api_key: str
@@ -17,9 +19,9 @@ class OpenAIVision:
         self.client = OpenAI(**kwargs)
         self.model = cfg.model
 
-    def analyze(self, image_bytes: bytes, prompt: str) -> str:
+    def analyze(self, image_bytes: bytes, prompt: str, mime: str | None = None) -> str:
         b64 = base64.b64encode(image_bytes).decode("utf-8")
-        data_url = f"data:image/png;base64,{b64}"
+        data_url = f"data:{mime or sniff_image_mime(image_bytes) or 'image/png'};base64,{b64}"
         resp = self.client.chat.completions.create(
             model=self.model,
             messages=[
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+class VisionCache:
+    """Persistent store of vision model outputs.
+
+    Keys are (sha256(image), prompt, provider, model), so re-analyzing the same
+    picture with the same question never reaches the provider again. When the row
+    count exceeds `max_entries`, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(0, int(max_entries))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+          key TEXT PRIMARY KEY,
+          text TEXT NOT NULL,
+          last_used INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results(last_used)")
+        self._conn.commit()
+        self._count = int(self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def image_hash(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    @staticmethod
+    def key(image_hash: str, prompt: str, provider: str, model: str) -> str:
+        p = hashlib.sha256((prompt or "").strip().encode("utf-8")).hexdigest()[:16]
+        return f"{provider}:{model}:{p}:{image_hash}"
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM results WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used=? WHERE key=?", (int(time.time()), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO results(key, text, last_used) VALUES(?,?,?)", (key, text, int(time.time()))
+            )
+            self._count += cur.rowcount
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # trim to 90% of the limit so eviction isn't triggered on every insert
+        drop = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used ASC LIMIT ?)", (drop,)
+        )
+        self._count -= drop
+        self.evictions += drop
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
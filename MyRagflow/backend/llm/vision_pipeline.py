@@ -0,0 +1,137 @@
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import random
+import threading
+import time
+from typing import Iterable, Iterator
+
+from .image_prep import ImagePrepConfig, prepare_image
+from .vision_cache import VisionCache
+
+@dataclass
+class VisionResult:
+    text: str
+    cached: bool
+    orig_bytes: int
+    sent_bytes: int
+    mime: str | None
+    prep_ms: float
+    model_ms: float
+
+    def to_dict(self) -> dict:
+        return {
+            "text": self.text,
+            "cached": self.cached,
+            "image": {"orig_bytes": self.orig_bytes, "sent_bytes": self.sent_bytes, "mime": self.mime},
+            "timings_ms": {"prep": round(self.prep_ms, 1), "model": round(self.model_ms, 1)},
+        }
+
+class VisionPipeline:
+    """hash -> cache lookup -> downscale/re-encode -> provider call -> cache store.
+
+    `client` is any vision client with `.model` and `analyze(bytes, prompt, mime)`.
+    Counters compare upload size with what was actually sent and split latency
+    into preprocessing and model time.
+    """
+
+    def __init__(self, cache: VisionCache | None, prep: ImagePrepConfig | None = None):
+        self.cache = cache
+        self.prep = prep or ImagePrepConfig()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.provider_calls = 0
+        self.orig_bytes = 0
+        self.sent_bytes = 0
+        self.prep_ms = 0.0
+        self.model_ms = 0.0
+
+    def analyze(self, provider: str, client, image_bytes: bytes, prompt: str) -> VisionResult:
+        key = None
+        if self.cache is not None:
+            key = VisionCache.key(VisionCache.image_hash(image_bytes), prompt, provider, client.model)
+            text = self.cache.get(key)
+            if text is not None:
+                with self._lock:
+                    self.requests += 1
+                return VisionResult(text, True, len(image_bytes), 0, None, 0.0, 0.0)
+
+        t0 = time.perf_counter()
+        img = prepare_image(image_bytes, self.prep)
+        t1 = time.perf_counter()
+        text = client.analyze(img.data, prompt, mime=img.mime)
+        t2 = time.perf_counter()
+        # an empty answer is usually a transient provider glitch: let the next request retry it
+        if key is not None and text and text.strip():
+            self.cache.put(key, text)
+
+        res = VisionResult(text, False, img.orig_bytes, len(img.data), img.mime, (t1 - t0) * 1000, (t2 - t1) * 1000)
+        with self._lock:
+            self.requests += 1
+            self.provider_calls += 1
+            self.orig_bytes += res.orig_bytes
+            self.sent_bytes += res.sent_bytes
+            self.prep_ms += res.prep_ms
+            self.model_ms += res.model_ms
+        return res
+
+    def analyze_retrying(self, provider: str, client, image_bytes: bytes, prompt: str,
+                         retries: int = 2, backoff_s: float = 1.0) -> VisionResult:
+        for attempt in range(retries + 1):
+            try:
+                return self.analyze(provider, client, image_bytes, prompt)
+            except ValueError:
+                raise  # undecodable image; retrying won't help
+            except Exception:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff_s * (2 ** attempt) * (0.5 + random.random()))
+
+    def analyze_many(self, provider: str, client, items: Iterable[tuple[str, bytes]], prompt: str,
+                     concurrency: int = 4, retries: int = 2, stop: threading.Event | None = None,
+                     ) -> Iterator[tuple[int, str, VisionResult | None, str | None]]:
+        """Analyze (name, bytes) items with at most `concurrency` provider calls in flight.
+
+        Yields (index, name, result, error) in completion order. Items are pulled
+        lazily, so only about 2x `concurrency` images are held in memory. Closing
+        the generator or setting `stop` drops the images that haven't started.
+        """
+        concurrency = max(1, concurrency)
+        ex = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vision")
+        source = enumerate(items)
+        inflight: dict = {}
+        try:
+            while True:
+                while len(inflight) < 2 * concurrency and not (stop and stop.is_set()):
+                    nxt = next(source, None)
+                    if nxt is None:
+                        break
+                    i, (name, data) = nxt
+                    fut = ex.submit(self.analyze_retrying, provider, client, data, prompt, retries)
+                    inflight[fut] = (i, name)
+                if not inflight:
+                    return
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    i, name = inflight.pop(fut)
+                    try:
+                        yield i, name, fut.result(), None
+                    except Exception as e:
+                        yield i, name, None, str(e) or type(e).__name__
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.provider_calls
+            out = {
+                "requests": self.requests,
+                "provider_calls": n,
+                "orig_bytes": self.orig_bytes,
+                "sent_bytes": self.sent_bytes,
+                "payload_ratio": (self.sent_bytes / self.orig_bytes) if self.orig_bytes else 1.0,
+                "avg_prep_ms": (self.prep_ms / n) if n else 0.0,
+                "avg_model_ms": (self.model_ms / n) if n else 0.0,
+            }
+        out["cache"] = self.cache.stats() if self.cache is not None else None
+        return out
@@ -3,58 +3,62 @@ from __future__ import annotations
 import time
 import os
 import json
+import asyncio
+import logging
+import shutil
+import tarfile
+import tempfile
+import threading
+import uuid
+import zipfile
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
+from pathlib import Path
 from typing import Any
 from fastapi import FastAPI, UploadFile, File, Form, Body
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from starlette.background import BackgroundTask
 import orjson
 
+from settings import settings, make_embeddings, make_vision_pipeline
 from utils.errors import unhandled_exception_handler, json_error
-from rag.store import init_storage, list_kbs, create_kb, delete_kb, list_docs, delete_doc_and_chunks
-from rag.store import _connect, fetch_chunks_by_ord, count_chunks
-from rag.embeddings import Embeddings, EmbeddingsConfig
-from rag.ingest import ingest_one, rebuild_from_texts
-from rag.query import retrieve, build_prompt
+from utils.metrics import TraceMiddleware, current_trace, log_trace, observe, render_metrics, start_trace
+from rag.store import init_storage, list_kbs, create_kb, delete_kb, list_docs, list_chunk_texts
+from rag.store import kb_stats, kb_exists, get_job, list_jobs, job_payload_path, content_version
+from rag.ingest import run_upload_job, delete_doc, rebuild_from_texts
+from rag.bulk import run_bulk_job, is_archive, is_image, iter_archive
+from rag.parsers import close_parse_pool
+from rag.images import ImageCaptioner
+from rag.jobs import JobQueue
+from rag.index import invalidate_index, index_cache_stats, compact_index
+from rag.index import get_index_config, set_index_config, evaluate_index
+from rag.answer_cache import AnswerCache, answer_key
+from rag.query import RETRIEVAL_MODES, retrieve, retrieve_batch, retrieve_multi, build_prompt
 from llm.deepseek import DeepSeek, DeepSeekConfig
 from llm.openai_vision import OpenAIVision, VisionConfig
 from llm.ollama_vision import OllamaVision, OllamaVisionConfig
 
-class Settings(BaseSettings):
-    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
-
-    DEEPSEEK_API_KEY: str = ""
-    DEEPSEEK_BASE_URL: str = "https://api.deepseek.com"
-    DEEPSEEK_MODEL: str = "deepseek-chat"
-
-    OPENAI_API_KEY: str = ""
-    OPENAI_VISION_MODEL: str = "gpt-4o-mini"
-    OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
-
-    # Vision provider
-    VISION_PROVIDER: str = "openai"  # openai | ollama | openai_compat
-    VISION_BASE_URL: str = ""
-    VISION_API_KEY: str = ""
-    VISION_MODEL: str = ""
-    OLLAMA_BASE_URL: str = "http://host.docker.internal:11434"
-    OLLAMA_VISION_MODEL: str = "llava:7b"
-
-    EMBEDDINGS_PROVIDER: str = "openai"
-    LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
-
-    DEFAULT_TOP_K: int = 6
-    DEFAULT_CHUNK_SIZE: int = 900
-    DEFAULT_CHUNK_OVERLAP: int = 120
-    MAX_UPLOAD_MB: int = 80
-
-    APP_ENV: str = "prod"
-    BACKEND_HOST: str = "0.0.0.0"
-    BACKEND_PORT: int = 8000
-
-settings = Settings()
-
-app = FastAPI(title="RAG Studio", default_response_class=ORJSONResponse)
+logging.basicConfig(level=settings.LOG_LEVEL.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per provider call otherwise
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # pick up jobs left behind by earlier runs only once the server is actually starting
+    jobs.resume()
+    if settings.EMBED_WARMUP:
+        # in the background so the server accepts requests meanwhile; early callers wait on the load lock
+        threading.Thread(target=embeddings.warmup, name="embed-warmup", daemon=True).start()
+    yield
+    jobs.close()
+    close_parse_pool()
+    await deepseek.aclose()
+    if ollama_vision is not None:
+        ollama_vision.close()
+
+app = FastAPI(title="RAG Studio", default_response_class=ORJSONResponse, lifespan=lifespan)
 app.add_exception_handler(Exception, unhandled_exception_handler)
 
 app.add_middleware(
@@ -63,28 +67,24 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+app.add_middleware(TraceMiddleware)
 
 init_storage()
 
-embeddings = Embeddings(EmbeddingsConfig(
-    provider=settings.EMBEDDINGS_PROVIDER,
-    openai_api_key=settings.OPENAI_API_KEY,
-    openai_model=settings.OPENAI_EMBEDDING_MODEL,
-    local_model=settings.LOCAL_EMBEDDING_MODEL,
-))
-
-deepseek = DeepSeek(DeepSeekConfig(
-    api_key=settings.DEEPSEEK_API_KEY,
-    base_url=settings.DEEPSEEK_BASE_URL,
-    model=settings.DEEPSEEK_MODEL,
-))
-
+embeddings = make_embeddings(settings)
+vision_pipeline = make_vision_pipeline(settings)
 vision = None
 ollama_vision = None
 compat_vision = None
+_vision_lock = threading.Lock()  # clients are created lazily, also from ingest worker threads
 
 def get_vision_client():
+    with _vision_lock:
+        return _get_vision_client()
+
+def _get_vision_client():
     global vision, ollama_vision, compat_vision
     provider = (settings.VISION_PROVIDER or "openai").strip().lower()
 
@@ -113,6 +113,40 @@ def get_vision_client():
         vision = OpenAIVision(VisionConfig(api_key=settings.OPENAI_API_KEY, model=settings.OPENAI_VISION_MODEL))
     return "openai", vision
 
+captioner = ImageCaptioner(
+    vision_pipeline, get_vision_client,
+    prompt=settings.VISION_CAPTION_PROMPT,
+    concurrency=settings.VISION_CONCURRENCY,
+    retries=settings.VISION_RETRIES,
+) if settings.INGEST_IMAGES else None
+
+jobs = JobQueue(
+    {
+        "upload": partial(run_upload_job, embeddings=embeddings, captioner=captioner),
+        "bulk": partial(run_bulk_job, embeddings=embeddings, max_bytes=settings.MAX_UPLOAD_MB * 1024 * 1024,
+                        captioner=captioner),
+    },
+    workers=settings.INGEST_WORKERS,
+    per_kb=settings.INGEST_PER_KB,
+    lease_s=settings.JOB_LEASE_S,
+)
+
+deepseek = DeepSeek(DeepSeekConfig(
+    api_key=settings.DEEPSEEK_API_KEY,
+    base_url=settings.DEEPSEEK_BASE_URL,
+    model=settings.DEEPSEEK_MODEL,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    timeout_s=settings.LLM_TIMEOUT_S,
+))
+
+answers = AnswerCache(
+    settings.ANSWER_CACHE_MAX_ENTRIES if settings.ANSWER_CACHE_ENABLED else 0,
+    settings.ANSWER_CACHE_TTL_S,
+)
+REPLAY_CHUNK_CHARS = 24
+
+
 def sse(data: Any, event: str | None = None):
     payload = orjson.dumps(data).decode("utf-8")
     if event:
@@ -123,6 +157,20 @@ def sse(data: Any, event: str | None = None):
 def health():
     return {"ok": True, "ts": int(time.time()), "env": settings.APP_ENV}
 
+@app.get("/api/cache/stats")
+def api_cache_stats():
+    return {"ok": True, "data": {
+        "index": index_cache_stats(),
+        "embeddings": embeddings.cache_stats(),
+        "answers": answers.stats(),
+        "vision": vision_pipeline.stats(),
+    }}
+
+@app.get("/api/metrics")
+def api_metrics():
+    # Prometheus text format: stage and HTTP latency histograms
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ---------------- KB APIs ----------------
 class CreateKB(BaseModel):
     name: str
@@ -143,6 +191,8 @@ def api_kb_create(body: CreateKB):
 @app.delete("/api/kbs/{kb_id}")
 def api_kb_delete(kb_id: str):
     delete_kb(kb_id)
+    invalidate_index(kb_id)
+    answers.invalidate(kb_id)
     return {"ok": True}
 
 @app.get("/api/kbs/{kb_id}/docs")
@@ -151,15 +201,36 @@ def api_docs(kb_id: str):
 
 @app.delete("/api/kbs/{kb_id}/docs/{doc_id}")
 def api_doc_delete(kb_id: str, doc_id: str):
-    # simplest safe: delete + rebuild index
-    delete_doc_and_chunks(kb_id, doc_id)
-    # rebuild from all remaining chunks text
-    conn = _connect(kb_id)
-    rows = conn.execute("SELECT text FROM chunks ORDER BY vector_ord ASC").fetchall()
-    conn.close()
-    all_texts = [r["text"] for r in rows]
-    res = rebuild_from_texts(kb_id, embeddings, all_texts)
-    return {"ok": True, "data": {"deleted": True, "rebuild": res}}
+    res = delete_doc(kb_id, doc_id)
+    return {"ok": True, "data": {"deleted": True, **res}}
+
+@app.post("/api/kbs/{kb_id}/compact")
+def api_compact(kb_id: str):
+    return {"ok": True, "data": compact_index(kb_id)}
+
+def _save_and_submit(kb_id: str, params: dict, content: bytes) -> dict:
+    job = jobs.create(kb_id, "upload", params)
+    job_payload_path(kb_id, job["job_id"]).write_bytes(content)
+    jobs.start(job)
+    return job
+
+async def _submit_upload(kb_id: str, file: UploadFile, chunk_size: int, chunk_overlap: int):
+    if not kb_exists(kb_id):
+        return json_error("KB not found", "NOT_FOUND", 404)
+    content = await file.read()
+    max_bytes = int(settings.MAX_UPLOAD_MB) * 1024 * 1024
+    if len(content) > max_bytes:
+        return json_error(f"File too large (> {settings.MAX_UPLOAD_MB}MB)", "LIMIT", 413)
+
+    params = {
+        "filename": file.filename or "upload",
+        "content_type": file.content_type,
+        "size_bytes": len(content),
+        "chunk_size": int(chunk_size),
+        "chunk_overlap": int(chunk_overlap),
+    }
+    job = await run_in_threadpool(_save_and_submit, kb_id, params, content)
+    return {"ok": True, "data": job}
 
 @app.post("/api/kbs/{kb_id}/upload")
 async def api_upload(
@@ -168,83 +239,280 @@ async def api_upload(
     chunk_size: int = Form(default=settings.DEFAULT_CHUNK_SIZE),
     chunk_overlap: int = Form(default=settings.DEFAULT_CHUNK_OVERLAP),
 ):
-    content = await file.read()
-    max_bytes = int(settings.MAX_UPLOAD_MB) * 1024 * 1024
-    if len(content) > max_bytes:
-        return json_error(f"File too large (> {settings.MAX_UPLOAD_MB}MB)", "LIMIT", 413)
+    # returns immediately with a job; poll /jobs/{job_id} for the result
+    return await _submit_upload(kb_id, file, chunk_size, chunk_overlap)
+
+def _copy_limited(src, dst, max_bytes: int) -> bool:
+    """Copy in 1MB chunks; False as soon as more than `max_bytes` were written."""
+    while True:
+        buf = src.read(1024 * 1024)
+        if not buf:
+            return True
+        dst.write(buf)
+        if dst.tell() > max_bytes:
+            return False
+
+def _save_bulk(kb_id: str, params: dict, files: list[UploadFile]) -> tuple[dict | None, str | None]:
+    """Stage every file, then record and start the job: (job, None), or (None, error) if one is too large."""
+    max_bytes = int(settings.MAX_BULK_UPLOAD_MB) * 1024 * 1024
+    # files go to a staging dir first so a rejected upload leaves no job row behind
+    staging = job_payload_path(kb_id, f".staging-{uuid.uuid4().hex}")
+    staging.mkdir()
     try:
-        res = ingest_one(
-            kb_id=kb_id,
-            filename=file.filename or "upload",
-            content_type=file.content_type,
-            content=content,
-            embeddings=embeddings,
-            chunk_size=int(chunk_size),
-            overlap=int(chunk_overlap),
-        )
-        return {"ok": True, "data": res}
-    except Exception as e:
-        return json_error(str(e), "INGEST", 400)
+        for i, f in enumerate(files):
+            too_large = f"{f.filename} too large (> {settings.MAX_BULK_UPLOAD_MB}MB)"
+            if f.size is not None and f.size > max_bytes:
+                return None, too_large
+            # one directory per upload keeps same-named files apart without touching their names
+            dest = staging / f"{i:05d}" / (Path(f.filename or "").name or "upload")
+            dest.parent.mkdir()
+            with open(dest, "wb") as out:
+                if not _copy_limited(f.file, out, max_bytes):
+                    return None, too_large
+        job = jobs.create(kb_id, "bulk", params)
+        staging.rename(job_payload_path(kb_id, job["job_id"]))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    jobs.start(job)
+    return job, None
+
+@app.post("/api/kbs/{kb_id}/upload/bulk")
+async def api_upload_bulk(
+    kb_id: str,
+    files: list[UploadFile] = File(...),
+    chunk_size: int = Form(default=settings.DEFAULT_CHUNK_SIZE),
+    chunk_overlap: int = Form(default=settings.DEFAULT_CHUNK_OVERLAP),
+):
+    """Many documents and/or zip/tar archives as one background job."""
+    if not kb_exists(kb_id):
+        return json_error("KB not found", "NOT_FOUND", 404)
+    params = {
+        "files": [f.filename for f in files],
+        "chunk_size": int(chunk_size),
+        "chunk_overlap": int(chunk_overlap),
+    }
+    job, error = await run_in_threadpool(_save_bulk, kb_id, params, files)
+    if error:
+        return json_error(error, "LIMIT", 413)
+    return {"ok": True, "data": job}
+
+@app.post("/api/kbs/{kb_id}/jobs")
+async def api_job_submit(
+    kb_id: str,
+    file: UploadFile = File(...),
+    chunk_size: int = Form(default=settings.DEFAULT_CHUNK_SIZE),
+    chunk_overlap: int = Form(default=settings.DEFAULT_CHUNK_OVERLAP),
+):
+    return await _submit_upload(kb_id, file, chunk_size, chunk_overlap)
+
+@app.get("/api/kbs/{kb_id}/jobs")
+def api_jobs(kb_id: str, limit: int = 50):
+    return {"ok": True, "data": list_jobs(kb_id, limit=limit)}
+
+@app.get("/api/kbs/{kb_id}/jobs/{job_id}")
+def api_job(kb_id: str, job_id: str):
+    job = get_job(job_id)
+    if job is None or job["kb_id"] != kb_id:
+        return json_error("Job not found", "NOT_FOUND", 404)
+    return {"ok": True, "data": job}
+
+@app.get("/api/kbs/{kb_id}/jobs/{job_id}/events")
+async def api_job_events(kb_id: str, job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None or job["kb_id"] != kb_id:
+        return json_error("Job not found", "NOT_FOUND", 404)
+
+    async def gen():
+        last = None
+        while True:
+            job = await run_in_threadpool(get_job, job_id)
+            snapshot = (job["status"], job["stage"], job["progress"])
+            if snapshot != last:
+                last = snapshot
+                yield sse({"ok": True, "type": "progress", "job": job}, event="progress")
+            if job["status"] in ("done", "failed"):
+                yield sse({"ok": True, "type": job["status"], "job": job}, event=job["status"])
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(gen(), media_type="text/event-stream")
 
 @app.post("/api/kbs/{kb_id}/rebuild")
 def api_rebuild(kb_id: str):
-    conn = _connect(kb_id)
-    rows = conn.execute("SELECT text FROM chunks ORDER BY vector_ord ASC").fetchall()
-    conn.close()
-    all_texts = [r["text"] for r in rows]
+    ords, all_texts = list_chunk_texts(kb_id)
     try:
-        res = rebuild_from_texts(kb_id, embeddings, all_texts)
+        res = rebuild_from_texts(kb_id, embeddings, all_texts, ords)
         return {"ok": True, "data": res}
     except Exception as e:
         return json_error(str(e), "REBUILD", 400)
 
+class IndexConfigBody(BaseModel):
+    kind: str = "auto"  # auto | flat | hnsw | ivf | ivfpq
+    params: dict = {}
+
+@app.get("/api/kbs/{kb_id}/index")
+def api_index_config(kb_id: str):
+    return {"ok": True, "data": get_index_config(kb_id)}
+
+@app.put("/api/kbs/{kb_id}/index")
+def api_index_config_set(kb_id: str, body: IndexConfigBody):
+    try:
+        return {"ok": True, "data": set_index_config(kb_id, body.kind, body.params)}
+    except ValueError as e:
+        return json_error(str(e), "VALIDATION", 400)
+
+@app.get("/api/kbs/{kb_id}/index/report")
+def api_index_report(kb_id: str, queries: int = 200, top_k: int = 10):
+    return {"ok": True, "data": evaluate_index(kb_id, queries=queries, top_k=top_k)}
+
 @app.get("/api/kbs/{kb_id}/stats")
 def api_stats(kb_id: str):
-    conn = _connect(kb_id)
-    row_docs = conn.execute("SELECT COUNT(*) AS n FROM docs").fetchone()
-    row_chunks = conn.execute("SELECT COUNT(*) AS n FROM chunks").fetchone()
-    conn.close()
-    return {"ok": True, "data": {"docs": int(row_docs["n"]), "chunks": int(row_chunks["n"])}}
+    return {"ok": True, "data": kb_stats(kb_id)}
+
+# ---------------- Retrieval ----------------
+class RetrieveBatchBody(BaseModel):
+    queries: list[str]
+    top_k: int | None = None
+    mode: str | None = None  # dense | lexical | hybrid
+
+MAX_BATCH_QUERIES = 1000
+MAX_QUERY_KBS = 32
+
+def _resolve_kbs(kb_id: str | None, kb_ids: list[str] | None):
+    """The deduplicated KB ids of a query (`kb_ids`, or the single `kb_id`), or an error response."""
+    ids = list(dict.fromkeys(k.strip() for k in (kb_ids or [kb_id or ""]) if k and k.strip()))
+    if not ids:
+        return None, json_error("kb_id or kb_ids is required", "VALIDATION", 400)
+    if len(ids) > MAX_QUERY_KBS:
+        return None, json_error(f"at most {MAX_QUERY_KBS} knowledge bases per query", "LIMIT", 413)
+    missing = [k for k in ids if not kb_exists(k)]
+    if missing:
+        return None, json_error(f"KB not found: {', '.join(missing)}", "NOT_FOUND", 404)
+    return ids, None
+
+@app.post("/api/kbs/{kb_id}/retrieve/batch")
+def api_retrieve_batch(kb_id: str, body: RetrieveBatchBody):
+    queries = [(q or "").strip() for q in body.queries]
+    if not queries or not all(queries):
+        return json_error("queries must be a non-empty list of non-empty strings", "VALIDATION", 400)
+    if len(queries) > MAX_BATCH_QUERIES:
+        return json_error(f"at most {MAX_BATCH_QUERIES} queries per batch", "LIMIT", 413)
+    mode = (body.mode or settings.RETRIEVAL_MODE).strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        return json_error(f"mode must be one of {', '.join(RETRIEVAL_MODES)}", "VALIDATION", 400)
+    top_k = int(body.top_k or settings.DEFAULT_TOP_K)
+    results = retrieve_batch(kb_id, queries, embeddings, top_k=top_k, mode=mode)
+    return {"ok": True, "data": {"top_k": top_k, "mode": mode, "results": results}}
+
+class RetrieveBody(BaseModel):
+    query: str
+    kb_ids: list[str]
+    top_k: int | None = None
+    mode: str | None = None  # dense | lexical | hybrid
+
+@app.post("/api/retrieve")
+def api_retrieve(body: RetrieveBody):
+    # one query over several KBs, merged by score
+    query = (body.query or "").strip()
+    if not query:
+        return json_error("query is required", "VALIDATION", 400)
+    kb_ids, err = _resolve_kbs(None, body.kb_ids)
+    if err is not None:
+        return err
+    mode = (body.mode or settings.RETRIEVAL_MODE).strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        return json_error(f"mode must be one of {', '.join(RETRIEVAL_MODES)}", "VALIDATION", 400)
+    top_k = int(body.top_k or settings.DEFAULT_TOP_K)
+    results, skipped = retrieve_multi(kb_ids, query, embeddings, top_k=top_k, mode=mode)
+    return {"ok": True, "data": {"top_k": top_k, "mode": mode, "kb_ids": kb_ids, "results": results,
+                                 "skipped": skipped}}
 
 # ---------------- Chat stream (SSE) ----------------
 class ChatBody(BaseModel):
-    kb_id: str
+    kb_id: str | None = None
+    kb_ids: list[str] | None = None  # search several KBs at once; takes precedence over kb_id
     message: str
     history: list[dict] = []
     top_k: int | None = None
+    mode: str | None = None  # dense | lexical | hybrid
 
 @app.post("/api/chat/stream")
-def api_chat_stream(body: ChatBody = Body(...)):
-    kb_id = (body.kb_id or "").strip()
+async def api_chat_stream(body: ChatBody = Body(...)):
     message = (body.message or "").strip()
-    if not kb_id:
-        return json_error("kb_id is required", "VALIDATION", 400)
+    kb_ids, err = await run_in_threadpool(_resolve_kbs, body.kb_id, body.kb_ids)
+    if err is not None:
+        return err
     if not message:
         return json_error("message is required", "VALIDATION", 400)
 
     top_k = int(body.top_k or settings.DEFAULT_TOP_K)
     history = body.history or []
-
-    retrieved = retrieve(kb_id, message, embeddings, top_k=top_k)
+    mode = (body.mode or settings.RETRIEVAL_MODE).strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        return json_error(f"mode must be one of {', '.join(RETRIEVAL_MODES)}", "VALIDATION", 400)
+
+    history = [
+        {"role": m.get("role"), "content": m.get("content")}
+        for m in history[-12:]
+        if m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str) and m.get("content").strip()
+    ]
+    trace = current_trace() or start_trace()
+    # a single KB keeps its plain id/version; several use sorted tuples so the order doesn't matter
+    scope = kb_ids[0] if len(kb_ids) == 1 else tuple(sorted(kb_ids))
+    if isinstance(scope, str):
+        version = await run_in_threadpool(content_version, scope)
+    else:
+        version = tuple(await run_in_threadpool(lambda: [content_version(k) for k in scope]))
+    key = answer_key(scope, message, history, top_k, mode, settings.DEEPSEEK_MODEL)
+    hit = answers.get(key, version)
+    if hit is not None:
+        async def replay():
+            yield sse({"ok": True, "type": "meta", "top_k": top_k, "mode": mode, "sources": len(hit.sources),
+                       "cached": True, "kb_ids": kb_ids, "trace_id": trace.trace_id, "timings_ms": trace.stages_ms()}, event="meta")
+            for i in range(0, len(hit.answer), REPLAY_CHUNK_CHARS):
+                yield sse({"ok": True, "type": "delta", "delta": hit.answer[i:i + REPLAY_CHUNK_CHARS]}, event="delta")
+            yield sse({"ok": True, "type": "final", "content": hit.answer, "trace_id": trace.trace_id,
+                       "timings_ms": trace.stages_ms(), "total_ms": trace.elapsed_ms()}, event="final")
+            yield sse({"ok": True, "type": "sources", "sources": hit.sources}, event="sources")
+            log_trace("chat", trace, kb_ids=kb_ids, mode=mode, cached=True)
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    t_retrieve = time.perf_counter()
+    skipped = []
+    if len(kb_ids) == 1:
+        retrieved = await run_in_threadpool(retrieve, kb_ids[0], message, embeddings, top_k=top_k, mode=mode)
+    else:
+        retrieved, skipped = await run_in_threadpool(retrieve_multi, kb_ids, message, embeddings,
+                                                     top_k=top_k, mode=mode)
+    observe("retrieve", time.perf_counter() - t_retrieve)
     rag_prompt, sources = build_prompt(message, retrieved)
 
     msgs = [{"role": "system", "content": "You are a helpful assistant. Reply in Chinese unless user uses other language."}]
-    for m in history[-12:]:
-        r = m.get("role")
-        c = m.get("content")
-        if r in ("user", "assistant") and isinstance(c, str) and c.strip():
-            msgs.append({"role": r, "content": c})
+    msgs.extend(history)
     msgs.append({"role": "user", "content": rag_prompt})
 
-    def gen():
-        yield sse({"ok": True, "type": "meta", "top_k": top_k, "sources": len(sources)}, event="meta")
+    async def gen():
+        # meta carries the retrieval breakdown; final adds the LLM stages and the total
+        yield sse({"ok": True, "type": "meta", "top_k": top_k, "mode": mode, "sources": len(sources),
+                   "cached": False, "kb_ids": kb_ids, "skipped": skipped, "trace_id": trace.trace_id,
+                   "timings_ms": trace.stages_ms()}, event="meta")
         acc = []
-        for token in deepseek.stream(msgs):
-            acc.append(token)
-            yield sse({"ok": True, "type": "delta", "delta": token}, event="delta")
+        t_llm = time.perf_counter()
+        async with aclosing(deepseek.stream(msgs)) as tokens:
+            async for token in tokens:
+                if not acc:
+                    observe("llm_ttft", time.perf_counter() - t_llm)
+                acc.append(token)
+                yield sse({"ok": True, "type": "delta", "delta": token}, event="delta")
+        observe("llm", time.perf_counter() - t_llm)
         final = "".join(acc).strip()
-        yield sse({"ok": True, "type": "final", "content": final}, event="final")
+        # only complete answers are cached; a client disconnect never reaches this point
+        if final:
+            answers.put(key, scope, version, final, sources)
+        yield sse({"ok": True, "type": "final", "content": final, "trace_id": trace.trace_id,
+                   "timings_ms": trace.stages_ms(), "total_ms": trace.elapsed_ms()}, event="final")
         yield sse({"ok": True, "type": "sources", "sources": sources}, event="sources")
+        log_trace("chat", trace, kb_ids=kb_ids, mode=mode, cached=False, answer_chars=len(final))
 
     return StreamingResponse(gen(), media_type="text/event-stream")
 
@@ -258,8 +526,109 @@ async def api_vision(
     if not b:
         return json_error("Empty image", "VALIDATION", 400)
     try:
-        _, client = get_vision_client()
-        txt = client.analyze(b, prompt)
-        return {"ok": True, "data": {"text": txt}}
+        provider, client = get_vision_client()
+        res = await run_in_threadpool(vision_pipeline.analyze, provider, client, b, prompt)
+        return {"ok": True, "data": res.to_dict()}
+    except ValueError as e:
+        return json_error(str(e), "VALIDATION", 400)
+    except Exception as e:
+        return json_error(str(e), "VISION", 400)
+
+def _stage_vision_batch(files: list[UploadFile], max_bytes: int) -> tuple[Path, list[Path], int]:
+    """Copy the uploads to a staging dir and count the images in them: (dir, paths, count).
+
+    The streamed response body runs after the handler has returned, when the
+    form's upload files may already be closed, so it reads these copies.
+    """
+    staging = Path(tempfile.mkdtemp(prefix="vision-batch-"))
+    try:
+        paths = []
+        for i, f in enumerate(files):
+            name = Path(f.filename or "").name or "image"
+            if not is_archive(name) and f.size is not None and f.size > max_bytes:
+                continue
+            dest = staging / f"{i:05d}" / name
+            dest.parent.mkdir()
+            f.file.seek(0)
+            with open(dest, "wb") as out:
+                shutil.copyfileobj(f.file, out, 1024 * 1024)
+            paths.append(dest)
+        return staging, paths, _count_vision_uploads(paths, max_bytes)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def _iter_vision_uploads(paths: list[Path], max_bytes: int):
+    for p in paths:
+        if is_archive(p.name):
+            yield from iter_archive(p, max_bytes, accept=is_image)
+        elif p.stat().st_size <= max_bytes:
+            yield p.name, p.read_bytes()
+
+def _count_vision_uploads(paths: list[Path], max_bytes: int) -> int:
+    n = 0
+    for p in paths:
+        name = p.name.lower()
+        if name.endswith(".zip"):
+            with zipfile.ZipFile(p) as zf:
+                n += sum(1 for i in zf.infolist()
+                         if not i.is_dir() and is_image(i.filename) and i.file_size <= max_bytes)
+        elif is_archive(name):
+            with tarfile.open(p) as tf:
+                n += sum(1 for m in tf if m.isfile() and is_image(m.name) and m.size <= max_bytes)
+        elif p.stat().st_size <= max_bytes:
+            n += 1
+    return n
+
+@app.post("/api/vision/analyze/batch")
+async def api_vision_batch(
+    prompt: str = Form(default="请描述这张图，并提取关键信息。"),
+    images: list[UploadFile] = File(...),
+):
+    """Analyze many images (or zip/tar archives of images); results stream back as SSE as they finish."""
+    try:
+        provider, client = get_vision_client()
     except Exception as e:
         return json_error(str(e), "VISION", 400)
+    max_bytes = settings.MAX_UPLOAD_MB * 1024 * 1024
+    try:
+        staging, paths, total = await run_in_threadpool(_stage_vision_batch, images, max_bytes)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        return json_error(f"Bad archive: {e}", "VALIDATION", 400)
+    if total == 0 or total > settings.VISION_BATCH_MAX_IMAGES:
+        shutil.rmtree(staging, ignore_errors=True)
+        if total == 0:
+            return json_error("No images found", "VALIDATION", 400)
+        return json_error(f"At most {settings.VISION_BATCH_MAX_IMAGES} images per batch", "LIMIT", 413)
+
+    async def gen():
+        yield sse({"ok": True, "type": "meta", "total": total, "provider": provider, "model": client.model,
+                   "concurrency": settings.VISION_CONCURRENCY}, event="meta")
+        t0 = time.perf_counter()
+        ok = failed = 0
+        stop = threading.Event()
+        results = vision_pipeline.analyze_many(
+            provider, client, _iter_vision_uploads(paths, max_bytes), prompt,
+            concurrency=settings.VISION_CONCURRENCY, retries=settings.VISION_RETRIES, stop=stop,
+        )
+        try:
+            async for i, name, res, err in iterate_in_threadpool(results):
+                if err is None:
+                    ok += 1
+                    yield sse({"ok": True, "type": "result", "index": i, "name": name, **res.to_dict()}, event="result")
+                else:
+                    failed += 1
+                    yield sse({"ok": False, "type": "error", "index": i, "name": name, "error": err}, event="error")
+        finally:
+            # on client disconnect: stop feeding images to the provider
+            stop.set()
+            try:
+                results.close()
+            except ValueError:
+                pass  # still running in a worker thread; `stop` ends it after the current wait
+        yield sse({"ok": True, "type": "done", "total": total, "succeeded": ok, "failed": failed,
+                   "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}, event="done")
+
+    # the staged copies are removed once the stream has ended, also when the client went away
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             background=BackgroundTask(shutil.rmtree, staging, ignore_errors=True))
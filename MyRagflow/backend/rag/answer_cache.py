@@ -0,0 +1,93 @@
+from __future__ import annotations
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: list[dict]
+    version: int | tuple[int, ...]
+    expires_at: float
+
+def normalize_message(text: str) -> str:
+    # NFKC folds full-width forms; case and whitespace runs don't change the question
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+def answer_key(kb_id: str | tuple[str, ...], message: str, history: list[dict], top_k: int, mode: str,
+               model: str) -> str:
+    payload = json.dumps(
+        [kb_id, normalize_message(message),
+         [[m["role"], normalize_message(m["content"])] for m in history], int(top_k), mode, model],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """In-process LRU of finished chat answers and their sources, with a TTL.
+
+    Each entry remembers the KB content version it was produced against; a lookup
+    with a different version is a miss and drops the entry, so ingest, delete and
+    rebuild invalidate every cached answer of that KB without a scan. Answers over
+    several KBs use a tuple of their ids and a tuple of their versions.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self._items: OrderedDict[str, tuple[tuple[str, ...], CachedAnswer]] = OrderedDict()  # key -> (kb_ids, entry)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: str, version: int | tuple[int, ...]) -> CachedAnswer | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                entry = item[1]
+                if entry.version == version and entry.expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self._items[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, kb_id: str | tuple[str, ...], version: int | tuple[int, ...], answer: str,
+            sources: list[dict]):
+        if self.max_entries == 0:
+            return
+        entry = CachedAnswer(answer, sources, version, time.monotonic() + self.ttl_s)
+        owners = (kb_id,) if isinstance(kb_id, str) else tuple(kb_id)
+        with self._lock:
+            self._items[key] = (owners, entry)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, kb_id: str):
+        with self._lock:
+            for key in [k for k, (owners, _) in self._items.items() if kb_id in owners]:
+                del self._items[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
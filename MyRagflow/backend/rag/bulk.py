@@ -0,0 +1,182 @@
+from __future__ import annotations
+import os
+import shutil
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from .embeddings import Embeddings
+from .images import IMAGE_EXTS, ImageCaptioner
+from .ingest import Progress, _noop_progress, parse_document, parse_with_captions, sniff_mime, write_documents
+from .parsers import PARSE_WORKERS, parse_pool
+from .store import NewDoc, job_payload_path
+
+# Documents are buffered until they hold this many chunks, then embedded in one
+# call and written (DB + index) in one transaction.
+BULK_BATCH_CHUNKS = int(os.getenv("BULK_BATCH_CHUNKS", "2048"))
+DOC_EXTS = {"pdf", "docx", "txt", "md", "csv"}
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+def _has_ext(name: str, exts: set[str]) -> bool:
+    base = os.path.basename(name)
+    if not base or base.startswith(".") or "__MACOSX" in name:
+        return False
+    return base.rsplit(".", 1)[-1].lower() in exts if "." in base else False
+
+def is_document(name: str, images: bool = True) -> bool:
+    # images are ingested through vision captions (see rag.images), so only when a captioner is available
+    return _has_ext(name, DOC_EXTS | IMAGE_EXTS if images else DOC_EXTS)
+
+def is_image(name: str) -> bool:
+    return _has_ext(name, IMAGE_EXTS)
+
+def iter_archive(path: Path | BinaryIO, max_bytes: int, accept: Callable[[str], bool] = is_document,
+                 name: str | None = None) -> Iterator[tuple[str, bytes]]:
+    """Yield (member name, bytes) for accepted members of a zip/tar, without extracting to disk.
+
+    `path` may also be an open binary file, in which case `name` gives the archive's file name.
+    """
+    name = (name or getattr(path, "name", None) or "").lower()
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and accept(info.filename) and info.file_size <= max_bytes:
+                    yield info.filename, zf.read(info)
+        return
+    with (tarfile.open(path) if isinstance(path, Path) else tarfile.open(fileobj=path)) as tf:
+        for m in tf:
+            if m.isfile() and accept(m.name) and m.size <= max_bytes:
+                f = tf.extractfile(m)
+                if f is not None:
+                    yield m.name, f.read()
+
+def iter_files(paths: Iterable[Path], max_bytes: int, images: bool = True) -> Iterator[tuple[str, bytes]]:
+    """Expand archives and skip unsupported files (and images unless `images`); contents are read lazily."""
+    accept = partial(is_document, images=images)
+    for p in paths:
+        if is_archive(p.name):
+            yield from iter_archive(p, max_bytes, accept)
+        elif accept(p.name) and p.stat().st_size <= max_bytes:
+            yield p.name, p.read_bytes()
+
+def walk_dir(root: Path, images: bool = True) -> list[Path]:
+    return sorted(p for p in root.rglob("*")
+                  if p.is_file() and (is_archive(p.name) or is_document(p.name, images)))
+
+def ingest_many(
+    kb_id: str,
+    files: Iterable[tuple[str, bytes]],
+    embeddings: Embeddings,
+    chunk_size: int,
+    overlap: int,
+    total: int = 0,
+    progress: Progress | None = None,
+    on_doc: Callable[[str, str | None], None] | None = None,
+    captioner: ImageCaptioner | None = None,
+) -> dict:
+    """Ingest many files: parse concurrently, embed across documents, append to the index per batch.
+
+    Files are parsed on the shared parse pool with a bounded number in flight.
+    With a captioner, images and embedded figures are captioned alongside, and
+    enough documents are kept in flight to keep the vision calls busy.
+    Failures are reported per file and do not stop the run.
+    """
+    progress = progress or _noop_progress
+    pool = parse_pool()
+    window = 2 * max(1, PARSE_WORKERS)
+    captioning = None
+    if captioner is not None:
+        window = max(window, 2 * captioner.concurrency)
+        captioning = ThreadPoolExecutor(max_workers=window, thread_name_prefix="bulk-doc")
+    inflight: deque = deque()
+    pending: list[NewDoc] = []
+    res = {"docs": 0, "chunks": 0, "batches": 0, "failed": []}
+    seen = 0
+
+    def fail(name: str, err: str):
+        res["failed"].append({"filename": name, "error": err})
+        if on_doc:
+            on_doc(name, err)
+
+    def flush():
+        batch = list(pending)
+        pending.clear()
+        try:
+            vectors = embeddings.embed_texts([c for d in batch for c in d.chunks])
+            write_documents(kb_id, batch, vectors)
+        except Exception as e:
+            for d in batch:
+                fail(d.filename, str(e))
+            return
+        res["docs"] += len(batch)
+        res["chunks"] += sum(len(d.chunks) for d in batch)
+        res["batches"] += 1
+        if on_doc:
+            for d in batch:
+                on_doc(d.filename, None)
+
+    def drain_one():
+        nonlocal seen
+        name, mime, size, fut = inflight.popleft()
+        seen += 1
+        try:
+            chunks, pages, spans = fut.result()
+        except Exception as e:
+            fail(name, str(e))
+            return
+        if not chunks:
+            fail(name, "no text extracted")
+            return
+        pending.append(NewDoc(name, mime, size, chunks, pages, spans))
+        if sum(len(d.chunks) for d in pending) >= BULK_BATCH_CHUNKS:
+            flush()
+        if total:
+            progress("ingest", 0.95 * min(seen, total) / total)
+
+    try:
+        for name, content in files:
+            mime = sniff_mime(name, None)
+            if captioning is not None:
+                fut = captioning.submit(parse_with_captions, pool, captioner, name, mime, content,
+                                        chunk_size, overlap)
+            else:
+                fut = pool.submit(parse_document, name, mime, content, chunk_size, overlap)
+            inflight.append((name, mime, len(content), fut))
+            if len(inflight) >= window:
+                drain_one()
+        while inflight:
+            drain_one()
+        if pending:
+            flush()
+    finally:
+        if captioning is not None:
+            captioning.shutdown(wait=False, cancel_futures=True)
+    return res
+
+def run_bulk_job(job: dict, progress: Progress, embeddings: Embeddings, max_bytes: int,
+                 captioner: ImageCaptioner | None = None) -> dict:
+    """JobQueue handler for kind="bulk": the payload is a directory of uploaded files/archives."""
+    p = job["params"]
+    root = job_payload_path(job["kb_id"], job["job_id"])
+    try:
+        images = captioner is not None
+        paths = walk_dir(root, images)
+        return ingest_many(
+            job["kb_id"],
+            iter_files(paths, max_bytes, images),
+            embeddings,
+            chunk_size=int(p["chunk_size"]),
+            overlap=int(p["chunk_overlap"]),
+            total=len(paths) if not any(is_archive(x.name) for x in paths) else 0,
+            progress=progress,
+            captioner=captioner,
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
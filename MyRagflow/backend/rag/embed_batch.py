@@ -0,0 +1,146 @@
+from __future__ import annotations
+import email.utils
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import openai
+
+from utils.text_splitter import estimate_tokens
+
+# OpenAI's embeddings endpoint takes at most 2048 inputs and ~300k tokens per
+# request; smaller token budgets give more requests to spread over connections.
+MAX_BATCH_ITEMS = 2048
+DEFAULT_BATCH_TOKENS = 32_000
+
+def pack_batches(texts: list[str], max_tokens: int, max_items: int = MAX_BATCH_ITEMS) -> list[tuple[int, int]]:
+    """Split texts into consecutive [start, end) batches under a token budget and an item cap.
+
+    A single text larger than the budget gets a batch of its own.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, t in enumerate(texts):
+        n = estimate_tokens(t)
+        if i > start and (tokens + n > max_tokens or i - start >= max_items):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+def _retry_after(e: Exception) -> float | None:
+    resp = getattr(e, "response", None)
+    value = resp.headers.get("retry-after") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+class OpenAIBatchEmbedder:
+    """Token-packed, concurrent calls to an OpenAI-compatible embeddings endpoint.
+
+    Batches run on `concurrency` threads sharing the client's connection pool.
+    The number actually in flight adapts: it halves on a 429 (and all callers
+    pause for Retry-After) and grows back by one per window of successes.
+    Transient errors are retried with jittered exponential backoff. Results land
+    at their input positions, so order is kept.
+    """
+
+    def __init__(self, client: openai.OpenAI, model: str, max_tokens: int = DEFAULT_BATCH_TOKENS,
+                 concurrency: int = 4, max_retries: int = 6, backoff_s: float = 0.5):
+        self.client = client
+        self.model = model
+        self.max_tokens = max(1, max_tokens)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        self._cond = threading.Condition()
+        self._limit = self.concurrency
+        self._active = 0
+        self._ok_streak = 0
+        self._resume_at = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        batches = pack_batches(texts, self.max_tokens)
+        if len(batches) == 1:
+            parts = [self._call(texts)]
+        else:
+            parts = list(self._pool.map(lambda b: self._call(texts[b[0]:b[1]]), batches))
+        out = np.empty((len(texts), parts[0].shape[1]), dtype=np.float32)
+        for (start, end), part in zip(batches, parts):
+            out[start:end] = part
+        return out
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait <= 0 and self._active < self._limit:
+                    self._active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def _release(self, throttled_for: float | None = None):
+        with self._cond:
+            self._active -= 1
+            if throttled_for is not None:
+                self.rate_limited += 1
+                self._limit = max(1, self._limit // 2)
+                self._ok_streak = 0
+                self._resume_at = max(self._resume_at, time.monotonic() + throttled_for)
+            else:
+                self._ok_streak += 1
+                if self._ok_streak >= self._limit and self._limit < self.concurrency:
+                    self._limit += 1
+                    self._ok_streak = 0
+            self._cond.notify_all()
+
+    def _call(self, batch: list[str]) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                resp = self.client.embeddings.create(model=self.model, input=batch)
+            except openai.RateLimitError as e:
+                # never sooner than the server asks; jitter so batches don't retry in lockstep
+                delay = (_retry_after(e) or 0.0) + self.backoff_s * (2 ** attempt) * random.random()
+                self._release(throttled_for=min(delay, 60.0))
+                if attempt == self.max_retries:
+                    raise
+            except (openai.APIConnectionError, openai.InternalServerError):
+                self._release()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(min(self.backoff_s * (2 ** attempt) * (0.5 + random.random()), 60.0))
+            except BaseException:
+                self._release()
+                raise
+            else:
+                self._release()
+                with self._cond:
+                    self.requests += 1
+                # the API may return items out of order; `index` is authoritative
+                data = sorted(resp.data, key=lambda d: d.index)
+                return np.asarray([d.embedding for d in data], dtype=np.float32)
+            with self._cond:
+                self.retries += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "concurrency": self.concurrency,
+                "effective_concurrency": self._limit,
+                "batch_tokens": self.max_tokens,
+            }
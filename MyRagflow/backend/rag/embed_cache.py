@@ -0,0 +1,130 @@
+from __future__ import annotations
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+_LOOKUP_BATCH = 500  # stay under SQLite's bound-variable limit
+# last_used is only rewritten once it is this stale, so hot lookups stay read-only
+TOUCH_INTERVAL_S = 3600
+
+class EmbeddingCache:
+    """Persistent content-addressed store of embedding vectors.
+
+    Keys are (provider, endpoint, model, sha256(text)); vectors are kept as raw
+    float32 blobs in a single SQLite file shared by ingest, rebuild and query.
+    When the stored bytes exceed `max_bytes`, the least recently used rows are
+    evicted; recency is tracked to within TOUCH_INTERVAL_S.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS vectors (
+          key TEXT PRIMARY KEY,
+          dim INTEGER NOT NULL,
+          vec BLOB NOT NULL,
+          last_used INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_last_used ON vectors(last_used)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM vectors").fetchone()
+        self._bytes = int(row[0])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(provider: str, model: str, text: str, endpoint: str = "") -> str:
+        # the same model name can be served by different endpoints (self-hosted, proxies) with other vectors;
+        # the provider's default endpoint keeps the plain key
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        source = f"{provider}@{endpoint}" if endpoint else provider
+        return f"{source}:{model}:{digest}"
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        uniq = list(dict.fromkeys(keys))
+        now = int(time.time())
+        stale: list[tuple[int, str]] = []
+        with self._lock:
+            for i in range(0, len(uniq), _LOOKUP_BATCH):
+                part = uniq[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join(["?"] * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vec, last_used FROM vectors WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for k, blob, last_used in rows:
+                    found[k] = np.frombuffer(blob, dtype="<f4")
+                    if last_used < now - TOUCH_INTERVAL_S:
+                        stale.append((now, k))
+            if stale:
+                self._conn.executemany("UPDATE vectors SET last_used=? WHERE key=?", stale)
+                self._conn.commit()
+            hit = sum(1 for k in keys if k in found)
+            self.hits += hit
+            self.misses += len(keys) - hit
+        return found
+
+    def put_many(self, items: list[tuple[str, np.ndarray]]):
+        if not items:
+            return
+        now = int(time.time())
+        rows = []
+        for k, v in items:
+            v = np.ascontiguousarray(v, dtype="<f4")
+            rows.append((k, int(v.shape[0]), v.tobytes(), now))
+        with self._lock:
+            # a key's vector never changes, so existing rows are kept and only new bytes are counted
+            for r in rows:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO vectors(key, dim, vec, last_used) VALUES(?,?,?,?)", r
+                )
+                if cur.rowcount == 1:
+                    self._bytes += len(r[2])
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # trim to 90% of the budget so eviction isn't triggered on every insert
+        target = int(self.max_bytes * 0.9)
+        # other processes share the file: start from the stored size, not this process's count
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM vectors").fetchone()
+        self._bytes = int(row[0])
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vec) FROM vectors ORDER BY last_used ASC LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            drop = []
+            for k, n in rows:
+                drop.append((k,))
+                self._bytes -= int(n)
+                if self._bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM vectors WHERE key=?", drop)
+            self.evictions += len(drop)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
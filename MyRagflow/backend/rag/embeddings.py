@@ -1,53 +1,138 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from pathlib import Path
+import logging
+import threading
+import time
 import numpy as np
 from openai import OpenAI
 
+from utils.metrics import timed
+from .embed_cache import EmbeddingCache
+from .embed_batch import DEFAULT_BATCH_TOKENS, OpenAIBatchEmbedder
+
+log = logging.getLogger(__name__)
+
 @dataclass
 class EmbeddingsConfig:
     provider: str  # openai | local
     openai_api_key: str | None
     openai_model: str
     local_model: str
+    cache_path: str | None = None  # sqlite file for the embedding cache; None disables it
+    cache_max_mb: int = 1024
+    openai_base_url: str | None = None  # OpenAI-compatible embeddings server
+    batch_tokens: int = DEFAULT_BATCH_TOKENS
+    concurrency: int = 4
+    max_retries: int = 6
+    local_batch_size: int = 256
+    local_threads: int | None = None   # onnxruntime intra-op threads; None = runtime default
+    local_parallel: int | None = None  # fastembed data-parallel workers; 0 = all cores, None = off
+    local_parallel_min: int = 1024     # smaller inputs stay in-process (worker start-up dominates)
 
 class Embeddings:
     def __init__(self, cfg: EmbeddingsConfig):
         self.cfg = cfg
         self._openai = None
+        self._init_lock = threading.Lock()
         self._local = None
+        self.cache = EmbeddingCache(Path(cfg.cache_path), cfg.cache_max_mb * 1024 * 1024) if cfg.cache_path else None
 
     def embed_texts(self, texts: list[str]) -> np.ndarray:
+        with timed("embed"):
+            return self._embed_texts(texts)
+
+    def _embed_texts(self, texts: list[str]) -> np.ndarray:
         texts = [t.strip() for t in texts if (t or "").strip()]
         if not texts:
             return np.zeros((0, 1), dtype=np.float32)
+        if self.cache is None:
+            with timed("embed_provider"):
+                return self._embed_provider(texts)
+
+        model, endpoint = self._model_name(), self._endpoint()
+        keys = [EmbeddingCache.key(self.cfg.provider, model, t, endpoint) for t in texts]
+        found = self.cache.get_many(keys)
+        # only unseen texts go to the provider, deduplicated and in one batched call
+        missing: dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in found and k not in missing:
+                missing[k] = t
+        if missing:
+            with timed("embed_provider"):
+                vecs = self._embed_provider(list(missing.values()))
+            fresh = list(zip(missing.keys(), vecs))
+            self.cache.put_many(fresh)
+            found.update(fresh)
 
+        dim = len(found[keys[0]])
+        out = np.empty((len(texts), dim), dtype=np.float32)
+        for i, k in enumerate(keys):
+            out[i] = found[k]
+        return out
+
+    def cache_stats(self) -> dict | None:
+        return self.cache.stats() if self.cache is not None else None
+
+    def provider_stats(self) -> dict | None:
+        return self._openai.stats() if self._openai is not None else None
+
+    def _model_name(self) -> str:
+        if self.cfg.provider == "openai":
+            return self.cfg.openai_model
+        return (self.cfg.local_model or "").strip() or "default"
+
+    def _endpoint(self) -> str:
+        if self.cfg.provider == "openai":
+            return (self.cfg.openai_base_url or "").rstrip("/")
+        return ""
+
+    def _embed_provider(self, texts: list[str]) -> np.ndarray:
         if self.cfg.provider == "openai":
             self._ensure_openai()
-            vectors = []
-            batch = 96
-            for i in range(0, len(texts), batch):
-                resp = self._openai.embeddings.create(
-                    model=self.cfg.openai_model,
-                    input=texts[i:i+batch],
-                )
-                for item in resp.data:
-                    vectors.append(item.embedding)
-            return np.array(vectors, dtype=np.float32)
+            return self._openai.embed(texts)
 
-        # local (fastembed)
+        # local (fastembed): the generator of (dim,) rows is copied straight into one float32 block
         self._ensure_local()
-        # fastembed returns generator of np.ndarray (dim,)
-        arr = np.array(list(self._local.embed(texts)), dtype=np.float32)
-        return arr
+        parallel = self.cfg.local_parallel if len(texts) >= self.cfg.local_parallel_min else None
+        rows = iter(self._local.embed(texts, batch_size=self.cfg.local_batch_size, parallel=parallel))
+        first = next(rows)
+        out = np.empty((len(texts), first.shape[-1]), dtype=np.float32)
+        out[0] = first
+        for i, row in enumerate(rows, start=1):
+            out[i] = row
+        return out
+
+    def warmup(self):
+        """Load the local model and run one inference so the first real request doesn't pay for it."""
+        if self.cfg.provider == "openai":
+            return
+        t0 = time.perf_counter()
+        try:
+            self._embed_provider(["warm-up"])
+        except Exception:
+            log.exception("embedding warm-up failed")
+            return
+        log.info("local embedding model ready in %.1fs", time.perf_counter() - t0)
 
     def _ensure_openai(self):
-        if self._openai is None:
-            if not self.cfg.openai_api_key:
-                raise RuntimeError("OPENAI_API_KEY is required for openai embeddings")
-            self._openai = OpenAI(api_key=self.cfg.openai_api_key)
+        with self._init_lock:
+            if self._openai is None:
+                if not self.cfg.openai_api_key:
+                    raise RuntimeError("OPENAI_API_KEY is required for openai embeddings")
+                kwargs = {"api_key": self.cfg.openai_api_key, "max_retries": 0}  # retries are ours
+                if self.cfg.openai_base_url:
+                    kwargs["base_url"] = self.cfg.openai_base_url.rstrip("/")
+                self._openai = OpenAIBatchEmbedder(
+                    OpenAI(**kwargs), self.cfg.openai_model,
+                    max_tokens=self.cfg.batch_tokens, concurrency=self.cfg.concurrency,
+                    max_retries=self.cfg.max_retries,
+                )
 
     def _ensure_local(self):
-        if self._local is None:
-            from fastembed import TextEmbedding
-            name = (self.cfg.local_model or "").strip()
-            self._local = TextEmbedding(name) if name else TextEmbedding()
+        with self._init_lock:
+            if self._local is None:
+                from fastembed import TextEmbedding
+                name = (self.cfg.local_model or "").strip()
+                kwargs = {"threads": self.cfg.local_threads}
+                self._local = TextEmbedding(name, **kwargs) if name else TextEmbedding(**kwargs)
@@ -0,0 +1,36 @@
+from __future__ import annotations
+import re
+
+# CJK ideographs, kana and hangul: FTS5's unicode61 tokenizer would glue a whole
+# run into one token, so each character is indexed as its own token instead.
+_CJK = "㐀-䶿一-鿿豈-﫿぀-ヿ가-힯"
+_CJK_CHAR = re.compile(f"([{_CJK}])")
+_QUERY_PIECE = re.compile(f"[{_CJK}]+|[^\\s{_CJK}]+")
+_HAS_WORD = re.compile(r"\w")
+
+FTS_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '_'"
+MAX_QUERY_TERMS = 32
+
+def fts_prep(text: str | None) -> str:
+    """Text as stored in chunks_fts (registered as the SQL function fts_prep)."""
+    return _CJK_CHAR.sub(r" \1 ", text or "")
+
+def _phrase(s: str) -> str:
+    return '"' + fts_prep(s).replace('"', '""') + '"'
+
+def fts_query(query: str) -> str:
+    """Build an FTS5 MATCH expression from free text.
+
+    Latin words and identifiers (E-1042, part_no) become exact phrases; CJK runs
+    are split into overlapping bigram phrases. Terms are OR-ed and ranked by BM25.
+    """
+    terms: list[str] = []
+    for piece in _QUERY_PIECE.findall(query or ""):
+        if _CJK_CHAR.match(piece):
+            if len(piece) == 1:
+                terms.append(_phrase(piece))
+            else:
+                terms.extend(_phrase(piece[i:i + 2]) for i in range(len(piece) - 1))
+        elif _HAS_WORD.search(piece):
+            terms.append(_phrase(piece))
+    return " OR ".join(dict.fromkeys(terms[:MAX_QUERY_TERMS]))
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import hashlib
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from pypdf import PdfReader
+
+from .parsers import Segment
+
+log = logging.getLogger(__name__)
+
+IMAGE_EXTS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tif", "tiff"}
+# embedded images smaller than this are icons, bullets and rules, not figures
+IMAGE_MIN_BYTES = int(os.getenv("INGEST_IMAGE_MIN_BYTES", "4096"))
+MAX_IMAGES_PER_DOC = int(os.getenv("INGEST_MAX_IMAGES_PER_DOC", "200"))
+
+DEFAULT_CAPTION_PROMPT = "请用中文详细描述这张图片，完整提取其中的文字、数字、表格和图示信息，用于知识库检索。"
+
+# (page or None, name, image bytes)
+ImageRef = tuple[int | None, str, bytes]
+
+def is_image_name(filename: str) -> bool:
+    return "." in filename and filename.rsplit(".", 1)[-1].lower() in IMAGE_EXTS
+
+def extract_pdf_images(content: bytes) -> list[ImageRef]:
+    out: list[ImageRef] = []
+    reader = PdfReader(io.BytesIO(content))
+    for i, page in enumerate(reader.pages, start=1):
+        try:
+            images = page.images
+            for img in images:
+                data = img.data
+                if len(data) >= IMAGE_MIN_BYTES:
+                    out.append((i, img.name, data))
+        except Exception as e:  # unsupported filters / broken XObjects: keep the text
+            log.warning("skipping images on pdf page %d: %s", i, e)
+        if len(out) >= MAX_IMAGES_PER_DOC:
+            break
+    return out[:MAX_IMAGES_PER_DOC]
+
+def extract_docx_images(content: bytes) -> list[ImageRef]:
+    out: list[ImageRef] = []
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        for info in zf.infolist():
+            if (info.filename.startswith("word/media/") and is_image_name(info.filename)
+                    and info.file_size >= IMAGE_MIN_BYTES):
+                out.append((None, os.path.basename(info.filename), zf.read(info)))
+            if len(out) >= MAX_IMAGES_PER_DOC:
+                break
+    return out
+
+class ImageCaptioner:
+    """Turns images into text segments through a vision model so they can be chunked and embedded.
+
+    All callers share one thread pool of `concurrency` provider calls. Identical
+    images inside a document are sent once, and VisionPipeline's result cache
+    (keyed by image hash + prompt) covers repeats across documents.
+    `client_factory` returns (provider, client), as `get_vision_client` in main does.
+    """
+
+    def __init__(self, pipeline, client_factory: Callable[[], tuple[str, object]],
+                 prompt: str = DEFAULT_CAPTION_PROMPT, concurrency: int = 4, retries: int = 2):
+        self.pipeline = pipeline
+        self.client_factory = client_factory
+        self.prompt = prompt
+        self.retries = retries
+        self.concurrency = max(1, concurrency)
+        self._calls = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="caption")
+
+    def caption(self, images: list[ImageRef], strict: bool = False) -> list[Segment]:
+        """Caption images concurrently, in input order.
+
+        With strict=False (figures inside a document) a missing provider or a
+        failed image is logged and skipped; with strict=True it raises.
+        """
+        if not images:
+            return []
+        try:
+            provider, client = self.client_factory()
+        except Exception as e:
+            if strict:
+                raise ValueError(f"图片入库需要可用的视觉模型: {e}") from e
+            log.warning("vision provider unavailable, %d embedded images skipped: %s", len(images), e)
+            return []
+
+        hashes = [hashlib.sha256(data).hexdigest() for _, _, data in images]
+        futures = {}
+        for h, (_, _, data) in zip(hashes, images):
+            if h not in futures:
+                futures[h] = self._calls.submit(
+                    self.pipeline.analyze_retrying, provider, client, data, self.prompt, self.retries
+                )
+        out: list[Segment] = []
+        seen: set[str] = set()
+        for h, (page, name, _) in zip(hashes, images):
+            if h in seen:
+                continue  # a repeated logo/diagram becomes one chunk, at its first page
+            seen.add(h)
+            try:
+                text = futures[h].result().text.strip()
+            except Exception as e:
+                if strict:
+                    raise
+                log.warning("caption failed for %s: %s", name, e)
+                continue
+            if text:
+                out.append(Segment(page, f"[图片 {name}]\n{text}"))
+        return out
+
+    def caption_document(self, kind: str, content: bytes) -> list[Segment]:
+        """Captions for the figures embedded in a pdf/docx (empty for other kinds)."""
+        try:
+            if kind == "pdf":
+                images = extract_pdf_images(content)
+            elif kind == "docx":
+                images = extract_docx_images(content)
+            else:
+                return []
+        except Exception as e:
+            log.warning("image extraction failed: %s", e)
+            return []
+        return self.caption(images)
@@ -1,66 +1,738 @@
 from __future__ import annotations
+import os
 import json
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 import faiss
 from pathlib import Path
-from filelock import FileLock
 
-from .store import faiss_path, lock_path, count_chunks, fetch_chunks_by_ord, set_kv, get_kv
+from utils.metrics import timed
+from .store import faiss_path, vectors_path, kb_lock, list_vector_ords, set_kv, get_kv, bump_content_version
 from .embeddings import Embeddings
 
+# Memory budget for indexes kept in RAM across requests (per process).
+INDEX_CACHE_MB = int(os.getenv("INDEX_CACHE_MB", "1024"))
+# "auto" policy: flat below the first threshold, HNSW up to the second, IVF above.
+INDEX_ANN_THRESHOLD = int(os.getenv("INDEX_ANN_THRESHOLD", "50000"))
+INDEX_IVF_THRESHOLD = int(os.getenv("INDEX_IVF_THRESHOLD", "2000000"))
+# Serve reads from a read-only memory map of index.faiss instead of a private heap copy:
+# worker processes share the OS page cache and cold loads don't read the whole file.
+INDEX_MMAP = os.getenv("INDEX_MMAP", "0").strip().lower() in ("1", "true", "yes", "on")
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "ivfpq")
+# vector codes kept by flat / HNSW / IVF indexes (IVF-PQ always stores PQ codes)
+STORAGE_TYPES = ("float32", "float16", "sq8")
+# SQ8 learns a per-dimension range; below this many vectors the KB stays float32
+SQ8_MIN_TRAIN = 1000
+# an IVF index is retrained once the KB wants this many times the trained number of lists
+NLIST_RETRAIN_FACTOR = 4
+DEFAULT_INDEX_PARAMS = {
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "nlist": None,   # None: ~4*sqrt(n), bounded by the training sample
+    "nprobe": 16,
+    "pq_m": None,    # None: largest of 64/48/32/16/8 dividing dim
+    "pq_bits": 8,
+    "storage": "float32",
+    "rescore": 0,    # >0: re-rank a rescore*k shortlist by exact float32 inner product
+}
+
+class IndexCache:
+    """Process-wide LRU of loaded FAISS indexes, bounded by an approximate byte budget.
+
+    Entries are validated against a stamp (file mtime/size + the `index_generation`
+    counter in the KB's kv table), so writes from other workers are picked up.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: OrderedDict[str, tuple] = OrderedDict()  # kb_id -> (index, stamp, nbytes)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kb_id: str, stamp: tuple):
+        with self._lock:
+            item = self._items.get(kb_id)
+            if item is not None and item[1] == stamp:
+                self._items.move_to_end(kb_id)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                self._drop(kb_id)
+            self.misses += 1
+            return None
+
+    def put(self, kb_id: str, index, stamp: tuple, nbytes: int):
+        with self._lock:
+            if kb_id in self._items:
+                self._drop(kb_id)
+            if nbytes > self.max_bytes:
+                return
+            self._items[kb_id] = (index, stamp, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._items:
+                oldest = next(iter(self._items))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, kb_id: str):
+        with self._lock:
+            self._drop(kb_id)
+
+    def _drop(self, kb_id: str):
+        item = self._items.pop(kb_id, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+_cache = IndexCache(INDEX_CACHE_MB * 1024 * 1024)
+
 def _normalize(v: np.ndarray) -> np.ndarray:
     norms = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
     return (v / norms).astype(np.float32)
 
-def load_index(kb_id: str):
+def _index_policy(kb_id: str) -> tuple[str, dict]:
+    kind = get_kv(kb_id, "index_kind") or "auto"
+    params = dict(DEFAULT_INDEX_PARAMS)
+    raw = get_kv(kb_id, "index_params")
+    if raw:
+        params.update(json.loads(raw))
+    return kind, params
+
+def _resolve_kind(kind: str, n: int) -> str:
+    if kind != "auto":
+        return kind
+    if n >= INDEX_IVF_THRESHOLD:
+        return "ivf"
+    if n >= INDEX_ANN_THRESHOLD:
+        return "hnsw"
+    return "flat"
+
+def _stamp(kb_id: str):
+    p = faiss_path(kb_id)
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, get_kv(kb_id, "index_generation") or "0")
+
+def _bump_generation(kb_id: str):
+    gen = int(get_kv(kb_id, "index_generation") or 0) + 1
+    set_kv(kb_id, "index_generation", str(gen))
+
+def _publish(kb_id: str, index):
+    # called under the KB lock right after save_index
+    _bump_generation(kb_id)
+    stamp = _stamp(kb_id)
+    if stamp is None or INDEX_MMAP:
+        # mmap mode: readers map the new file on their next query rather than keep the writer's heap copy
+        _cache.invalidate(kb_id)
+        return
+    _cache.put(kb_id, index, stamp, stamp[1])
+
+def _nlist(n: int, params: dict) -> int:
+    if params.get("nlist"):
+        return int(params["nlist"])
+    # faiss wants ~39 training points per centroid
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def _pq_m(dim: int, params: dict) -> int:
+    if params.get("pq_m"):
+        return int(params["pq_m"])
+    for m in (64, 48, 32, 16, 8):
+        if dim % m == 0 and m <= dim // 2:
+            return m
+    return 1
+
+_SQ_CODES = {"float16": "SQfp16", "sq8": "SQ8"}
+
+def _factory_string(kind: str, dim: int, n: int, params: dict, storage: str = "float32") -> str:
+    # vectors are addressed by chunks.vector_ord, not by insertion position
+    sq = _SQ_CODES.get(storage)
+    if kind == "flat":
+        return f"IDMap2,{sq}" if sq else "IDMap2,Flat"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{int(params['hnsw_m'])}" + (f"_{sq}" if sq else "")
+    if kind == "ivf":
+        return f"IDMap2,IVF{_nlist(n, params)},{sq or 'Flat'}"
+    if kind == "ivfpq":
+        return f"IDMap2,IVF{_nlist(n, params)},PQ{_pq_m(dim, params)}x{int(params['pq_bits'])}"
+    raise ValueError(f"unknown index kind: {kind}")
+
+def _new_index(dim: int):
+    return faiss.index_factory(dim, _factory_string("flat", dim, 0, DEFAULT_INDEX_PARAMS), faiss.METRIC_INNER_PRODUCT)
+
+def _kind_of(idx) -> str:
+    inner = faiss.downcast_index(idx.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def _codes_index(idx):
+    inner = faiss.downcast_index(idx.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    return inner
+
+def _storage_of(idx) -> str:
+    codes = _codes_index(idx)
+    if isinstance(codes, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+def _storage_for(kind: str, n: int, params: dict) -> str:
+    if kind == "ivfpq":
+        return "pq"
+    storage = params.get("storage") or "float32"
+    if storage == "sq8" and n < SQ8_MIN_TRAIN:
+        return "float32"
+    return storage
+
+def _code_size(idx) -> int:
+    """Bytes per stored vector code (ids, graph links and centroids not included)."""
+    return int(getattr(_codes_index(idx), "code_size", idx.d * 4))
+
+def _keeps_float32(params: dict) -> bool:
+    # compressed KBs keep an exact copy so rescoring (and later rebuilds) don't compound the loss
+    return (params.get("storage") or "float32") != "float32" or int(params.get("rescore") or 0) > 0
+
+def _apply_search_params(idx, params: dict):
+    inner = faiss.downcast_index(idx.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(params["ef_search"])
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = int(params["nprobe"])
+    return idx
+
+def _trainable_kind(kind: str, n: int, params: dict) -> str:
+    # fall back when there are too few points to train centroids / PQ codebooks
+    if kind == "ivfpq" and n < 39 * (1 << int(params["pq_bits"])):
+        kind = "ivf"
+    if kind == "ivf" and n < 39:
+        kind = "flat"
+    return kind
+
+def _outgrown(idx, params: dict) -> bool:
+    # IVF centroids are trained once; retrain when the KB has grown well past the nlist they were sized for
+    inner = faiss.downcast_index(idx.index)
+    return isinstance(inner, faiss.IndexIVF) and _nlist(idx.ntotal, params) >= NLIST_RETRAIN_FACTOR * inner.nlist
+
+def _build(kind: str, dim: int, ids: np.ndarray, vecs: np.ndarray, params: dict):
+    n = int(vecs.shape[0])
+    kind = _trainable_kind(kind, n, params)
+    idx = faiss.index_factory(dim, _factory_string(kind, dim, n, params, _storage_for(kind, n, params)),
+                              faiss.METRIC_INNER_PRODUCT)
+    inner = faiss.downcast_index(idx.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = int(params["ef_construction"])
+    if not idx.is_trained:
+        sample = vecs
+        limit = 256 * _nlist(n, params)
+        if n > limit:
+            rng = np.random.default_rng(0)
+            sample = vecs[rng.choice(n, size=limit, replace=False)]
+        idx.train(np.ascontiguousarray(sample))
+    if n:
+        idx.add_with_ids(np.ascontiguousarray(vecs), ids)
+    return _apply_search_params(idx, params)
+
+def _export(idx) -> tuple[np.ndarray, np.ndarray]:
+    """Return (ids, vectors) stored in an ID-mapped index, in internal order.
+
+    For PQ-compressed indexes the vectors are the (lossy) reconstructions.
+    """
+    n = idx.ntotal
+    ids = faiss.vector_to_array(idx.id_map).astype(np.int64)
+    if n == 0:
+        return ids, np.zeros((0, idx.d), dtype=np.float32)
+    inner = faiss.downcast_index(idx.index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+        try:
+            return ids, inner.reconstruct_n(0, n)
+        finally:
+            inner.set_direct_map_type(faiss.DirectMap.NoMap)
+    return ids, inner.reconstruct_n(0, n)
+
+def _export_exact(kb_id: str, idx) -> tuple[np.ndarray, np.ndarray]:
+    """Like `_export`, but with the exact float32 rows when the KB keeps a copy."""
+    ids = faiss.vector_to_array(idx.id_map).astype(np.int64)
+    vecs = _exact_rows(_read_vectors(kb_id, idx.d), ids)
+    return (ids, vecs) if vecs is not None else _export(idx)
+
+def _upgrade_legacy(kb_id: str, idx):
+    # Older KBs stored a plain IndexFlatIP where row i is the i-th chunk by vector_ord.
+    if isinstance(idx, faiss.IndexIDMap2):
+        return idx
+    ords = list_vector_ords(kb_id)
+    if len(ords) != idx.ntotal:
+        ords = list(range(idx.ntotal))
+    new = _new_index(idx.d)
+    if idx.ntotal:
+        new.add_with_ids(idx.reconstruct_n(0, idx.ntotal), np.asarray(ords, dtype=np.int64))
+    return new
+
+def _mmap_flags(kb_id: str) -> int:
+    """faiss read flags that map the index file instead of copying it (0 if unsupported).
+
+    Builds with IO_FLAG_MMAP_IFC (faiss >= 1.11, as pinned in requirements.txt)
+    map the vector storage of every kind. Older releases can only map IVF
+    inverted lists (IO_FLAG_MMAP, which fails on other kinds when combined with
+    IFC and searches slower), so there the flag follows the KB's active kind; a
+    stale kind only costs a copy, never a failed load.
+    """
+    read_only = getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if ifc:
+        return ifc | read_only
+    if (get_kv(kb_id, "index_kind_active") or "flat") in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP | read_only
+    return 0
+
+def _shared_bytes(idx) -> int:
+    # vector payload of a mapped index: lives in the page cache, not in this process's heap
+    return int(idx.ntotal) * _code_size(idx)
+
+def _read(kb_id: str, mmap: bool) -> tuple[object, bool]:
+    """(index, mapped); `mapped` indexes must never be written to."""
     p = faiss_path(kb_id)
     if not p.exists():
+        return None, False
+    flags = _mmap_flags(kb_id) if mmap else 0
+    with timed("index_load"):
+        raw = faiss.read_index(str(p), flags) if flags else faiss.read_index(str(p))
+        idx = _upgrade_legacy(kb_id, raw)
+    return _apply_search_params(idx, _index_policy(kb_id)[1]), bool(flags) and idx is raw
+
+def load_index(kb_id: str, mmap: bool = False):
+    """The KB's index from disk; a private, writable copy unless `mmap` (read-only use only)."""
+    return _read(kb_id, mmap)[0]
+
+def get_index(kb_id: str):
+    """Read-only access to the KB's index, served from the in-memory cache when fresh.
+
+    With INDEX_MMAP the index is memory-mapped; the cache then only charges the
+    part that is not shared (id map, graph links, centroids) against its budget.
+    """
+    stamp = _stamp(kb_id)
+    if stamp is None:
+        _cache.invalidate(kb_id)
         return None
-    return faiss.read_index(str(p))
+    idx = _cache.get(kb_id, stamp)
+    if idx is not None:
+        return idx
+    idx, mapped = _read(kb_id, INDEX_MMAP)
+    if idx is not None:
+        nbytes = max(0, stamp[1] - _shared_bytes(idx)) if mapped else stamp[1]
+        _cache.put(kb_id, idx, stamp, nbytes)
+    return idx
+
+def invalidate_index(kb_id: str):
+    _cache.invalidate(kb_id)
+
+def index_cache_stats() -> dict:
+    return {**_cache.stats(), "mmap": INDEX_MMAP}
+
+def _atomic_write(p: Path, write):
+    """Run write(tmp_path) and rename the result over `p`: readers (and their mmaps)
+    see the old file or the new one, never a mix."""
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(str(tmp))
+        fd = os.open(tmp, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, p)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
 
 def save_index(kb_id: str, index):
-    faiss.write_index(index, str(faiss_path(kb_id)))
+    _atomic_write(faiss_path(kb_id), lambda tmp: faiss.write_index(index, tmp))
+
+def _vector_dtype(dim: int) -> np.dtype:
+    # one record per vector, sorted by ord: the ord column is the sparse ord -> row table
+    return np.dtype([("ord", "<i8"), ("vec", "<f4", (dim,))])
+
+def _read_vectors(kb_id: str, dim: int):
+    """Read-only memmap of the KB's exact float32 vectors as (ord, vec) records, or None."""
+    try:
+        return np.memmap(vectors_path(kb_id), dtype=_vector_dtype(dim), mode="r")
+    except (FileNotFoundError, ValueError):  # missing, empty, or not a whole number of records
+        return None
+
+def _exact_rows(exact, ords: np.ndarray) -> np.ndarray | None:
+    """The exact vectors of `ords` (any shape), or None unless the copy holds every one.
+
+    A vectorised binary search over the sorted ord column: only the ~log2(n)
+    probed records are read, so the table is never loaded as a whole.
+    """
+    ords = np.asarray(ords, dtype=np.int64)
+    if exact is None or (ords.size and not len(exact)):
+        return None
+    keys = exact["ord"]
+    n = len(keys)
+    lo = np.zeros(ords.shape, dtype=np.int64)
+    hi = np.full(ords.shape, n, dtype=np.int64)
+    for _ in range(n.bit_length()):
+        active = lo < hi
+        mid = (lo + hi) // 2
+        less = keys[np.minimum(mid, n - 1)] < ords
+        lo = np.where(active & less, mid + 1, lo)
+        hi = np.where(active & ~less, mid, hi)
+    rows = np.minimum(lo, n - 1)
+    if (keys[rows] != ords).any():
+        return None
+    return np.asarray(exact["vec"][rows])
+
+def _write_vectors(kb_id: str, vectors: np.ndarray, ords: list[int]):
+    # under the KB lock; readers keep the length they mapped, so appended rows count as missing for them
+    ords = np.asarray(ords, dtype=np.int64)
+    dt = _vector_dtype(vectors.shape[1])
+    p = vectors_path(kb_id)
+    size = p.stat().st_size if p.exists() else 0
+    if size % dt.itemsize:
+        os.truncate(p, size - size % dt.itemsize)  # drop a torn append
+    exact = _read_vectors(kb_id, vectors.shape[1])
+    last = int(exact["ord"][-1]) if exact is not None else -1
+    order = np.argsort(ords, kind="stable")
+    if int(ords.min()) > last and (np.diff(ords[order]) > 0).all():
+        # ords are allocated in increasing order, so new rows normally go at the end
+        rec = np.empty(len(ords), dtype=dt)
+        rec["ord"], rec["vec"] = ords[order], vectors[order]
+        with open(p, "ab") as f:
+            rec.tofile(f)
+        return
+    # ords that were written before (an ingest rolled back after index_add) replace their rows
+    if exact is not None:
+        old = exact[~np.isin(exact["ord"], ords)]
+        ords, vectors = np.concatenate([old["ord"], ords]), np.concatenate([old["vec"], vectors])
+    _save_vectors(kb_id, ords, vectors)
+
+def _save_vectors(kb_id: str, ids: np.ndarray, vectors: np.ndarray):
+    order = np.argsort(ids, kind="stable")
+    rec = np.empty(len(ids), dtype=_vector_dtype(vectors.shape[1]))
+    rec["ord"], rec["vec"] = ids[order], vectors[order]
+    _atomic_write(vectors_path(kb_id), rec.tofile)
+
+def _drop_vectors(kb_id: str):
+    vectors_path(kb_id).unlink(missing_ok=True)
+
+def _rescore(kb_id: str, query_vecs: np.ndarray, scores: np.ndarray, ords: np.ndarray, k: int):
+    """Re-rank an approximate shortlist by exact inner product and keep the best k.
+
+    Falls back to the shortlist's own order when the float32 copy is missing or
+    doesn't cover every candidate.
+    """
+    valid = ords >= 0
+    exact = _exact_rows(_read_vectors(kb_id, query_vecs.shape[1]), ords[valid])
+    if exact is None:
+        return scores[:, :k], ords[:, :k]
+    cand = np.zeros((*ords.shape, query_vecs.shape[1]), dtype=np.float32)
+    cand[valid] = exact
+    rescored = np.einsum("nkd,nd->nk", cand, query_vecs)
+    rescored[~valid] = scores[~valid]  # faiss pads with the lowest float, so padding stays last
+    order = np.argsort(-rescored, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(rescored, order, 1), np.take_along_axis(ords, order, 1)
 
 def ensure_index(kb_id: str, dim: int):
     idx = load_index(kb_id)
-    if idx is None:
-        idx = faiss.IndexFlatIP(dim)
-        save_index(kb_id, idx)
-        return idx
-    if idx.d != dim:
-        idx = faiss.IndexFlatIP(dim)
+    if idx is None or idx.d != dim:
+        idx = _new_index(dim)
         save_index(kb_id, idx)
+        _drop_vectors(kb_id)
     return idx
 
-def index_add(kb_id: str, vectors: np.ndarray):
+def _rebuild_if_needed(kb_id: str, idx, force: bool = False):
+    # move the KB to the kind its policy asks for at the current size
+    kind, params = _index_policy(kb_id)
+    want = _trainable_kind(_resolve_kind(kind, idx.ntotal), idx.ntotal, params)
+    if (not force and want == _kind_of(idx) and _storage_for(want, idx.ntotal, params) == _storage_of(idx)
+            and not _outgrown(idx, params)):
+        return idx
+    ids, vecs = _export_exact(kb_id, idx)
+    return _build(want, idx.d, ids, vecs, params)
+
+def _finish_write(kb_id: str, idx):
+    save_index(kb_id, idx)
+    set_kv(kb_id, "index_kind_active", _kind_of(idx))
+    _publish(kb_id, idx)
+
+def index_add(kb_id: str, vectors: np.ndarray, ords: list[int]):
     # vectors should be normalized
     vectors = _normalize(vectors)
-    with FileLock(str(lock_path(kb_id))):
+    if len(ords) != vectors.shape[0]:
+        raise ValueError("vector/ord count mismatch")
+    with kb_lock(kb_id), timed("index_write"):
+        # always start from the on-disk copy: cached indexes are shared with readers
         idx = ensure_index(kb_id, vectors.shape[1])
-        idx.add(vectors)
-        save_index(kb_id, idx)
+        if _keeps_float32(_index_policy(kb_id)[1]):
+            _write_vectors(kb_id, vectors, ords)
+        idx.add_with_ids(vectors, np.asarray(ords, dtype=np.int64))
+        idx = _rebuild_if_needed(kb_id, idx)
         set_kv(kb_id, "embedding_dim", str(vectors.shape[1]))
+        _finish_write(kb_id, idx)
+
+def index_remove(kb_id: str, ords: list[int]) -> int:
+    """Drop the vectors of deleted chunks without touching the rest of the index.
+
+    HNSW cannot remove vectors; their ids are left as tombstones (filtered at
+    hydration time) until `compact_index` runs. IVF kinds keep their trained
+    centroids and re-add the surviving vectors.
+    """
+    if not ords:
+        return 0
+    with kb_lock(kb_id):
+        idx = load_index(kb_id)
+        if idx is None:
+            return 0
+        if _kind_of(idx) == "hnsw":
+            dead = int(get_kv(kb_id, "index_tombstones") or 0) + len(ords)
+            set_kv(kb_id, "index_tombstones", str(dead))
+            return 0
+        if _kind_of(idx) in ("ivf", "ivfpq"):
+            # IVF lists keep their internal ids on removal, which IndexIDMap2 then maps to the
+            # wrong vectors: re-add the survivors to an emptied copy (same centroids, no retraining)
+            ids, vecs = _export_exact(kb_id, idx)
+            keep = ~np.isin(ids, np.asarray(ords, dtype=np.int64))
+            idx = faiss.clone_index(idx)
+            idx.reset()
+            if keep.any():
+                idx.add_with_ids(np.ascontiguousarray(vecs[keep]), ids[keep])
+            removed = int((~keep).sum())
+        else:
+            removed = int(idx.remove_ids(np.asarray(ords, dtype=np.int64)))
+        _finish_write(kb_id, idx)
+        return removed
 
-def rebuild_full(kb_id: str, embeddings: Embeddings, all_texts: list[str]):
-    with FileLock(str(lock_path(kb_id))):
+def compact_index(kb_id: str):
+    """Rewrite the index keeping only vectors whose ord still exists in `chunks`.
+
+    Reclaims space left by deletes (HNSW tombstones) or interrupted ingests,
+    reusing the stored vectors (no re-embedding). The exact float32 copy is
+    rewritten with the surviving ords only.
+    """
+    with kb_lock(kb_id):
+        idx = load_index(kb_id)
+        if idx is None:
+            return {"compacted": False, "vectors": 0, "dropped": 0}
+        ids, vecs = _export_exact(kb_id, idx)
+        keep = np.isin(ids, np.asarray(list_vector_ords(kb_id), dtype=np.int64))
+        kind, params = _index_policy(kb_id)
+        new = _build(_resolve_kind(kind, int(keep.sum())), idx.d, ids[keep], vecs[keep], params)
+        if _keeps_float32(params):
+            _save_vectors(kb_id, ids[keep], vecs[keep])
+        else:
+            _drop_vectors(kb_id)
+        set_kv(kb_id, "index_tombstones", "0")
+        _finish_write(kb_id, new)
+        return {"compacted": True, "vectors": int(new.ntotal), "dropped": int((~keep).sum())}
+
+def rebuild_full(kb_id: str, embeddings: Embeddings, all_texts: list[str], ords: list[int]):
+    with kb_lock(kb_id):
         if not all_texts:
             # remove index if exists
             p = faiss_path(kb_id)
             if p.exists():
                 p.unlink()
+            _drop_vectors(kb_id)
+            _bump_generation(kb_id)
+            _cache.invalidate(kb_id)
+            bump_content_version(kb_id)
             return {"rebuilt": False, "chunks": 0}
         vectors = embeddings.embed_texts(all_texts)
         vectors = _normalize(vectors)
-        idx = faiss.IndexFlatIP(vectors.shape[1])
-        idx.add(vectors)
-        save_index(kb_id, idx)
+        kind, params = _index_policy(kb_id)
+        ids = np.asarray(ords, dtype=np.int64)
+        if _keeps_float32(params):
+            _save_vectors(kb_id, ids, vectors)
+        else:
+            _drop_vectors(kb_id)
+        idx = _build(_resolve_kind(kind, len(all_texts)), vectors.shape[1], ids, vectors, params)
         set_kv(kb_id, "embedding_dim", str(vectors.shape[1]))
-        return {"rebuilt": True, "chunks": len(all_texts), "dim": vectors.shape[1]}
+        set_kv(kb_id, "index_tombstones", "0")
+        _finish_write(kb_id, idx)
+        bump_content_version(kb_id)
+        return {"rebuilt": True, "chunks": len(all_texts), "dim": vectors.shape[1], "index": _kind_of(idx)}
+
+def get_index_config(kb_id: str) -> dict:
+    kind, params = _index_policy(kb_id)
+    idx = get_index(kb_id)
+    stamp = _stamp(kb_id)
+    return {
+        "policy": kind,
+        "active": _kind_of(idx) if idx is not None else None,
+        "params": params,
+        "vectors": int(idx.ntotal) if idx is not None else 0,
+        "tombstones": int(get_kv(kb_id, "index_tombstones") or 0),
+        "storage": _storage_of(idx) if idx is not None else None,
+        "bytes_per_vector": _code_size(idx) if idx is not None else None,
+        "index_bytes": stamp[1] if stamp else 0,
+        "float32_copy": vectors_path(kb_id).exists(),
+    }
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def _check_params(params: dict):
+    unknown = set(params) - set(DEFAULT_INDEX_PARAMS)
+    if unknown:
+        raise ValueError(f"unknown index params: {', '.join(sorted(unknown))}")
+    if params.get("storage", "float32") not in STORAGE_TYPES:
+        raise ValueError(f"storage must be one of {', '.join(STORAGE_TYPES)}")
+    rescore = params.get("rescore", 0)
+    if not _is_int(rescore) or rescore < 0:
+        raise ValueError("rescore must be a non-negative integer")
+    for key in ("hnsw_m", "ef_construction", "ef_search", "nlist", "nprobe", "pq_m", "pq_bits"):
+        if key not in params or (params[key] is None and DEFAULT_INDEX_PARAMS[key] is None):
+            continue  # unchanged, or sized from the data
+        v = params[key]
+        if not _is_int(v) or v <= 0:
+            raise ValueError(f"{key} must be a positive integer")
+
+def set_index_config(kb_id: str, kind: str, params: dict | None = None) -> dict:
+    """Store the KB's index policy and rebuild the index from its stored vectors."""
+    kind = (kind or "auto").strip().lower()
+    if kind != "auto" and kind not in INDEX_KINDS:
+        raise ValueError(f"index kind must be auto or one of {', '.join(INDEX_KINDS)}")
+    _check_params(params or {})
+    with kb_lock(kb_id):
+        merged = {**json.loads(get_kv(kb_id, "index_params") or "{}"), **(params or {})}
+        set_kv(kb_id, "index_kind", kind)
+        set_kv(kb_id, "index_params", json.dumps(merged))
+        idx = load_index(kb_id)
+        if idx is not None:
+            if _keeps_float32(merged) and idx.ntotal and _read_vectors(kb_id, idx.d) is None:
+                # only exact if the index was float32 until now
+                _save_vectors(kb_id, *_export(idx))
+            # rebuilt from the exact copy while it still exists, so leaving a compressed storage is lossless
+            _finish_write(kb_id, _rebuild_if_needed(kb_id, idx, force=True))
+        if not _keeps_float32(merged):
+            _drop_vectors(kb_id)
+        # a different index kind can return different neighbours
+        bump_content_version(kb_id)
+    return get_index_config(kb_id)
+
+def evaluate_index(kb_id: str, queries: int = 200, top_k: int = 10) -> dict:
+    """Recall@k and per-query latency of the active index against an exact flat scan.
+
+    Queries are sampled from the stored vectors. For ANN kinds the search knob
+    (efSearch / nprobe) is swept so it can be tuned per KB. The baseline uses the
+    exact float32 copy when the KB keeps one, so compression loss shows up too;
+    otherwise (e.g. PQ without a copy) it is built from the reconstructed
+    vectors and only partitioning loss shows up. With `rescore` set, each run
+    also reports recall and latency after exact re-ranking.
+    """
+    idx = get_index(kb_id)
+    if idx is None or idx.ntotal == 0:
+        return {"vectors": 0, "runs": []}
+    ids, vecs = _export_exact(kb_id, faiss.clone_index(idx))
+    rescore = int(_index_policy(kb_id)[1].get("rescore") or 0) if _storage_of(idx) != "float32" else 0
+    rng = np.random.default_rng(0)
+    q = vecs[rng.choice(len(vecs), size=min(queries, len(vecs)), replace=False)]
+    k = min(top_k, idx.ntotal)
+
+    exact = faiss.IndexFlatIP(idx.d)
+    exact.add(vecs)
+    t0 = time.perf_counter()
+    _, truth = exact.search(q, k)
+    flat_ms = (time.perf_counter() - t0) * 1000 / len(q)
+    truth_ids = ids[truth]
+
+    probe = faiss.clone_index(idx)
+    inner = faiss.downcast_index(probe.index)
+    kind = _kind_of(probe)
+    if kind == "hnsw":
+        knob, values = "ef_search", [16, 32, 64, 128, 256]
+    elif kind in ("ivf", "ivfpq"):
+        knob, values = "nprobe", [1, 4, 16, 64, 256]
+    else:
+        knob, values = None, [None]
+
+    runs = []
+    for v in values:
+        if knob == "ef_search":
+            inner.hnsw.efSearch = v
+        elif knob == "nprobe":
+            inner.nprobe = v
+        t0 = time.perf_counter()
+        _, got = probe.search(q, k)
+        ms = (time.perf_counter() - t0) * 1000 / len(q)
+        hits = sum(len(set(g[g >= 0]) & set(t)) for g, t in zip(got, truth_ids))
+        run = {knob or "exact": v, "recall": hits / (len(q) * k), "ms_per_query": ms}
+        if rescore:
+            t0 = time.perf_counter()
+            scores, got = probe.search(q, k * rescore)
+            _, got = _rescore(kb_id, q, scores, got, k)
+            run["rescored_ms_per_query"] = (time.perf_counter() - t0) * 1000 / len(q)
+            hits = sum(len(set(g[g >= 0]) & set(t)) for g, t in zip(got, truth_ids))
+            run["rescored_recall"] = hits / (len(q) * k)
+        runs.append(run)
+    return {
+        "kind": kind,
+        "storage": _storage_of(idx),
+        "rescore": rescore,
+        "vectors": int(idx.ntotal),
+        "queries": int(len(q)),
+        "top_k": k,
+        "flat_ms_per_query": flat_ms,
+        "runs": runs,
+    }
+
+def index_dim(kb_id: str) -> int | None:
+    """Dimension of the KB's vectors (None for a KB with no index yet)."""
+    dim = get_kv(kb_id, "embedding_dim")
+    if dim:
+        return int(dim)
+    idx = get_index(kb_id)
+    return int(idx.d) if idx is not None and idx.ntotal else None
+
+def search_batch(kb_id: str, query_vecs: np.ndarray, top_k: int):
+    """Search many queries as one matrix; returns per-query (scores, ords) lists."""
+    n = int(query_vecs.shape[0])
+    with timed("search"):
+        idx = get_index(kb_id)
+        if idx is None or n == 0:
+            return [[] for _ in range(n)], [[] for _ in range(n)]
+        query_vecs = _normalize(query_vecs)
+        # over-fetch past tombstoned ids so callers still get top_k live hits
+        dead = int(get_kv(kb_id, "index_tombstones") or 0)
+        k = top_k + min(dead, top_k * 4)
+        rescore = int(_index_policy(kb_id)[1].get("rescore") or 0)
+        if rescore and _storage_of(idx) != "float32":
+            scores, ords = idx.search(query_vecs, k * rescore)
+            with timed("rescore"):
+                scores, ords = _rescore(kb_id, query_vecs, scores, ords, k)
+        else:
+            scores, ords = idx.search(query_vecs, k)
+    return scores.tolist(), ords.tolist()
 
 def search(kb_id: str, query_vec: np.ndarray, top_k: int):
-    idx = load_index(kb_id)
-    if idx is None:
-        return [], []
-    query_vec = _normalize(query_vec)
-    scores, ords = idx.search(query_vec, top_k)
-    return scores[0].tolist(), ords[0].tolist()
+    scores, ords = search_batch(kb_id, query_vec[:1], top_k)
+    return scores[0], ords[0]
@@ -1,9 +1,16 @@
 from __future__ import annotations
 import mimetypes
-from .parsers import parse_pdf_bytes, parse_docx_bytes, parse_text_bytes
-from utils.text_splitter import chunk_text
-from .store import insert_doc, insert_chunks, count_chunks, fetch_chunks_by_ord, delete_doc_and_chunks
-from .index import index_add, rebuild_full
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+import numpy as np
+from .images import ImageCaptioner, is_image_name
+from .parsers import Segment, iter_pdf_pages, iter_docx_segments, parse_text_bytes, pdf_pages
+from utils.metrics import observe, timed, timed_iter
+from utils.text_splitter import Chunk, get_tokenizer, split_segments
+from .store import NewDoc, insert_documents, delete_doc_and_chunks, kb_lock, job_payload_path
+from .index import index_add, index_remove, rebuild_full
 from .embeddings import Embeddings
 
 def sniff_mime(filename: str, content_type: str | None):
@@ -12,13 +19,96 @@ def sniff_mime(filename: str, content_type: str | None):
     guess, _ = mimetypes.guess_type(filename)
     return guess or "application/octet-stream"
 
-def parse_bytes(filename: str, mime: str, content: bytes) -> str:
+def _kind(filename: str, mime: str) -> str:
     ext = (filename.split(".")[-1].lower() if "." in filename else "")
     if mime == "application/pdf" or ext == "pdf":
-        return parse_pdf_bytes(content)
+        return "pdf"
     if mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or ext == "docx":
-        return parse_docx_bytes(content)
-    return parse_text_bytes(content)
+        return "docx"
+    if mime.startswith("image/") or is_image_name(filename):
+        return "image"
+    return "text"
+
+def iter_segments(filename: str, mime: str, content: bytes) -> tuple[int, Iterator[Segment]]:
+    """(expected segment count or 0 if unknown, stream of page/paragraph segments)."""
+    kind = _kind(filename, mime)
+    if kind == "pdf":
+        return pdf_pages(content)
+    if kind == "docx":
+        return 0, iter_docx_segments(content)
+    if kind == "image":
+        raise ValueError("图片需要通过视觉模型生成描述后才能入库")
+    return 1, iter([Segment(None, parse_text_bytes(content))])
+
+# chunks per embedding call when reporting progress
+EMBED_WINDOW = 256
+
+# what chunk_size/overlap are measured in: "chars" (default) or "estimate" (approximate LLM tokens)
+CHUNK_TOKENIZER = get_tokenizer(os.getenv("CHUNK_TOKENIZER", "chars"))
+
+def split_stream(segments: Iterable[Segment], chunk_size: int, overlap: int) -> Iterator[Chunk]:
+    """Chunks of a document's whole segment stream, split in one pass.
+
+    Chunks may run across page breaks; `start`/`end` are offsets in the
+    document's parsed text (its segments joined with "\n") and `page` is the
+    page a chunk starts on. Only the splitting is charged to "chunk", not the
+    parsing that produces the segments.
+    """
+    upstream = 0.0
+
+    def source():
+        nonlocal upstream
+        it = iter(segments)
+        while True:
+            t0 = time.perf_counter()
+            seg = next(it, None)
+            upstream += time.perf_counter() - t0
+            if seg is None:
+                return
+            yield Segment(seg.page, seg.text.replace("\r\n", "\n"))
+
+    t0 = time.perf_counter()
+    try:
+        yield from split_segments(source(), max(200, int(chunk_size)), overlap, CHUNK_TOKENIZER)
+    finally:
+        observe("chunk", time.perf_counter() - t0 - upstream)
+
+Progress = Callable[[str, float], None]
+
+def _noop_progress(stage: str, fraction: float):
+    pass
+
+class ChunkEmbedder:
+    """Collects chunks as they stream out of the parser and embeds full windows right away.
+
+    Parsing and embedding overlap, but the document is written all-or-nothing,
+    so every chunk and vector of it stays here until `write_document`.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.chunks: list[str] = []
+        self.pages: list[int | None] = []
+        self.spans: list[tuple[int, int] | None] = []
+        self._parts: list[np.ndarray] = []
+        self._done = 0
+
+    def add(self, chunk: Chunk, span: bool = True):
+        """Queue one chunk; `span=False` for chunks that are not from the parsed text (captions)."""
+        self.chunks.append(chunk.text)
+        self.pages.append(chunk.page)
+        self.spans.append((chunk.start, chunk.end) if span else None)
+        if len(self.chunks) - self._done >= EMBED_WINDOW:
+            self._embed(self._done + EMBED_WINDOW)
+
+    def _embed(self, end: int):
+        self._parts.append(self.embeddings.embed_texts(self.chunks[self._done:end]))
+        self._done = end
+
+    def finish(self) -> np.ndarray:
+        if self._done < len(self.chunks):
+            self._embed(len(self.chunks))
+        return np.vstack(self._parts) if self._parts else np.zeros((0, 1), dtype=np.float32)
 
 def ingest_one(
     kb_id: str,
@@ -28,24 +118,131 @@ def ingest_one(
     embeddings: Embeddings,
     chunk_size: int,
     overlap: int,
+    progress: Progress | None = None,
+    captioner: ImageCaptioner | None = None,
 ):
+    progress = progress or _noop_progress
     mime = sniff_mime(filename, content_type)
-    text = parse_bytes(filename, mime, content)
+    kind = _kind(filename, mime)
+    progress("parse", 0.0)
+    acc = ChunkEmbedder(embeddings)
+    if kind == "image" and captioner is not None:
+        progress("caption", 0.0)
+        with timed("caption"):
+            captions = captioner.caption([(None, filename, content)], strict=True)
+        for seg in captions:
+            for c in split_stream([seg], chunk_size, overlap):
+                acc.add(c, span=False)
+    else:
+        with ThreadPoolExecutor(max_workers=1) as ex:
+            # embedded figures are captioned while the text is being parsed; that thread opens its
+            # own reader, as a PdfReader over one stream is not safe to share across threads
+            figures = ex.submit(captioner.caption_document, kind, content) if captioner is not None else None
+            total, segments = iter_segments(filename, mime, content)
 
-    chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
-    if not chunks:
+            # pages are chunked and embedded while later pages are still being extracted;
+            # nothing is written if parsing or the provider fails
+            for c in split_stream(timed_iter("parse", segments), chunk_size, overlap):
+                acc.add(c)
+                if total:
+                    progress("parse+embed", 0.85 * min(c.segment + 1, total) / total)
+            if figures is not None:
+                progress("caption", 0.85)
+                # only the wait is charged: captioning overlaps parsing
+                with timed("caption_wait"):
+                    captions = figures.result()
+                for seg in captions:
+                    for c in split_stream([seg], chunk_size, overlap):
+                        acc.add(c, span=False)
+    if not acc.chunks:
         raise ValueError("文件解析后没有得到文本内容。若是扫描版 PDF，请先 OCR。")
+    progress("embed", 0.85)
+    vectors = acc.finish()
+    chunks = acc.chunks
 
-    # DB insert
-    doc_id = insert_doc(kb_id, filename, mime, len(content))
-    start_ord = count_chunks(kb_id)
-    _ = insert_chunks(kb_id, doc_id, chunks, start_ord=start_ord)
-
-    # Embeddings + add to index
-    vectors = embeddings.embed_texts(chunks)
-    index_add(kb_id, vectors)
+    progress("write", 0.9)
+    doc_id = write_document(kb_id, filename, mime, len(content), chunks, vectors, acc.pages, acc.spans)
 
     return {"doc_id": doc_id, "filename": filename, "mime": mime, "chunks": len(chunks)}
 
-def rebuild_from_texts(kb_id: str, embeddings: Embeddings, all_texts: list[str]):
-    return rebuild_full(kb_id, embeddings, all_texts)
+def run_upload_job(job: dict, progress: Progress, embeddings: Embeddings,
+                   captioner: ImageCaptioner | None = None) -> dict:
+    """JobQueue handler for kind="upload": ingest the payload saved at submit time."""
+    p = job["params"]
+    path = job_payload_path(job["kb_id"], job["job_id"])
+    try:
+        return ingest_one(
+            kb_id=job["kb_id"],
+            filename=p["filename"],
+            content_type=p.get("content_type"),
+            content=path.read_bytes(),
+            embeddings=embeddings,
+            chunk_size=int(p["chunk_size"]),
+            overlap=int(p["chunk_overlap"]),
+            progress=progress,
+            captioner=captioner,
+        )
+    finally:
+        path.unlink(missing_ok=True)
+
+def write_documents(kb_id: str, docs: list[NewDoc], vectors) -> list[str]:
+    """DB rows and index vectors for a batch of documents, all-or-nothing under the KB lock.
+
+    `vectors` holds the embeddings of every doc's chunks, concatenated in order.
+    """
+    with kb_lock(kb_id):
+        with insert_documents(kb_id, docs) as written:
+            index_add(kb_id, vectors, [o for _, ords in written for o in ords])
+    return [doc_id for doc_id, _ in written]
+
+def write_document(kb_id: str, filename: str, mime: str, size_bytes: int, chunks: list[str], vectors,
+                   pages: list[int | None] | None = None,
+                   spans: list[tuple[int, int] | None] | None = None) -> str:
+    return write_documents(kb_id, [NewDoc(filename, mime, size_bytes, chunks, pages, spans)], vectors)[0]
+
+def parse_document(filename: str, mime: str, content: bytes, chunk_size: int, overlap: int):
+    """Parse and chunk one file in a parse-pool worker; returns (chunks, pages, spans)."""
+    chunks: list[str] = []
+    pages: list[int | None] = []
+    spans: list[tuple[int, int] | None] = []
+    kind = _kind(filename, mime)
+    segments = iter_pdf_pages(content, workers=1) if kind == "pdf" else iter_segments(filename, mime, content)[1]
+    for c in split_stream(timed_iter("parse", segments), chunk_size, overlap):
+        chunks.append(c.text)
+        pages.append(c.page)
+        spans.append((c.start, c.end))
+    return chunks, pages, spans
+
+def _chunk_captions(captions, chunk_size: int, overlap: int, chunks: list[str], pages: list[int | None],
+                    spans: list[tuple[int, int] | None]):
+    # each caption is its own text: captions are never merged into one chunk and carry no span
+    for seg in captions:
+        for c in split_stream([seg], chunk_size, overlap):
+            chunks.append(c.text)
+            pages.append(c.page)
+            spans.append(None)
+
+def parse_with_captions(pool, captioner: ImageCaptioner, filename: str, mime: str, content: bytes,
+                        chunk_size: int, overlap: int):
+    """`parse_document` plus vision captions; text goes to the parse pool while this thread captions."""
+    kind = _kind(filename, mime)
+    if kind == "image":
+        chunks, pages, spans = [], [], []
+        _chunk_captions(captioner.caption([(None, filename, content)], strict=True), chunk_size, overlap,
+                        chunks, pages, spans)
+        return chunks, pages, spans
+    text = pool.submit(parse_document, filename, mime, content, chunk_size, overlap)
+    figures = captioner.caption_document(kind, content)
+    chunks, pages, spans = text.result()
+    _chunk_captions(figures, chunk_size, overlap, chunks, pages, spans)
+    return chunks, pages, spans
+
+def delete_doc(kb_id: str, doc_id: str):
+    # only the document's own vectors leave the index; nothing is re-embedded
+    with kb_lock(kb_id):
+        ords = delete_doc_and_chunks(kb_id, doc_id)
+        removed = index_remove(kb_id, ords)
+    return {"chunks": len(ords), "vectors_removed": removed}
+
+def rebuild_from_texts(kb_id: str, embeddings: Embeddings, all_texts: list[str], ords: list[int]):
+    return rebuild_full(kb_id, embeddings, all_texts, ords)
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from utils.metrics import log_trace, start_trace
+from .store import create_job, update_job, claim_job, get_job, heartbeat_jobs, adopt_expired_jobs
+
+log = logging.getLogger(__name__)
+
+# handler(job, progress) -> result dict; progress(stage, fraction 0..1)
+JobHandler = Callable[[dict, Callable[[str, float], None]], dict]
+
+class JobQueue:
+    """Bounded background worker pool for ingestion jobs.
+
+    Jobs are persisted in the registry's `jobs` table with a lease: the owning
+    queue instance renews `heartbeat_at` on all of its unfinished jobs every
+    `lease_s / 4` seconds. Any queue (in this or another worker process) takes
+    over jobs whose lease has run out, so work of a stopped or crashed process
+    is picked up again, but jobs of live workers are never run twice. At most
+    `workers` jobs run at once, and at most `per_kb` of them for the same KB.
+    """
+
+    def __init__(self, handlers: dict[str, JobHandler], workers: int = 2, per_kb: int = 1,
+                 lease_s: float = 120.0):
+        self.handlers = handlers
+        self.workers = max(1, int(workers))
+        self.per_kb = max(1, int(per_kb))
+        self.lease_s = max(4.0, float(lease_s))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._pending: deque[tuple[str, str]] = deque()  # (job_id, kb_id)
+        self._running: dict[str, int] = {}
+        self._active = 0
+        self._closed = False
+        self._stop = threading.Event()
+        self._monitor: threading.Thread | None = None
+
+    def create(self, kb_id: str, kind: str, params: dict) -> dict:
+        """Record a queued job; call `start` once its payload is in place."""
+        if kind not in self.handlers:
+            raise ValueError(f"unknown job kind: {kind}")
+        return create_job(kb_id, kind, params, owner=self.owner)
+
+    def start(self, job: dict):
+        self._enqueue(job["job_id"], job["kb_id"])
+
+    def submit(self, kb_id: str, kind: str, params: dict) -> dict:
+        job = self.create(kb_id, kind, params)
+        self.start(job)
+        return job
+
+    def resume(self):
+        """Adopt jobs with an expired lease and start renewing/adopting in the background."""
+        self._adopt()
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._watch, name="job-lease", daemon=True)
+            self._monitor.start()
+
+    def close(self):
+        """Stop starting jobs. Jobs not yet running stay queued and are adopted once their lease expires."""
+        self._stop.set()
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _adopt(self):
+        for job in adopt_expired_jobs(self.owner, self.lease_s):
+            log.info("adopted job %s (lease expired)", job["job_id"])
+            self._enqueue(job["job_id"], job["kb_id"])
+
+    def _watch(self):
+        while not self._stop.wait(self.lease_s / 4):
+            try:
+                heartbeat_jobs(self.owner)
+                self._adopt()
+            except Exception:
+                log.exception("job lease renewal failed")
+
+    def _enqueue(self, job_id: str, kb_id: str):
+        with self._lock:
+            self._pending.append((job_id, kb_id))
+            self._dispatch()
+
+    def _dispatch(self):
+        # caller holds self._lock
+        if self._closed:
+            return
+        skipped = deque()
+        while self._pending and self._active < self.workers:
+            job_id, kb_id = self._pending.popleft()
+            if self._running.get(kb_id, 0) >= self.per_kb:
+                skipped.append((job_id, kb_id))
+                continue
+            self._running[kb_id] = self._running.get(kb_id, 0) + 1
+            self._active += 1
+            self._pool.submit(self._run, job_id, kb_id)
+        skipped.extend(self._pending)
+        self._pending = skipped
+
+    def _run(self, job_id: str, kb_id: str):
+        # the job id doubles as trace id: its stage timings land in the result and the log
+        trace = start_trace(job_id)
+        job = None
+        try:
+            if not claim_job(job_id, self.owner):
+                return
+            job = get_job(job_id)
+            last = {"stage": None, "pct": -1.0}
+
+            def progress(stage: str, fraction: float):
+                pct = round(max(0.0, min(1.0, fraction)) * 100, 1)
+                # throttle DB writes to stage changes and whole-percent steps
+                if stage != last["stage"] or pct - last["pct"] >= 1.0:
+                    last["stage"], last["pct"] = stage, pct
+                    update_job(job_id, stage=stage, progress=pct)
+
+            result = self.handlers[job["kind"]](job, progress)
+            if isinstance(result, dict):
+                result = {**result, "timings_ms": trace.stages_ms()}
+            update_job(job_id, status="done", stage="done", progress=100.0, result=result)
+            log_trace("job", trace, kb_id=kb_id, kind=job["kind"], status="done")
+        except Exception as e:
+            log.exception("job %s failed", job_id)
+            update_job(job_id, status="failed", stage="failed", error=str(e))
+            log_trace("job", trace, kb_id=kb_id, kind=job and job["kind"], status="failed")
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._running[kb_id] -= 1
+                if not self._running[kb_id]:
+                    del self._running[kb_id]
+                self._dispatch()
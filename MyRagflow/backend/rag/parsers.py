@@ -1,28 +1,130 @@
 from __future__ import annotations
 import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, NamedTuple
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 
+# Process-pool size for PDF text extraction; small PDFs are parsed inline.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = 8
+PDF_PARALLEL_MIN_PAGES = 32
+# DOCX/text are grouped into segments of about this many characters
+SEGMENT_CHARS = 64 * 1024
+
+class Segment(NamedTuple):
+    page: int | None  # 1-based PDF page, None for formats without pages
+    text: str
+
 def parse_text_bytes(content: bytes) -> str:
     try:
         return content.decode("utf-8")
     except UnicodeDecodeError:
         return content.decode("utf-8", errors="ignore")
 
-def parse_pdf_bytes(content: bytes) -> str:
+def _page_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+def parse_pool() -> ProcessPoolExecutor:
+    # one long-lived pool per process so worker start-up is paid once
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+def close_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+# worker-side cache: the reader for the file currently being extracted, keyed by
+# path and file identity (temp paths and inodes are reused once a file is deleted)
+_worker_reader: tuple[tuple, PdfReader] | None = None
+
+def _extract_pdf_range(path: str, start: int, end: int) -> list[str]:
+    global _worker_reader
+    st = os.stat(path)
+    key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    if _worker_reader is None or _worker_reader[0] != key:
+        _worker_reader = None  # drop the previous document before parsing the next
+        _worker_reader = (key, PdfReader(path))
+    reader = _worker_reader[1]
+    return [_page_text(reader.pages[i]) for i in range(start, end)]
+
+def pdf_pages(content: bytes, workers: int | None = None) -> tuple[int, Iterator[Segment]]:
+    """(page count, page stream) of a PDF, both from the same reader."""
     reader = PdfReader(io.BytesIO(content))
-    texts = []
-    for page in reader.pages:
-        try:
-            texts.append(page.extract_text() or "")
-        except Exception:
-            texts.append("")
-    return "\n".join(texts)
+    return len(reader.pages), _iter_pdf_pages(reader, content, workers)
 
-def parse_docx_bytes(content: bytes) -> str:
+def iter_pdf_pages(content: bytes, workers: int | None = None) -> Iterator[Segment]:
+    return pdf_pages(content, workers)[1]
+
+def _iter_pdf_pages(reader: PdfReader, content: bytes, workers: int | None) -> Iterator[Segment]:
+    """Yield PDF pages in order, extracting them across a process pool for large files.
+
+    Small files are extracted inline from `reader`; for large ones each pool
+    worker opens the file once and keeps that reader for the document's ranges.
+    At most two tasks per worker are in flight, so only a bounded window of
+    page text is held here at once. The bound covers parsing only: callers
+    that keep every chunk (ingest) hold the document's chunks and vectors.
+    """
+    n = len(reader.pages)
+    workers = min(PARSE_WORKERS if workers is None else workers, -(-n // PDF_PAGES_PER_TASK))
+    if workers <= 1 or n < PDF_PARALLEL_MIN_PAGES:
+        for i, page in enumerate(reader.pages):
+            yield Segment(i + 1, _page_text(page))
+        return
+
+    # workers read the document from a temp file instead of receiving the bytes per task
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        pool = parse_pool()
+        ranges = [(s, min(n, s + PDF_PAGES_PER_TASK)) for s in range(0, n, PDF_PAGES_PER_TASK)]
+        window = 2 * workers
+        futures = [pool.submit(_extract_pdf_range, path, s, e) for s, e in ranges[:window]]
+        for i, (start, _) in enumerate(ranges):
+            texts = futures[i].result()
+            futures[i] = None
+            if i + window < len(ranges):
+                futures.append(pool.submit(_extract_pdf_range, path, *ranges[i + window]))
+            for j, t in enumerate(texts):
+                yield Segment(start + j + 1, t)
+    finally:
+        os.unlink(path)
+
+def parse_pdf_bytes(content: bytes) -> str:
+    return "\n".join(seg.text for seg in iter_pdf_pages(content))
+
+def _group(parts: Iterator[str]) -> Iterator[Segment]:
+    buf: list[str] = []
+    size = 0
+    for p in parts:
+        buf.append(p)
+        size += len(p) + 1
+        if size >= SEGMENT_CHARS:
+            yield Segment(None, "\n".join(buf))
+            buf, size = [], 0
+    if buf:
+        yield Segment(None, "\n".join(buf))
+
+def iter_docx_segments(content: bytes) -> Iterator[Segment]:
     doc = DocxDocument(io.BytesIO(content))
-    parts = []
-    for p in doc.paragraphs:
-        if p.text:
-            parts.append(p.text)
-    return "\n".join(parts)
+    return _group(p.text for p in doc.paragraphs if p.text)
+
+def parse_docx_bytes(content: bytes) -> str:
+    return "\n".join(seg.text for seg in iter_docx_segments(content))
@@ -1,31 +1,151 @@
 from __future__ import annotations
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 import numpy as np
 from .embeddings import Embeddings
-from .index import search
-from .store import fetch_chunks_by_ord
+from .index import index_dim, search, search_batch
+from .store import fetch_chunks_by_ord, fts_search
 
-def retrieve(kb_id: str, query: str, embeddings: Embeddings, top_k: int):
-    qv = embeddings.embed_texts([query])
-    scores, ords = search(kb_id, qv, top_k)
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# reciprocal rank fusion constant (Cormack et al.)
+RRF_K = 60
+
+# Threads for the BM25 leg of hybrid queries and for per-KB shards of multi-KB
+# queries. Query embedding (the slow, network-bound part) stays on the caller's
+# thread, so this pool doesn't cap concurrent chats.
+RETRIEVE_WORKERS = int(os.getenv("RETRIEVE_WORKERS", "32"))
+_pool = ThreadPoolExecutor(max_workers=RETRIEVE_WORKERS, thread_name_prefix="retrieve")
+
+def _valid(scores: list[float], ords: list[int]) -> list[tuple[int, float]]:
     # filter invalid
-    pairs = [(o, s) for o, s in zip(ords, scores) if o is not None and o >= 0]
+    return [(o, s) for o, s in zip(ords, scores) if o is not None and o >= 0]
+
+def _dense(kb_id: str, query: str, embeddings: Embeddings, k: int):
+    qv = embeddings.embed_texts([query])
+    scores, ords = search(kb_id, qv, k)
+    return _valid(scores, ords)
+
+def _dense_batch(kb_id: str, queries: list[str], embeddings: Embeddings, k: int):
+    qv = embeddings.embed_texts(queries)
+    scores, ords = search_batch(kb_id, qv, k)
+    return [_valid(s, o) for s, o in zip(scores, ords)]
+
+def _lexical(kb_id: str, query: str, k: int):
+    scores, ords = fts_search(kb_id, query, k)
+    return list(zip(ords, scores))
+
+def _rrf(*ranked: list[tuple[int, float]]) -> list[tuple[int, float]]:
+    fused: dict[int, float] = {}
+    for hits in ranked:
+        for rank, (o, _) in enumerate(hits, start=1):
+            fused[o] = fused.get(o, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+def _hydrate(kb_id: str, pairs: list[tuple[int, float]], top_k: int):
     if not pairs:
         return []
-    ords2 = [p[0] for p in pairs]
-    chunks = fetch_chunks_by_ord(kb_id, ords2)
-    # attach score in same order
-    out = []
-    for i, c in enumerate(chunks):
-        out.append({
-            "rank": i + 1,
-            "score": float(pairs[i][1]),
-            "filename": c["filename"],
-            "text": c["text"],
-            "chunk_id": c["chunk_id"],
-            "doc_id": c["doc_id"],
-            "vector_ord": c["vector_ord"],
-        })
-    return out
+    chunks = fetch_chunks_by_ord(kb_id, [p[0] for p in pairs])
+    return _format(kb_id, pairs, {c["vector_ord"]: c for c in chunks}, top_k)
+
+def _hit(rank: int, score: float, kb_id: str, c: dict) -> dict:
+    return {
+        "rank": rank,
+        "score": float(score),
+        "kb_id": kb_id,
+        "filename": c["filename"],
+        "text": c["text"],
+        "chunk_id": c["chunk_id"],
+        "doc_id": c["doc_id"],
+        "vector_ord": c["vector_ord"],
+        "page": c["page"],
+        "char_start": c["char_start"],
+        "char_end": c["char_end"],
+    }
+
+def _format(kb_id: str, pairs: list[tuple[int, float]], by_ord: dict[int, dict], top_k: int):
+    # vectors whose chunk is gone are skipped
+    chunks = [by_ord[o] for o, _ in pairs if o in by_ord]
+    score_by_ord = dict(pairs)
+    return [_hit(i + 1, score_by_ord[c["vector_ord"]], kb_id, c) for i, c in enumerate(chunks[:top_k])]
+
+def retrieve(kb_id: str, query: str, embeddings: Embeddings, top_k: int, mode: str = "dense"):
+    """Top-k chunks for a query.
+
+    mode: "dense" (FAISS), "lexical" (FTS5 BM25) or "hybrid" (both legs run
+    concurrently, fused with reciprocal rank fusion; score is the RRF score).
+    """
+    if mode == "lexical":
+        return _hydrate(kb_id, _lexical(kb_id, query, top_k), top_k)
+    if mode == "hybrid":
+        k = max(top_k * 3, 20)
+        # the BM25 leg runs in a copy of the caller's context so its stage timings reach the request trace
+        lexical = _pool.submit(copy_context().run, _lexical, kb_id, query, k)
+        dense = _dense(kb_id, query, embeddings, k)
+        return _hydrate(kb_id, _rrf(dense, lexical.result())[:top_k * 2], top_k)
+    return _hydrate(kb_id, _dense(kb_id, query, embeddings, top_k), top_k)
+
+def retrieve_batch(kb_id: str, queries: list[str], embeddings: Embeddings, top_k: int, mode: str = "dense"):
+    """`retrieve` for many queries: one embedding call, one FAISS search over the
+    query matrix and one hydration query for the union of hits."""
+    if not queries:
+        return []
+    k = max(top_k * 3, 20) if mode == "hybrid" else top_k
+    if mode == "lexical":
+        ranked = [_lexical(kb_id, q, k) for q in queries]
+    elif mode == "hybrid":
+        lexical = _pool.submit(copy_context().run, lambda: [_lexical(kb_id, q, k) for q in queries])
+        dense = _dense_batch(kb_id, queries, embeddings, k)
+        ranked = [_rrf(d, l)[:top_k * 2] for d, l in zip(dense, lexical.result())]
+    else:
+        ranked = _dense_batch(kb_id, queries, embeddings, k)
+    union = list(dict.fromkeys(o for pairs in ranked for o, _ in pairs))
+    by_ord = {c["vector_ord"]: c for c in fetch_chunks_by_ord(kb_id, union)}
+    return [_format(kb_id, pairs, by_ord, top_k) for pairs in ranked]
+
+def _shard(kb_id: str, query: str, qv: np.ndarray | None, k: int, mode: str) -> list[tuple[int, float]]:
+    # one KB's ranked (ord, score) list; the query vector is shared by all shards
+    dense = _valid(*search(kb_id, qv, k)) if qv is not None else []
+    if mode == "dense":
+        return dense
+    lexical = _lexical(kb_id, query, k)
+    return _rrf(dense, lexical)[:k] if mode == "hybrid" else lexical
+
+def retrieve_multi(kb_ids: list[str], query: str, embeddings: Embeddings, top_k: int, mode: str = "dense"):
+    """`retrieve` across several KBs; returns (hits, skipped).
+
+    The query is embedded once, every KB is searched in parallel, and the
+    per-KB rankings are merged by score (cosine for dense, RRF for hybrid,
+    BM25 for lexical) before one hydration query per contributing KB. Hits
+    carry their `kb_id`. A KB whose vectors have a different dimension than
+    the query embedding (built with another model) cannot take part in the
+    dense leg: it is listed in `skipped` and, in hybrid mode, still searched
+    lexically.
+    """
+    k = max(top_k * 3, 20) if mode == "hybrid" else top_k
+    qv = embeddings.embed_texts([query]) if mode in ("dense", "hybrid") else None
+    skipped = []
+    shards = {}
+    for kb_id in dict.fromkeys(kb_ids):
+        vec = qv
+        dim = index_dim(kb_id) if qv is not None else None
+        if dim is not None and dim != qv.shape[1]:
+            skipped.append({"kb_id": kb_id, "reason": f"embedding dim {dim} != query dim {qv.shape[1]}"})
+            if mode == "dense":
+                continue
+            vec = None  # hybrid: RRF over the lexical leg alone keeps scores comparable
+        shards[kb_id] = _pool.submit(copy_context().run, _shard, kb_id, query, vec, k, mode)
+
+    merged = sorted(((s, kb_id, o) for kb_id, f in shards.items() for o, s in f.result()), reverse=True)
+    merged = merged[:top_k * 2]  # a little slack for vectors whose chunk is gone
+    wanted: dict[str, list[int]] = {}
+    for _, kb_id, o in merged:
+        wanted.setdefault(kb_id, []).append(o)
+    fetched = {kb_id: _pool.submit(copy_context().run, fetch_chunks_by_ord, kb_id, ords)
+               for kb_id, ords in wanted.items()}
+    by_key = {(kb_id, c["vector_ord"]): c for kb_id, f in fetched.items() for c in f.result()}
+    found = [(s, kb_id, by_key[(kb_id, o)]) for s, kb_id, o in merged if (kb_id, o) in by_key]
+    return [_hit(i + 1, s, kb_id, c) for i, (s, kb_id, c) in enumerate(found[:top_k])], skipped
 
 def build_prompt(user_message: str, retrieved: list[dict]):
     sources = []
@@ -34,11 +154,14 @@ def build_prompt(user_message: str, retrieved: list[dict]):
         tag = f"S{i}"
         sources.append({
             "tag": tag,
+            "kb_id": r.get("kb_id"),
             "filename": r["filename"],
             "score": r["score"],
             "text": r["text"],
+            "page": r.get("page"),
         })
-        ctx.append(f"[{tag}] {r['filename']}\n{r['text']}")
+        where = f"{r['filename']} p.{r['page']}" if r.get("page") else r["filename"]
+        ctx.append(f"[{tag}] {where}\n{r['text']}")
     context = "\n\n".join(ctx).strip()
     system = (
         "You are a high-quality RAG assistant. "
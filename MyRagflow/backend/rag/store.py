@@ -1,84 +1,77 @@
 from __future__ import annotations
 
+import json
 import os
+import queue
 import sqlite3
+import threading
 import time
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Iterator
+from filelock import FileLock
+
+from utils.metrics import timed
+from .fts import FTS_TOKENIZER, fts_prep, fts_query
 
 DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data")).resolve()
 KBS_DIR = DATA_DIR / "kbs"
 KBS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Idle connections kept per database file.
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
 @dataclass
 class KB:
     kb_id: str
     name: str
     created_at: int
 
+@dataclass
+class NewDoc:
+    filename: str
+    mime: str
+    size_bytes: int
+    chunks: list[str]
+    pages: list[int | None] | None = None
+    # (start, end) character offsets of each chunk in the parsed text, None for captions
+    spans: list[tuple[int, int] | None] | None = None
+
 def _kb_dir(kb_id: str) -> Path:
     return (KBS_DIR / kb_id).resolve()
 
 def _db_path(kb_id: str) -> Path:
     return _kb_dir(kb_id) / "meta.sqlite"
 
+def _registry_path() -> Path:
+    return DATA_DIR / "registry.sqlite"
+
+def _uploads_dir(kb_id: str) -> Path:
+    return _kb_dir(kb_id) / "uploads"
+
 def _faiss_path(kb_id: str) -> Path:
     return _kb_dir(kb_id) / "index.faiss"
 
+def _vectors_path(kb_id: str) -> Path:
+    # exact float32 copy of the vectors for compressed indexes: (vector_ord, vector) records sorted by ord
+    return _kb_dir(kb_id) / "vectors.f32"
+
 def _lock_path(kb_id: str) -> Path:
     return _kb_dir(kb_id) / ".lock"
 
-def _connect(kb_id: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(_db_path(kb_id))
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_storage():
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    reg = DATA_DIR / "registry.sqlite"
-    conn = sqlite3.connect(reg)
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS kbs (
-      kb_id TEXT PRIMARY KEY,
-      name TEXT NOT NULL,
-      created_at INTEGER NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
-
-def list_kbs() -> list[KB]:
-    reg = DATA_DIR / "registry.sqlite"
-    conn = sqlite3.connect(reg)
-    conn.row_factory = sqlite3.Row
-    rows = conn.execute("SELECT kb_id, name, created_at FROM kbs ORDER BY created_at DESC").fetchall()
-    conn.close()
-    return [KB(kb_id=r["kb_id"], name=r["name"], created_at=r["created_at"]) for r in rows]
-
-def create_kb(name: str) -> KB:
-    kb_id = uuid.uuid4().hex[:12]
-    created_at = int(time.time())
-    kb_path = _kb_dir(kb_id)
-    kb_path.mkdir(parents=True, exist_ok=True)
-
-    reg = DATA_DIR / "registry.sqlite"
-    conn = sqlite3.connect(reg)
-    conn.execute("INSERT INTO kbs (kb_id, name, created_at) VALUES (?, ?, ?)", (kb_id, name, created_at))
-    conn.commit()
-    conn.close()
-
-    conn = _connect(kb_id)
-    conn.execute("""
+# Schema versions for per-KB databases, applied in order via PRAGMA user_version.
+_KB_MIGRATIONS = [
+    # 1: base schema
+    """
     CREATE TABLE IF NOT EXISTS docs (
       doc_id TEXT PRIMARY KEY,
       filename TEXT NOT NULL,
       mime TEXT,
       size_bytes INTEGER,
       created_at INTEGER NOT NULL
-    )
-    """)
-    conn.execute("""
+    );
     CREATE TABLE IF NOT EXISTS chunks (
       chunk_id TEXT PRIMARY KEY,
       doc_id TEXT NOT NULL,
@@ -87,26 +80,224 @@ def create_kb(name: str) -> KB:
       created_at INTEGER NOT NULL,
       vector_ord INTEGER NOT NULL,
       FOREIGN KEY(doc_id) REFERENCES docs(doc_id)
-    )
-    """)
-    conn.execute("""
+    );
     CREATE TABLE IF NOT EXISTS kv (
       key TEXT PRIMARY KEY,
       value TEXT NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
+    );
+    """,
+    # 2: lookups used by search hydration and document deletion
+    """
+    CREATE INDEX IF NOT EXISTS idx_chunks_vector_ord ON chunks(vector_ord);
+    CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);
+    """,
+    # 3: source page for citations (NULL for formats without pages)
+    """
+    ALTER TABLE chunks ADD COLUMN page INTEGER;
+    """,
+    # 4: full-text index for lexical/hybrid retrieval, rowid = vector_ord
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(body, tokenize="{FTS_TOKENIZER}");
+    INSERT INTO chunks_fts(rowid, body) SELECT vector_ord, fts_prep(text) FROM chunks;
+    """,
+    # 5: character span of the chunk in the document's parsed text (NULL for captions and older rows)
+    """
+    ALTER TABLE chunks ADD COLUMN char_start INTEGER;
+    ALTER TABLE chunks ADD COLUMN char_end INTEGER;
+    """,
+]
+
+_REGISTRY_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS kbs (
+      kb_id TEXT PRIMARY KEY,
+      name TEXT NOT NULL,
+      created_at INTEGER NOT NULL
+    );
+    """,
+    # 2: background ingestion jobs
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+      job_id TEXT PRIMARY KEY,
+      kb_id TEXT NOT NULL,
+      kind TEXT NOT NULL,
+      status TEXT NOT NULL,
+      stage TEXT NOT NULL,
+      progress REAL NOT NULL,
+      params TEXT NOT NULL,
+      result TEXT,
+      error TEXT,
+      created_at INTEGER NOT NULL,
+      updated_at INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_kb ON jobs(kb_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+    """,
+    # 3: job leases: the owning JobQueue instance and its last heartbeat
+    """
+    ALTER TABLE jobs ADD COLUMN owner TEXT;
+    ALTER TABLE jobs ADD COLUMN heartbeat_at INTEGER;
+    """,
+]
+
+def _statements(script: str) -> Iterator[str]:
+    # executescript() would commit the surrounding transaction, so scripts are run statement by statement
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf
+            buf = ""
+    if buf.strip():
+        yield buf
+
+def _migrate(conn: sqlite3.Connection, migrations: list[str]):
+    """Apply pending migrations in one write transaction.
+
+    The version is re-read after BEGIN IMMEDIATE has taken the write lock, so a
+    second process opening the same database waits and then finds nothing to do.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(migrations):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for script in migrations[version:]:
+            for stmt in _statements(script):
+                conn.execute(stmt)
+        conn.execute(f"PRAGMA user_version={max(version, len(migrations))}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def _open(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function("fts_prep", 1, fts_prep, deterministic=True)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")     # ~16 MB page cache per connection
+    conn.execute("PRAGMA mmap_size=268435456")   # 256 MB
+    return conn
+
+class _Pool:
+    def __init__(self, path: Path, migrations: list[str]):
+        self.path = path
+        self.idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+        conn = _open(path)
+        _migrate(conn, migrations)
+        self.release(conn)
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return _open(self.path)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pools: dict[Path, _Pool] = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+@contextmanager
+def _session(path: Path, migrations: list[str]):
+    """Borrow a pooled connection; commits on success, rolls back on error.
+
+    Sessions nest per thread: an inner session reuses the outer connection and
+    its transaction, so helpers like set_kv join a caller's bulk write.
+    """
+    active = getattr(_local, "conns", None)
+    if active is None:
+        active = _local.conns = {}
+    if path in active:
+        yield active[path]
+        return
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = _Pool(path, migrations)
+    conn = pool.acquire()
+    active[path] = conn
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        del active[path]
+        pool.release(conn)
+
+def _kb_session(kb_id: str):
+    return _session(_db_path(kb_id), _KB_MIGRATIONS)
+
+def _registry_session():
+    return _session(_registry_path(), _REGISTRY_MIGRATIONS)
+
+_locks: dict[str, FileLock] = {}
+
+def kb_lock(kb_id: str) -> FileLock:
+    """Cross-process write lock for a KB (re-entrant within a thread)."""
+    with _pools_lock:
+        lock = _locks.get(kb_id)
+        if lock is None:
+            lock = _locks[kb_id] = FileLock(str(_lock_path(kb_id)))
+        return lock
+
+def _close_pool(path: Path):
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+
+def init_storage():
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with _registry_session():
+        pass
+
+def list_kbs() -> list[KB]:
+    with _registry_session() as conn:
+        rows = conn.execute("SELECT kb_id, name, created_at FROM kbs ORDER BY created_at DESC").fetchall()
+    return [KB(kb_id=r["kb_id"], name=r["name"], created_at=r["created_at"]) for r in rows]
+
+def create_kb(name: str) -> KB:
+    kb_id = uuid.uuid4().hex[:12]
+    created_at = int(time.time())
+    kb_path = _kb_dir(kb_id)
+    kb_path.mkdir(parents=True, exist_ok=True)
+
+    with _registry_session() as conn:
+        conn.execute("INSERT INTO kbs (kb_id, name, created_at) VALUES (?, ?, ?)", (kb_id, name, created_at))
+
+    # first session creates the schema
+    with _kb_session(kb_id):
+        pass
 
     return KB(kb_id=kb_id, name=name, created_at=created_at)
 
 def delete_kb(kb_id: str):
-    reg = DATA_DIR / "registry.sqlite"
-    conn = sqlite3.connect(reg)
-    conn.execute("DELETE FROM kbs WHERE kb_id=?", (kb_id,))
-    conn.commit()
-    conn.close()
+    with _registry_session() as conn:
+        conn.execute("DELETE FROM kbs WHERE kb_id=?", (kb_id,))
 
+    _close_pool(_db_path(kb_id))
+    with _pools_lock:
+        _locks.pop(kb_id, None)
     kb_path = _kb_dir(kb_id)
     if kb_path.exists():
         for p in sorted(kb_path.rglob("*"), reverse=True):
@@ -119,78 +310,231 @@ def delete_kb(kb_id: str):
         except Exception:
             pass
 
+def kb_exists(kb_id: str) -> bool:
+    return _db_path(kb_id).exists()
+
 def list_docs(kb_id: str):
-    conn = _connect(kb_id)
-    rows = conn.execute("SELECT doc_id, filename, mime, size_bytes, created_at FROM docs ORDER BY created_at DESC").fetchall()
-    conn.close()
+    with _kb_session(kb_id) as conn:
+        rows = conn.execute("SELECT doc_id, filename, mime, size_bytes, created_at FROM docs ORDER BY created_at DESC").fetchall()
     return [dict(r) for r in rows]
 
+def kb_stats(kb_id: str) -> dict:
+    with _kb_session(kb_id) as conn:
+        row_docs = conn.execute("SELECT COUNT(*) AS n FROM docs").fetchone()
+        row_chunks = conn.execute("SELECT COUNT(*) AS n FROM chunks").fetchone()
+    return {"docs": int(row_docs["n"]), "chunks": int(row_chunks["n"])}
+
 def get_kv(kb_id: str, key: str):
-    conn = _connect(kb_id)
-    row = conn.execute("SELECT value FROM kv WHERE key=?", (key,)).fetchone()
-    conn.close()
+    with _kb_session(kb_id) as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key=?", (key,)).fetchone()
     return row["value"] if row else None
 
 def set_kv(kb_id: str, key: str, value: str):
-    conn = _connect(kb_id)
-    conn.execute("INSERT INTO kv(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-                 (key, value))
-    conn.commit()
-    conn.close()
+    with _kb_session(kb_id) as conn:
+        conn.execute("INSERT INTO kv(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                     (key, value))
+
+def _bump_content_version(conn: sqlite3.Connection):
+    conn.execute("INSERT INTO kv(key,value) VALUES('content_version','1') "
+                 "ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER) + 1")
+
+def content_version(kb_id: str) -> int:
+    """Counter bumped whenever the KB's searchable content changes (ingest, delete, rebuild)."""
+    return int(get_kv(kb_id, "content_version") or 0)
+
+def bump_content_version(kb_id: str):
+    with _kb_session(kb_id) as conn:
+        _bump_content_version(conn)
 
 def insert_doc(kb_id: str, filename: str, mime: str, size_bytes: int) -> str:
     doc_id = uuid.uuid4().hex[:12]
     created_at = int(time.time())
-    conn = _connect(kb_id)
-    conn.execute("INSERT INTO docs(doc_id, filename, mime, size_bytes, created_at) VALUES(?,?,?,?,?)",
-                 (doc_id, filename, mime, size_bytes, created_at))
-    conn.commit()
-    conn.close()
+    with _kb_session(kb_id) as conn:
+        conn.execute("INSERT INTO docs(doc_id, filename, mime, size_bytes, created_at) VALUES(?,?,?,?,?)",
+                     (doc_id, filename, mime, size_bytes, created_at))
     return doc_id
 
-def insert_chunks(kb_id: str, doc_id: str, chunks: list[str], start_ord: int) -> list[str]:
+def _chunk_rows(doc_id: str, chunks: list[str], start_ord: int, pages: list[int | None] | None = None,
+                spans: list[tuple[int, int] | None] | None = None):
     created_at = int(time.time())
-    conn = _connect(kb_id)
-    chunk_ids = []
-    for i, text in enumerate(chunks):
-        chunk_id = uuid.uuid4().hex[:16]
-        chunk_ids.append(chunk_id)
-        conn.execute(
-            "INSERT INTO chunks(chunk_id, doc_id, chunk_index, text, created_at, vector_ord) VALUES(?,?,?,?,?,?)",
-            (chunk_id, doc_id, i, text, created_at, start_ord + i),
-        )
-    conn.commit()
-    conn.close()
-    return chunk_ids
+    pages = pages or [None] * len(chunks)
+    spans = spans or [None] * len(chunks)
+    return [(uuid.uuid4().hex[:16], doc_id, i, text, created_at, start_ord + i, page, *(span or (None, None)))
+            for i, (text, page, span) in enumerate(zip(chunks, pages, spans))]
+
+_INSERT_CHUNK_SQL = ("INSERT INTO chunks(chunk_id, doc_id, chunk_index, text, created_at, vector_ord, page, "
+                     "char_start, char_end) VALUES(?,?,?,?,?,?,?,?,?)")
+_INSERT_FTS_SQL = "INSERT INTO chunks_fts(rowid, body) VALUES(?, fts_prep(?))"
+
+def _insert_chunk_rows(conn: sqlite3.Connection, rows: list[tuple]):
+    conn.executemany(_INSERT_CHUNK_SQL, rows)
+    conn.executemany(_INSERT_FTS_SQL, [(r[5], r[3]) for r in rows])
+
+def _allocate_ords(conn: sqlite3.Connection, n: int) -> int:
+    row = conn.execute("SELECT value FROM kv WHERE key='next_vector_ord'").fetchone()
+    if row is not None:
+        start = int(row["value"])
+    else:
+        row = conn.execute("SELECT COALESCE(MAX(vector_ord) + 1, 0) AS n FROM chunks").fetchone()
+        start = int(row["n"])
+    conn.execute("INSERT INTO kv(key,value) VALUES('next_vector_ord',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                 (str(start + n),))
+    return start
+
+@contextmanager
+def insert_documents(kb_id: str, docs: list[NewDoc]):
+    """Write documents and all their chunks in one transaction.
+
+    Yields [(doc_id, vector_ords)] per document. The transaction commits when
+    the block exits and rolls back if it raises, so callers add vectors to the
+    index inside it.
+    """
+    with _kb_session(kb_id) as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        with timed("db_write"):
+            start = _allocate_ords(conn, sum(len(d.chunks) for d in docs))
+            created_at = int(time.time())
+            written = []
+            for d in docs:
+                doc_id = uuid.uuid4().hex[:12]
+                conn.execute("INSERT INTO docs(doc_id, filename, mime, size_bytes, created_at) VALUES(?,?,?,?,?)",
+                             (doc_id, d.filename, d.mime, d.size_bytes, created_at))
+                _insert_chunk_rows(conn, _chunk_rows(doc_id, d.chunks, start, d.pages, d.spans))
+                written.append((doc_id, list(range(start, start + len(d.chunks)))))
+                start += len(d.chunks)
+            _bump_content_version(conn)
+        yield written
+
+def list_vector_ords(kb_id: str) -> list[int]:
+    with _kb_session(kb_id) as conn:
+        rows = conn.execute("SELECT vector_ord FROM chunks ORDER BY vector_ord ASC").fetchall()
+    return [int(r["vector_ord"]) for r in rows]
+
+def list_chunk_texts(kb_id: str) -> tuple[list[int], list[str]]:
+    with _kb_session(kb_id) as conn:
+        rows = conn.execute("SELECT vector_ord, text FROM chunks ORDER BY vector_ord ASC").fetchall()
+    return [int(r["vector_ord"]) for r in rows], [r["text"] for r in rows]
 
 def count_chunks(kb_id: str) -> int:
-    conn = _connect(kb_id)
-    row = conn.execute("SELECT COUNT(*) AS n FROM chunks").fetchone()
-    conn.close()
+    with _kb_session(kb_id) as conn:
+        row = conn.execute("SELECT COUNT(*) AS n FROM chunks").fetchone()
     return int(row["n"] if row else 0)
 
 def fetch_chunks_by_ord(kb_id: str, ords: list[int]) -> list[dict]:
+    """Hydrate chunks for FAISS hits, returned in the order of `ords` (missing ords skipped)."""
     if not ords:
         return []
-    placeholders = ",".join(["?"] * len(ords))
-    conn = _connect(kb_id)
-    rows = conn.execute(f"""
-      SELECT c.vector_ord, c.chunk_id, c.doc_id, c.chunk_index, c.text, d.filename
-      FROM chunks c
-      JOIN docs d ON c.doc_id = d.doc_id
-      WHERE c.vector_ord IN ({placeholders})
-    """, tuple(ords)).fetchall()
-    conn.close()
-    out = [dict(r) for r in rows]
-    out.sort(key=lambda x: ords.index(x["vector_ord"]))
-    return out
-
-def delete_doc_and_chunks(kb_id: str, doc_id: str):
-    conn = _connect(kb_id)
-    conn.execute("DELETE FROM chunks WHERE doc_id=?", (doc_id,))
-    conn.execute("DELETE FROM docs WHERE doc_id=?", (doc_id,))
-    conn.commit()
-    conn.close()
+    # one bound JSON array instead of one variable per ord (no SQLite variable limit)
+    with timed("hydrate"), _kb_session(kb_id) as conn:
+        rows = conn.execute("""
+          SELECT c.vector_ord, c.chunk_id, c.doc_id, c.chunk_index, c.text, c.page, c.char_start, c.char_end,
+                 d.filename
+          FROM chunks c
+          JOIN docs d ON c.doc_id = d.doc_id
+          WHERE c.vector_ord IN (SELECT value FROM json_each(?))
+        """, (json.dumps([int(o) for o in ords]),)).fetchall()
+    by_ord = {r["vector_ord"]: dict(r) for r in rows}
+    return [by_ord[o] for o in dict.fromkeys(ords) if o in by_ord]
+
+def fts_search(kb_id: str, query: str, limit: int) -> tuple[list[float], list[int]]:
+    """BM25 search over chunk text; returns (scores, vector_ords), best first (higher is better)."""
+    expr = fts_query(query)
+    if not expr:
+        return [], []
+    with timed("lexical"), _kb_session(kb_id) as conn:
+        rows = conn.execute(
+            "SELECT rowid, bm25(chunks_fts) AS s FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY s LIMIT ?",
+            (expr, int(limit)),
+        ).fetchall()
+    return [-float(r["s"]) for r in rows], [int(r["rowid"]) for r in rows]
+
+def delete_doc_and_chunks(kb_id: str, doc_id: str) -> list[int]:
+    """Delete a document and its chunks; returns the vector ords that were freed."""
+    with _kb_session(kb_id) as conn:
+        rows = conn.execute("SELECT vector_ord FROM chunks WHERE doc_id=?", (doc_id,)).fetchall()
+        conn.execute("DELETE FROM chunks_fts WHERE rowid IN (SELECT vector_ord FROM chunks WHERE doc_id=?)", (doc_id,))
+        conn.execute("DELETE FROM chunks WHERE doc_id=?", (doc_id,))
+        conn.execute("DELETE FROM docs WHERE doc_id=?", (doc_id,))
+        _bump_content_version(conn)
+    return [int(r["vector_ord"]) for r in rows]
+
+def _job_row(r) -> dict:
+    d = dict(r)
+    d["params"] = json.loads(d["params"])
+    d["result"] = json.loads(d["result"]) if d["result"] else None
+    return d
+
+def create_job(kb_id: str, kind: str, params: dict, owner: str | None = None) -> dict:
+    job_id = uuid.uuid4().hex[:16]
+    now = int(time.time())
+    with _registry_session() as conn:
+        conn.execute(
+            "INSERT INTO jobs(job_id, kb_id, kind, status, stage, progress, params, created_at, updated_at, "
+            "owner, heartbeat_at) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
+            (job_id, kb_id, kind, "queued", "queued", 0.0, json.dumps(params), now, now, owner, now),
+        )
+    return get_job(job_id)
+
+def update_job(job_id: str, **fields):
+    if "result" in fields and fields["result"] is not None:
+        fields["result"] = json.dumps(fields["result"])
+    fields["updated_at"] = int(time.time())
+    cols = ", ".join(f"{k}=?" for k in fields)
+    with _registry_session() as conn:
+        conn.execute(f"UPDATE jobs SET {cols} WHERE job_id=?", (*fields.values(), job_id))
+
+def claim_job(job_id: str, owner: str) -> bool:
+    """Move a queued job owned by `owner` to running; False if it isn't (or no longer) ours to run."""
+    now = int(time.time())
+    with _registry_session() as conn:
+        cur = conn.execute("UPDATE jobs SET status='running', stage='starting', updated_at=?, heartbeat_at=? "
+                           "WHERE job_id=? AND status='queued' AND owner=?", (now, now, job_id, owner))
+    return cur.rowcount == 1
+
+def heartbeat_jobs(owner: str):
+    """Renew the lease on every unfinished job `owner` holds."""
+    with _registry_session() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at=? WHERE owner=? AND status IN ('queued','running')",
+                     (int(time.time()), owner))
+
+def adopt_expired_jobs(owner: str, lease_s: float) -> list[dict]:
+    """Take over unfinished jobs whose owner stopped heartbeating `lease_s` ago, re-queued for `owner`.
+
+    Each job is moved with a conditional UPDATE, so when several processes
+    recover at once every job still gets exactly one new owner.
+    """
+    now = int(time.time())
+    cutoff = now - lease_s
+    adopted = []
+    with _registry_session() as conn:
+        rows = conn.execute("SELECT job_id FROM jobs WHERE status IN ('queued','running') "
+                            "AND COALESCE(heartbeat_at, 0) < ? ORDER BY created_at ASC", (cutoff,)).fetchall()
+        for r in rows:
+            cur = conn.execute(
+                "UPDATE jobs SET status='queued', stage='queued', progress=0, owner=?, heartbeat_at=?, updated_at=? "
+                "WHERE job_id=? AND status IN ('queued','running') AND COALESCE(heartbeat_at, 0) < ?",
+                (owner, now, now, r["job_id"], cutoff),
+            )
+            if cur.rowcount == 1:
+                adopted.append(r["job_id"])
+    return [get_job(j) for j in adopted]
+
+def get_job(job_id: str) -> dict | None:
+    with _registry_session() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+    return _job_row(row) if row else None
+
+def list_jobs(kb_id: str, limit: int = 50) -> list[dict]:
+    with _registry_session() as conn:
+        rows = conn.execute("SELECT * FROM jobs WHERE kb_id=? ORDER BY created_at DESC LIMIT ?",
+                            (kb_id, limit)).fetchall()
+    return [_job_row(r) for r in rows]
+
+def job_payload_path(kb_id: str, job_id: str) -> Path:
+    d = _uploads_dir(kb_id)
+    d.mkdir(parents=True, exist_ok=True)
+    return d / job_id
 
 def db_path(kb_id: str) -> Path:
     return _db_path(kb_id)
@@ -198,5 +542,8 @@ def db_path(kb_id: str) -> Path:
 def faiss_path(kb_id: str) -> Path:
     return _faiss_path(kb_id)
 
+def vectors_path(kb_id: str) -> Path:
+    return _vectors_path(kb_id)
+
 def lock_path(kb_id: str) -> Path:
     return _lock_path(kb_id)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from rag.store import DATA_DIR
+from rag.embeddings import Embeddings, EmbeddingsConfig
+from llm.image_prep import ImagePrepConfig
+from llm.vision_cache import VisionCache
+from llm.vision_pipeline import VisionPipeline
+from rag.images import DEFAULT_CAPTION_PROMPT
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    DEEPSEEK_API_KEY: str = ""
+    DEEPSEEK_BASE_URL: str = "https://api.deepseek.com"
+    DEEPSEEK_MODEL: str = "deepseek-chat"
+    LLM_MAX_CONCURRENCY: int = 64
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_TIMEOUT_S: float = 120.0
+
+    OPENAI_API_KEY: str = ""
+    OPENAI_VISION_MODEL: str = "gpt-4o-mini"
+    OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    OPENAI_BASE_URL: str = ""  # OpenAI-compatible embeddings endpoint; empty = api.openai.com
+    EMBED_BATCH_TOKENS: int = 32000
+    EMBED_CONCURRENCY: int = 4
+    EMBED_MAX_RETRIES: int = 6
+
+    # Vision provider
+    VISION_PROVIDER: str = "openai"  # openai | ollama | openai_compat
+    VISION_BASE_URL: str = ""
+    VISION_API_KEY: str = ""
+    VISION_MODEL: str = ""
+    OLLAMA_BASE_URL: str = "http://host.docker.internal:11434"
+    OLLAMA_VISION_MODEL: str = "llava:7b"
+    VISION_MAX_EDGE: int = 1568
+    VISION_JPEG_QUALITY: int = 85
+    VISION_CACHE_ENABLED: bool = True
+    VISION_CACHE_ENTRIES: int = 50000
+    VISION_CONCURRENCY: int = 4   # provider calls in flight per batch
+    VISION_RETRIES: int = 2
+    VISION_BATCH_MAX_IMAGES: int = 1000
+    INGEST_IMAGES: bool = True  # caption uploaded images and figures in PDF/DOCX
+    VISION_CAPTION_PROMPT: str = DEFAULT_CAPTION_PROMPT
+
+    EMBEDDINGS_PROVIDER: str = "openai"
+    LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    LOCAL_EMBED_BATCH_SIZE: int = 256
+    LOCAL_EMBED_THREADS: int = 0   # onnxruntime threads; 0 = runtime default
+    LOCAL_EMBED_PARALLEL: int = 1  # data-parallel worker processes for big batches; 1 = off, 0 = all cores
+    EMBED_WARMUP: bool = True      # load the local model at startup instead of on the first request
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_MB: int = 1024
+
+    DEFAULT_TOP_K: int = 6
+    # dense | lexical | hybrid; hybrid is opt-in: its source `score` is an RRF value (~0.01-0.03), not cosine
+    RETRIEVAL_MODE: str = "dense"
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 2048
+    ANSWER_CACHE_TTL_S: int = 3600
+    DEFAULT_CHUNK_SIZE: int = 900
+    DEFAULT_CHUNK_OVERLAP: int = 120
+    MAX_UPLOAD_MB: int = 80
+    MAX_BULK_UPLOAD_MB: int = 2048  # per file/archive on the bulk endpoint
+    INGEST_WORKERS: int = 2
+    INGEST_PER_KB: int = 1
+    JOB_LEASE_S: int = 120  # unfinished jobs whose worker stopped renewing for this long are taken over
+
+    APP_ENV: str = "prod"
+    LOG_LEVEL: str = "INFO"  # app loggers, incl. the per-request/per-job timing lines
+    BACKEND_HOST: str = "0.0.0.0"
+    BACKEND_PORT: int = 8000
+
+settings = Settings()
+
+def make_embeddings(settings: Settings) -> Embeddings:
+    return Embeddings(EmbeddingsConfig(
+        provider=settings.EMBEDDINGS_PROVIDER,
+        openai_api_key=settings.OPENAI_API_KEY,
+        openai_model=settings.OPENAI_EMBEDDING_MODEL,
+        local_model=settings.LOCAL_EMBEDDING_MODEL,
+        cache_path=str(DATA_DIR / "embed_cache.sqlite") if settings.EMBED_CACHE_ENABLED else None,
+        cache_max_mb=settings.EMBED_CACHE_MB,
+        openai_base_url=settings.OPENAI_BASE_URL or None,
+        batch_tokens=settings.EMBED_BATCH_TOKENS,
+        concurrency=settings.EMBED_CONCURRENCY,
+        max_retries=settings.EMBED_MAX_RETRIES,
+        local_batch_size=settings.LOCAL_EMBED_BATCH_SIZE,
+        local_threads=settings.LOCAL_EMBED_THREADS or None,
+        local_parallel=None if settings.LOCAL_EMBED_PARALLEL == 1 else settings.LOCAL_EMBED_PARALLEL,
+    ))
+
+def make_vision_pipeline(settings: Settings) -> VisionPipeline:
+    cache = VisionCache(DATA_DIR / "vision_cache.sqlite", settings.VISION_CACHE_ENTRIES) \
+        if settings.VISION_CACHE_ENABLED else None
+    return VisionPipeline(cache, ImagePrepConfig(max_edge=settings.VISION_MAX_EDGE,
+                                                 jpeg_quality=settings.VISION_JPEG_QUALITY))
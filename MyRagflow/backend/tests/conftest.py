@@ -0,0 +1,52 @@
+"""Shared test setup (run from backend/: python -m pytest).
+
+rag.store reads DATA_DIR at import time, so it is pointed at a throwaway
+directory here, before any test module imports it. API tests use `client`,
+which serves main.app with embeddings from a deterministic fake provider.
+"""
+from __future__ import annotations
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+_DATA_DIR = tempfile.mkdtemp(prefix="ragtest-")
+os.environ["DATA_DIR"] = _DATA_DIR
+os.environ.update(EMBED_WARMUP="false", OPENAI_API_KEY="test", DEEPSEEK_API_KEY="test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+@pytest.fixture
+def kb() -> str:
+    from rag.store import create_kb
+
+    return create_kb("test").kb_id
+
+def fake_embed(texts: list[str], dim: int = 16) -> np.ndarray:
+    """Stable pseudo-random vectors: the same text always embeds the same way."""
+    return np.stack([np.random.default_rng(zlib.crc32(t.encode("utf-8"))).standard_normal(dim).astype(np.float32)
+                     for t in texts])
+
+@pytest.fixture(scope="session")
+def _app_client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # one lifespan for the whole run: the job queue is not restarted once it has been closed
+    with TestClient(main.app) as c:
+        yield c
+
+@pytest.fixture
+def client(_app_client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.embeddings, "_embed_provider", fake_embed)
+    return _app_client
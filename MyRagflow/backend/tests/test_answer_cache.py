@@ -0,0 +1,77 @@
+from __future__ import annotations
+import json
+import time
+
+import pytest
+
+import main
+from conftest import fake_embed
+from rag.answer_cache import AnswerCache, answer_key
+from rag.ingest import write_documents
+from rag.store import NewDoc
+
+def test_key_ignores_case_width_and_spacing():
+    a = answer_key("kb", "What  is ＲＡＧ?", [{"role": "user", "content": " Hi "}], 6, "dense", "m")
+    b = answer_key("kb", "what is rag?", [{"role": "user", "content": "hi"}], 6, "dense", "m")
+    assert a == b
+    assert a != answer_key("kb", "what is rag?", [], 6, "dense", "m")
+    assert a != answer_key("kb", "what is rag?", [{"role": "user", "content": "hi"}], 6, "hybrid", "m")
+
+def test_version_change_ttl_and_invalidate():
+    cache = AnswerCache(max_entries=10, ttl_s=60)
+    cache.put("k1", "kb1", 3, "answer", [])
+    assert cache.get("k1", 3).answer == "answer"
+    assert cache.get("k1", 4) is None      # content changed since: dropped
+    assert cache.get("k1", 3) is None
+
+    cache.put("k2", ("kb1", "kb2"), (1, 1), "multi", [])
+    cache.put("k3", "kb3", 1, "other", [])
+    cache.invalidate("kb2")
+    assert cache.get("k2", (1, 1)) is None
+    assert cache.get("k3", 1) is not None
+
+    short = AnswerCache(max_entries=10, ttl_s=0.01)
+    short.put("k", "kb", 1, "soon stale", [])
+    time.sleep(0.02)
+    assert short.get("k", 1) is None
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    async def stream(messages, temperature=0.2):
+        calls.append(messages)
+        for token in ("cached ", "answer"):
+            yield token
+
+    monkeypatch.setattr(main.deepseek, "stream", stream)
+    return calls
+
+def _ask(client, kb_id: str) -> dict:
+    res = client.post("/api/chat/stream", json={"kb_id": kb_id, "message": "what about turbines?"})
+    events = {}
+    for block in res.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events[lines["event"]] = json.loads(lines["data"])
+    return events
+
+def _add(kb_id: str, name: str, chunks: list[str]) -> str:
+    return write_documents(kb_id, [NewDoc(name, "text/plain", 0, chunks)], fake_embed(chunks))[0]
+
+def test_ingest_and_delete_invalidate_cached_answers(client, llm):
+    kb_id = client.post("/api/kbs", json={"name": "answers"}).json()["data"]["kb_id"]
+    _add(kb_id, "a.txt", ["turbines need yearly inspection", "gearboxes wear out"])
+
+    first = _ask(client, kb_id)
+    assert first["meta"]["cached"] is False and first["final"]["content"] == "cached answer"
+    assert _ask(client, kb_id)["meta"]["cached"] is True
+    assert len(llm) == 1
+
+    # new content: the next answer is generated again and then cached
+    doc_id = _add(kb_id, "b.txt", ["turbine blades are inspected by drone"])
+    assert _ask(client, kb_id)["meta"]["cached"] is False
+    assert _ask(client, kb_id)["meta"]["cached"] is True
+
+    assert client.delete(f"/api/kbs/{kb_id}/docs/{doc_id}").json()["ok"]
+    assert _ask(client, kb_id)["meta"]["cached"] is False
+    assert len(llm) == 3
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import io
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+
+import main
+from rag.bulk import is_image, iter_archive, iter_files, walk_dir
+from rag.store import job_payload_path, list_jobs
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+def _tar(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+def _new_kb(client) -> str:
+    return client.post("/api/kbs", json={"name": "bulk"}).json()["data"]["kb_id"]
+
+def _wait(client, kb_id: str, job_id: str) -> dict:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/kbs/{kb_id}/jobs/{job_id}").json()["data"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_iter_files_expands_archives_and_skips_the_rest(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"plain")
+    (tmp_path / "skip.exe").write_bytes(b"binary")
+    (tmp_path / "docs.zip").write_bytes(_zip({"x/b.md": b"# b", "__MACOSX/._b.md": b"junk", "c.bin": b"?"}))
+    (tmp_path / "more.tar.gz").write_bytes(_tar({"d.csv": b"a,b", "big.txt": b"x" * 100}))
+
+    paths = walk_dir(tmp_path, images=False)
+    assert [p.name for p in paths] == ["a.txt", "docs.zip", "more.tar.gz"]
+    got = dict(iter_files(paths, max_bytes=50, images=False))
+    assert got == {"a.txt": b"plain", "x/b.md": b"# b", "d.csv": b"a,b"}
+
+def test_iter_archive_reads_open_files():
+    data = _zip({"one.txt": b"1", "two.png": b"2"})
+    assert list(iter_archive(io.BytesIO(data), 10, accept=is_image, name="up.zip")) == [("two.png", b"2")]
+
+def test_bulk_upload_keeps_original_filenames(client):
+    kb_id = _new_kb(client)
+    files = [
+        ("files", ("report.txt", b"first report about turbines", "text/plain")),
+        ("files", ("report.txt", b"second report about gearboxes", "text/plain")),
+        ("files", ("docs.zip", _zip({"notes/plan.md": b"# plan\nrollout steps", "skip.exe": b"?"}),
+                   "application/zip")),
+    ]
+    res = client.post(f"/api/kbs/{kb_id}/upload/bulk", files=files).json()
+    job = _wait(client, kb_id, res["data"]["job_id"])
+
+    assert job["status"] == "done", job
+    names = sorted(d["filename"] for d in client.get(f"/api/kbs/{kb_id}/docs").json()["data"])
+    assert names == ["notes/plan.md", "report.txt", "report.txt"]
+    assert not job_payload_path(kb_id, job["job_id"]).exists()
+
+def test_oversized_bulk_file_leaves_no_job(client, monkeypatch):
+    kb_id = _new_kb(client)
+    monkeypatch.setattr(main.settings, "MAX_BULK_UPLOAD_MB", 0)
+    res = client.post(f"/api/kbs/{kb_id}/upload/bulk", files=[("files", ("a.txt", b"too big", "text/plain"))])
+
+    assert res.status_code == 413 and res.json()["error"]["code"] == "LIMIT"
+    assert list_jobs(kb_id) == []
+    assert not any(p.name.startswith(".staging-") for p in Path(job_payload_path(kb_id, "x")).parent.iterdir())
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from rag.embed_batch import OpenAIBatchEmbedder, pack_batches
+from utils.text_splitter import estimate_tokens
+
+class FakeEmbeddings:
+    """Embeds "t<i>" as [i, len]; answers out of order and rate-limits the first `fail` calls."""
+
+    def __init__(self, fail: int = 0, retry_after: str = "0.05"):
+        self.fail = fail
+        self.retry_after = retry_after
+        self.batches: list[list[str]] = []
+        self.lock = threading.Lock()
+
+    def create(self, model: str, input: list[str]):
+        with self.lock:
+            if self.fail:
+                self.fail -= 1
+                resp = httpx.Response(429, headers={"retry-after": self.retry_after},
+                                      request=httpx.Request("POST", "http://embed.test/v1/embeddings"))
+                raise openai.RateLimitError("rate limited", response=resp, body=None)
+            self.batches.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(t[1:]), float(len(t))]) for i, t in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+def _embedder(fake: FakeEmbeddings, **kwargs) -> OpenAIBatchEmbedder:
+    return OpenAIBatchEmbedder(SimpleNamespace(embeddings=fake), "m", backoff_s=0.0, **kwargs)
+
+def test_pack_batches_respects_tokens_and_items():
+    texts = ["word " * 50] * 10 + ["x" * 4000] + ["y"] * 5
+    batches = pack_batches(texts, max_tokens=200, max_items=4)
+    assert batches[0][0] == 0 and batches[-1][1] == len(texts)
+    assert all(a[1] == b[0] for a, b in zip(batches, batches[1:]))
+    for start, end in batches:
+        assert end - start <= 4
+        assert end - start == 1 or sum(estimate_tokens(t) for t in texts[start:end]) <= 200
+
+def test_results_keep_input_order_across_batches():
+    fake = FakeEmbeddings()
+    texts = [f"t{i}" for i in range(300)]
+    out = _embedder(fake, max_tokens=40, concurrency=4).embed(texts)
+    assert len(fake.batches) > 4
+    np.testing.assert_array_equal(out[:, 0], np.arange(300))
+
+def test_rate_limit_waits_for_retry_after_and_backs_off():
+    fake = FakeEmbeddings(fail=1, retry_after="0.2")
+    emb = _embedder(fake, concurrency=4)
+    t0 = time.monotonic()
+    out = emb.embed(["t1", "t2"])
+    assert time.monotonic() - t0 >= 0.2
+    np.testing.assert_array_equal(out[:, 0], [1, 2])
+    stats = emb.stats()
+    assert (stats["rate_limited"], stats["retries"], stats["requests"]) == (1, 1, 1)
+    assert stats["effective_concurrency"] == 2
+
+def test_rate_limit_gives_up_after_max_retries():
+    emb = _embedder(FakeEmbeddings(fail=10, retry_after="0"), max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        emb.embed(["t1"])
+    assert emb.stats()["rate_limited"] == 3
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import numpy as np
+
+from rag.embed_cache import EmbeddingCache
+from rag.embeddings import Embeddings, EmbeddingsConfig
+
+def _embeddings(cache_path, base_url: str | None = None) -> tuple[Embeddings, list[list[str]]]:
+    emb = Embeddings(EmbeddingsConfig(provider="openai", openai_api_key="x", openai_model="m", local_model="",
+                                      cache_path=str(cache_path), openai_base_url=base_url))
+    calls: list[list[str]] = []
+
+    def provider(texts):
+        calls.append(list(texts))
+        return np.stack([np.full(4, len(t), dtype=np.float32) for t in texts])
+
+    emb._embed_provider = provider
+    return emb, calls
+
+def test_repeated_texts_are_served_from_the_cache(tmp_path):
+    emb, calls = _embeddings(tmp_path / "cache.sqlite")
+    first = emb.embed_texts(["a", "bb", "a"])
+    assert calls == [["a", "bb"]]  # deduplicated before the provider call
+
+    second = emb.embed_texts(["bb", "ccc", "a"])
+    assert calls[1:] == [["ccc"]]
+    np.testing.assert_array_equal(second[[0, 2]], first[[1, 0]])
+    assert second[1, 0] == 3
+    stats = emb.cache_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 4)  # per requested text, repeats included
+
+def test_cache_survives_restart(tmp_path):
+    emb, _ = _embeddings(tmp_path / "cache.sqlite")
+    emb.embed_texts(["persisted"])
+    again, calls = _embeddings(tmp_path / "cache.sqlite")
+    again.embed_texts(["persisted"])
+    assert calls == []
+
+def test_endpoints_do_not_share_entries(tmp_path):
+    assert EmbeddingCache.key("openai", "m", "t") == EmbeddingCache.key("openai", "m", "t", "")
+    assert EmbeddingCache.key("openai", "m", "t") != EmbeddingCache.key("openai", "m", "t", "http://local:8080/v1")
+
+    default, _ = _embeddings(tmp_path / "cache.sqlite")
+    default.embed_texts(["same text"])
+    other, calls = _embeddings(tmp_path / "cache.sqlite", "http://local:8080/v1/")
+    other.embed_texts(["same text"])
+    assert calls == [["same text"]]
+    # a trailing slash is the same endpoint
+    slashless, calls = _embeddings(tmp_path / "cache.sqlite", "http://local:8080/v1")
+    slashless.embed_texts(["same text"])
+    assert calls == []
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import pytest
+
+from rag.fts import MAX_QUERY_TERMS, fts_prep, fts_query
+from rag.store import NewDoc, fts_search, insert_documents
+
+@pytest.mark.parametrize("query, expected", [
+    ("数据库", '" 数  据 " OR " 据  库 "'),
+    ("库", '" 库 "'),
+    ("error E-1042", '"error" OR "E-1042"'),
+    ("part_no 7", '"part_no" OR "7"'),
+    ("向量DB检索", '" 向  量 " OR "DB" OR " 检  索 "'),
+    ("NEAR(a b)", '"NEAR(a" OR "b)"'),
+    ('say "hi"', '"say" OR """hi"""'),
+    ("a a a", '"a"'),
+])
+def test_fts_query_terms(query, expected):
+    assert fts_query(query) == expected
+
+@pytest.mark.parametrize("query", ["", "   ", "?!", "…？！", "-- ++ ()", "。，、"])
+def test_fts_query_without_words_is_empty(query):
+    assert fts_query(query) == ""
+
+def test_fts_query_caps_terms():
+    assert fts_query(" ".join(f"w{i}" for i in range(100))).count(" OR ") == MAX_QUERY_TERMS - 1
+
+def test_fts_prep_spaces_cjk_characters():
+    assert fts_prep("GPU显存") == "GPU 显  存 "
+    assert fts_prep(None) == ""
+
+def test_fts_search_with_cjk_and_punctuation(kb):
+    chunks = [
+        "向量数据库支持混合检索。",
+        "Error E-1042: disk full (see part_no 7).",
+        "Unrelated text about gardening.",
+    ]
+    with insert_documents(kb, [NewDoc("mixed.txt", "text/plain", 0, chunks)]) as written:
+        ords = written[0][1]
+
+    assert fts_search(kb, "数据库", 5)[1] == [ords[0]]
+    assert fts_search(kb, "混合检索？", 5)[1] == [ords[0]]
+    assert fts_search(kb, "E-1042?", 5)[1] == [ords[1]]
+    assert fts_search(kb, '"disk', 5)[1] == [ords[1]]
+    assert fts_search(kb, "part_no (7)", 5)[1][0] == ords[1]
+    # punctuation-only queries and FTS5 operators are never passed through as syntax
+    assert fts_search(kb, "？！…", 5) == ([], [])
+    assert fts_search(kb, "gardening AND NOT", 5)[1][0] == ords[2]
+    assert fts_search(kb, "NEAR(x y) OR", 5) == ([], [])
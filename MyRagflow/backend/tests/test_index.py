@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import faiss
+import numpy as np
+import pytest
+
+from rag.index import (
+    NLIST_RETRAIN_FACTOR, _export, _nlist, _normalize, _read_vectors, compact_index, get_index_config, load_index, search,
+    set_index_config,
+)
+from rag.ingest import delete_doc, write_documents
+from rag.store import NewDoc, list_vector_ords
+
+DIM = 32
+DOCS = 5
+PER_DOC = 300
+
+CASES = [
+    ("flat", {}),
+    ("hnsw", {}),
+    ("ivf", {}),
+    ("ivfpq", {"pq_m": 8, "pq_bits": 4}),
+    ("flat", {"storage": "float16", "rescore": 4}),
+    ("hnsw", {"storage": "sq8", "rescore": 4}),
+    ("ivf", {"storage": "float16"}),
+]
+
+def _fill(kb: str) -> tuple[list[str], dict[int, np.ndarray]]:
+    rng = np.random.default_rng(0)
+    doc_ids, vectors = [], {}
+    for d in range(DOCS):
+        vecs = _normalize(rng.standard_normal((PER_DOC, DIM), dtype=np.float32))
+        before = set(list_vector_ords(kb))
+        doc_ids += write_documents(kb, [NewDoc(f"d{d}.txt", "text/plain", 0, [f"d{d}c{i}" for i in range(PER_DOC)])],
+                                   vecs)
+        ords = sorted(set(list_vector_ords(kb)) - before)
+        vectors.update(zip(ords, vecs))
+    return doc_ids, vectors
+
+def _top(kb: str, vec: np.ndarray, k: int) -> list[int]:
+    return [o for o in search(kb, vec[None, :], k)[1] if o >= 0]
+
+@pytest.mark.parametrize("kind, params", CASES, ids=[f"{k}-{p.get('storage', 'float32')}" for k, p in CASES])
+def test_add_remove_compact_round_trip(kb, kind, params):
+    set_index_config(kb, kind, params)
+    doc_ids, vectors = _fill(kb)
+    cfg = get_index_config(kb)
+    assert (cfg["active"], cfg["vectors"]) == (kind, DOCS * PER_DOC)
+    ords = sorted(vectors)
+    assert all(ords[i] in _top(kb, vectors[ords[i]], 5) for i in range(0, len(ords), 97))
+
+    removed_docs = doc_ids[:2]
+    removed = set(ords[:2 * PER_DOC])
+    live = ords[2 * PER_DOC:]
+    for doc_id in removed_docs:
+        res = delete_doc(kb, doc_id)
+        assert res["chunks"] == PER_DOC
+        assert res["vectors_removed"] == (0 if kind == "hnsw" else PER_DOC)
+    cfg = get_index_config(kb)
+    if kind == "hnsw":
+        assert (cfg["vectors"], cfg["tombstones"]) == (DOCS * PER_DOC, len(removed))
+    else:
+        assert cfg["vectors"] == len(live)
+        assert set(_export(load_index(kb))[0].tolist()) == set(live)
+        assert not set(_top(kb, vectors[ords[0]], 10)) & removed
+
+    res = compact_index(kb)
+    assert res["compacted"] and res["vectors"] == len(live)
+    cfg = get_index_config(kb)
+    assert (cfg["vectors"], cfg["tombstones"]) == (len(live), 0)
+    assert sorted(_export(load_index(kb))[0].tolist()) == live
+    assert not set(_top(kb, vectors[ords[0]], 10)) & removed
+    assert all(live[i] in _top(kb, vectors[live[i]], 5) for i in range(0, len(live), 97))
+
+    exact = _read_vectors(kb, DIM)
+    if params.get("rescore") or params.get("storage", "float32") != "float32":
+        # the float32 copy keeps exactly the surviving ords, unchanged
+        assert exact["ord"].tolist() == live
+        np.testing.assert_allclose(exact["vec"], np.stack([vectors[o] for o in live]), atol=1e-6)
+    else:
+        assert exact is None
+
+def test_leaving_compressed_storage_restores_exact_vectors(kb):
+    _, vectors = _fill(kb)
+    ords = sorted(vectors)
+    expected = np.stack([vectors[o] for o in ords])
+
+    cfg = set_index_config(kb, "flat", {"storage": "sq8"})
+    assert (cfg["storage"], cfg["float32_copy"]) == ("sq8", True)
+    ids, vecs = _export(load_index(kb))
+    assert np.abs(vecs[np.argsort(ids)] - expected).max() > 1e-3  # SQ8 is lossy
+
+    cfg = set_index_config(kb, "flat", {"storage": "float32"})
+    assert (cfg["storage"], cfg["float32_copy"]) == ("float32", False)
+    ids, vecs = _export(load_index(kb))
+    assert ids[np.argsort(ids)].tolist() == ords
+    np.testing.assert_allclose(vecs[np.argsort(ids)], expected, atol=1e-6)
+
+def test_set_index_config_switches_kind_without_losing_vectors(kb):
+    _, vectors = _fill(kb)
+    ords = sorted(vectors)
+    for kind in ("hnsw", "ivf", "flat"):
+        cfg = set_index_config(kb, kind)
+        assert (cfg["active"], cfg["vectors"]) == (kind, len(ords))
+        assert ords[7] in _top(kb, vectors[ords[7]], 5)
+
+def test_set_index_config_rejects_bad_params(kb):
+    with pytest.raises(ValueError):
+        set_index_config(kb, "annoy")
+    with pytest.raises(ValueError):
+        set_index_config(kb, "flat", {"storage": "int4"})
+    with pytest.raises(ValueError):
+        set_index_config(kb, "flat", {"rescore": -1})
+    with pytest.raises(ValueError):
+        set_index_config(kb, "flat", {"bogus": 1})
+    for bad in ({"nlist": 0}, {"nprobe": -4}, {"hnsw_m": 1.5}, {"ef_search": "64"}, {"ef_construction": True},
+                {"pq_bits": None}):
+        with pytest.raises(ValueError):
+            set_index_config(kb, "ivf", bad)
+    # size-derived params accept None to go back to the default
+    assert set_index_config(kb, "ivf", {"nlist": None, "pq_m": None})["params"]["nlist"] is None
+
+def test_ivf_is_retrained_as_the_kb_grows(kb):
+    set_index_config(kb, "ivf")
+    rng = np.random.default_rng(1)
+    trained = []
+    for d in range(8):
+        vecs = rng.standard_normal((500, DIM), dtype=np.float32)
+        write_documents(kb, [NewDoc(f"d{d}.txt", "text/plain", 0, [f"d{d}c{i}" for i in range(500)])], vecs)
+        idx = load_index(kb)  # keep the wrapper alive while its inner index is used
+        trained.append(faiss.downcast_index(idx.index).nlist)
+    # nlist grows with the KB instead of staying at what the first batch could train
+    assert trained[0] == _nlist(500, {})
+    assert trained[-1] > trained[0] and _nlist(4000, {}) < NLIST_RETRAIN_FACTOR * trained[-1]
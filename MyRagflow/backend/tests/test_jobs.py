@@ -0,0 +1,35 @@
+from __future__ import annotations
+import threading
+import time
+
+from rag.store import adopt_expired_jobs, claim_job, create_job, get_job
+
+def test_claim_job_succeeds_exactly_once(kb):
+    job = create_job(kb, "upload", {}, owner="w1")
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim():
+        barrier.wait()
+        results.append(claim_job(job["job_id"], "w1"))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == 1
+    assert get_job(job["job_id"])["status"] == "running"
+
+def test_claim_job_requires_the_current_owner(kb):
+    job = create_job(kb, "upload", {}, owner="w1")
+    assert not claim_job(job["job_id"], "w2")
+
+    # once the lease has expired another queue adopts the job and only it may run it
+    time.sleep(1.1)
+    adopted = [j["job_id"] for j in adopt_expired_jobs("w2", lease_s=0)]
+    assert job["job_id"] in adopted
+    assert not claim_job(job["job_id"], "w1")
+    assert claim_job(job["job_id"], "w2")
+    assert not claim_job(job["job_id"], "w2")
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import uuid
+
+from rag import store
+from rag.store import NewDoc, count_chunks, fetch_chunks_by_ord, fts_search, insert_documents
+
+# schema written by the first release, before PRAGMA user_version was used
+_BASELINE_KB = """
+CREATE TABLE docs (doc_id TEXT PRIMARY KEY, filename TEXT NOT NULL, mime TEXT, size_bytes INTEGER,
+                   created_at INTEGER NOT NULL);
+CREATE TABLE chunks (chunk_id TEXT PRIMARY KEY, doc_id TEXT NOT NULL, chunk_index INTEGER NOT NULL,
+                     text TEXT NOT NULL, created_at INTEGER NOT NULL, vector_ord INTEGER NOT NULL,
+                     FOREIGN KEY(doc_id) REFERENCES docs(doc_id));
+CREATE TABLE kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+def _baseline_kb() -> str:
+    kb_id = uuid.uuid4().hex[:12]
+    store._kb_dir(kb_id).mkdir(parents=True)
+    with store._registry_session() as conn:
+        conn.execute("INSERT INTO kbs (kb_id, name, created_at) VALUES (?, ?, ?)", (kb_id, "old", 0))
+    conn = sqlite3.connect(store._db_path(kb_id))
+    conn.executescript(_BASELINE_KB)
+    conn.execute("INSERT INTO docs VALUES ('d1', 'old.txt', 'text/plain', 10, 0)")
+    conn.executemany("INSERT INTO chunks VALUES (?, 'd1', ?, ?, 0, ?)",
+                     [("c0", 0, "legacy chunk about turbines", 0), ("c1", 1, "风力发电机组的维护手册", 1)])
+    conn.commit()
+    conn.close()
+    return kb_id
+
+def test_baseline_kb_is_migrated_in_place():
+    kb_id = _baseline_kb()
+
+    assert count_chunks(kb_id) == 2
+    with store._kb_session(kb_id) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(store._KB_MIGRATIONS)
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(chunks)")}
+    assert {"page", "char_start", "char_end"} <= cols
+    # existing chunks are backfilled into the full-text index
+    assert fts_search(kb_id, "turbines", 5)[1] == [0]
+    assert fts_search(kb_id, "发电机", 5)[1] == [1]
+    old = fetch_chunks_by_ord(kb_id, [0, 1])
+    assert [c["chunk_id"] for c in old] == ["c0", "c1"]
+    assert all(c["page"] is None and c["char_start"] is None for c in old)
+
+    # new rows allocate ords after the legacy ones
+    with insert_documents(kb_id, [NewDoc("new.txt", "text/plain", 5, ["fresh"], [None], [(0, 5)])]) as written:
+        pass
+    assert written[0][1] == [2]
+    assert fetch_chunks_by_ord(kb_id, [2])[0]["char_end"] == 5
+
+def test_baseline_registry_migrates(tmp_path):
+    conn = store._open(tmp_path / "registry.sqlite")
+    conn.execute("CREATE TABLE kbs (kb_id TEXT PRIMARY KEY, name TEXT NOT NULL, created_at INTEGER NOT NULL)")
+    conn.execute("INSERT INTO kbs VALUES ('k1', 'old', 0)")
+    conn.commit()
+
+    store._migrate(conn, store._REGISTRY_MIGRATIONS)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(store._REGISTRY_MIGRATIONS)
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+    assert {"status", "owner", "heartbeat_at"} <= cols
+    assert conn.execute("SELECT name FROM kbs").fetchone()["name"] == "old"
+    conn.close()
+
+def test_concurrent_openers_migrate_once(tmp_path):
+    path = tmp_path / "registry.sqlite"
+    conns = [store._open(path) for _ in range(4)]
+    barrier = threading.Barrier(len(conns), timeout=10)
+    errors = []
+
+    def migrate(conn):
+        barrier.wait()
+        try:
+            store._migrate(conn, store._REGISTRY_MIGRATIONS)
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=migrate, args=(conn,)) for conn in conns]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    conn = store._open(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(store._REGISTRY_MIGRATIONS)
+    conn.close()
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from types import SimpleNamespace
+
+from conftest import fake_embed
+from rag.ingest import write_documents
+from rag.query import retrieve_multi
+from rag.store import NewDoc, create_kb
+
+EMBEDDINGS = SimpleNamespace(embed_texts=fake_embed)
+
+def _kb(name: str, chunks: list[str], dim: int = 16) -> str:
+    kb_id = create_kb(name).kb_id
+    write_documents(kb_id, [NewDoc(f"{name}.txt", "text/plain", 0, chunks)], fake_embed(chunks, dim))
+    return kb_id
+
+def test_hits_from_several_kbs_are_merged_by_score():
+    a = _kb("a", ["turbine maintenance schedule", "gearbox oil change"])
+    b = _kb("b", ["blade inspection by drone", "tower painting"])
+
+    hits, skipped = retrieve_multi([a, b], "blade inspection by drone", EMBEDDINGS, top_k=3)
+    assert skipped == []
+    assert (hits[0]["kb_id"], hits[0]["text"]) == (b, "blade inspection by drone")
+    assert {h["kb_id"] for h in hits} == {a, b}
+    scores = [h["score"] for h in hits]
+    assert scores == sorted(scores, reverse=True)
+    assert [h["rank"] for h in hits] == [1, 2, 3]
+
+def test_kb_with_another_embedding_dim_is_skipped_in_dense_mode():
+    a = _kb("a16", ["turbine maintenance schedule", "gearbox oil change"])
+    other = _kb("other8", ["turbine maintenance schedule for the old fleet"], dim=8)
+
+    hits, skipped = retrieve_multi([a, other], "turbine maintenance schedule", EMBEDDINGS, top_k=5)
+    assert [s["kb_id"] for s in skipped] == [other]
+    assert "8 != query dim 16" in skipped[0]["reason"]
+    assert {h["kb_id"] for h in hits} == {a}
+
+    # hybrid still searches it lexically
+    hits, skipped = retrieve_multi([a, other], "turbine maintenance schedule", EMBEDDINGS, top_k=5, mode="hybrid")
+    assert [s["kb_id"] for s in skipped] == [other]
+    assert other in {h["kb_id"] for h in hits}
@@ -0,0 +1,85 @@
+from __future__ import annotations
+import random
+from typing import NamedTuple
+
+import pytest
+
+from utils.text_splitter import chunk_text, estimate_tokens, split_segments
+
+class Seg(NamedTuple):
+    page: int
+    text: str
+
+_WORDS = ["alpha", "beta", "gamma,", "delta.", "数据", "模型。", "epsilon\n", "zeta\n\n", "η", "x" * 40]
+
+def _segments(rng: random.Random) -> list[Seg]:
+    # about one page in four is empty, like a scanned page without a text layer
+    return [Seg(p + 1, " ".join(rng.choice(_WORDS) for _ in range(rng.randint(0, 400))) if rng.random() > 0.25 else "")
+            for p in range(rng.randint(1, 6))]
+
+def _joined(segments) -> str:
+    return "\n".join(s.text for s in segments)
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("tokenizer", [len, estimate_tokens])
+def test_split_segments_invariants(seed, tokenizer):
+    rng = random.Random(seed)
+    segments = _segments(rng)
+    size = rng.choice([20, 100, 400])
+    overlap = rng.choice([0, 5, 30])
+    text = _joined(segments)
+    # offset of each segment in the joined text
+    starts, pos = [], 0
+    for s in segments:
+        starts.append(pos)
+        pos += len(s.text) + 1
+
+    chunks = list(split_segments(segments, size, overlap, tokenizer))
+
+    covered = [False] * len(text)
+    for c in chunks:
+        assert c.text and c.text == c.text.strip()
+        assert text[c.start:c.end] == c.text
+        assert tokenizer(c.text) <= size
+        seg = max(i for i, s in enumerate(starts) if s <= c.start and segments[i].text)
+        assert (c.segment, c.page) == (seg, segments[seg].page)
+        covered[c.start:c.end] = [True] * (c.end - c.start)
+    # nothing but whitespace is dropped
+    assert all(ok or ch.isspace() for ok, ch in zip(covered, text))
+    for a, b in zip(chunks, chunks[1:]):
+        assert b.start > a.start
+        # each step advances by at least about half a chunk, whatever the overlap
+        assert b.start - a.start >= (a.end - a.start) // 2 - 32
+
+def test_overlap_is_shared_between_neighbours():
+    text = " ".join(f"w{i}" for i in range(2000))
+    chunks = list(split_segments([text], 200, 40))
+    assert len(chunks) > 5
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.end > b.start  # overlapping
+        assert a.end - b.start <= 40 + 32
+    without = list(split_segments([text], 200, 0))
+    assert all(a.end <= b.start for a, b in zip(without, without[1:]))
+
+def test_chunks_run_across_segments():
+    segments = [Seg(1, "a " * 60), Seg(2, "b " * 60)]
+    chunks = list(split_segments(segments, 100, 0))
+    spanning = [c for c in chunks if "a" in c.text and "b" in c.text]
+    assert spanning and spanning[0].page == 1
+
+def test_empty_segments_keep_their_separator():
+    segments = [Seg(1, ""), Seg(2, "first page " * 20), Seg(3, ""), Seg(4, ""), Seg(5, "last page " * 20)]
+    text = _joined(segments)
+    chunks = list(split_segments(segments, 60, 10))
+    assert all(text[c.start:c.end] == c.text for c in chunks)
+    assert {c.page for c in chunks} == {2, 5}
+    assert min(c.start for c in chunks if c.page == 5) >= text.index("last page")
+
+def test_empty_and_blank_input():
+    assert list(split_segments([], 100, 10)) == []
+    assert list(split_segments(["", "   \n  "], 100, 10)) == []
+    assert chunk_text("", 100, 10) == []
+
+def test_chunk_text_matches_split_segments():
+    text = "Sentence one. Sentence two!\n\nNew paragraph " * 50
+    assert chunk_text(text, 300, 20) == [c.text for c in split_segments([text.strip()], 300, 20)]
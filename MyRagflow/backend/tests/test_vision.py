@@ -0,0 +1,137 @@
+from __future__ import annotations
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+
+import main
+from llm.image_prep import ImagePrepConfig, prepare_image
+from llm.vision_cache import VisionCache
+from llm.vision_pipeline import VisionPipeline
+
+def _png(color: str, size=(64, 48), mode: str = "RGB") -> bytes:
+    buf = io.BytesIO()
+    Image.new(mode, size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+def _jpeg_rotated(size=(80, 40)) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° clockwise when displayed
+    buf = io.BytesIO()
+    Image.new("RGB", size, "white").save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+class FakeVision:
+    model = "fake-vision"
+
+    def __init__(self, replies: list[str] | None = None):
+        self.calls = 0
+        self.replies = replies
+
+    def analyze(self, data: bytes, prompt: str, mime: str | None = None) -> str:
+        self.calls += 1
+        if self.replies:
+            return self.replies.pop(0)
+        return f"{prompt}: {mime}"
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+def test_small_images_pass_through_untouched():
+    data = _png("red")
+    img = prepare_image(data)
+    assert (img.data, img.mime, img.width, img.height) == (data, "image/png", 64, 48)
+
+def test_large_images_are_downscaled_and_reencoded():
+    img = prepare_image(_png("red", (3000, 1000)), ImagePrepConfig(max_edge=600))
+    assert (img.mime, img.width, img.height) == ("image/jpeg", 600, 200)
+    assert img.orig_mime == "image/png" and len(img.data) < img.orig_bytes
+
+    alpha = prepare_image(_png((0, 0, 0, 0), (1200, 1200), "RGBA"), ImagePrepConfig(max_edge=300))
+    assert (alpha.mime, alpha.width) == ("image/png", 300)
+
+def test_exif_orientation_is_applied():
+    img = prepare_image(_jpeg_rotated())
+    assert (img.width, img.height) == (40, 80)
+
+def test_undecodable_bytes_raise_value_error():
+    with pytest.raises(ValueError):
+        prepare_image(b"\x89PNG\r\n\x1a\nnot really")
+
+def test_pipeline_caches_answers_per_image_and_prompt(tmp_path):
+    vision = FakeVision()
+    pipe = VisionPipeline(VisionCache(tmp_path / "vision.sqlite", 100))
+    first = pipe.analyze("fake", vision, _png("red"), "describe")
+    again = pipe.analyze("fake", vision, _png("red"), "  describe ")
+    assert (first.cached, again.cached, again.text) == (False, True, first.text)
+    assert not pipe.analyze("fake", vision, _png("red"), "count things").cached
+    assert not pipe.analyze("fake", vision, _png("blue"), "describe").cached
+    assert vision.calls == 3
+    stats = pipe.stats()
+    assert (stats["requests"], stats["provider_calls"], stats["cache"]["hits"]) == (4, 3, 1)
+
+def test_empty_answers_are_not_cached(tmp_path):
+    vision = FakeVision(replies=["  ", "a red square"])
+    pipe = VisionPipeline(VisionCache(tmp_path / "vision.sqlite", 100))
+    assert pipe.analyze("fake", vision, _png("red"), "describe").text == "  "
+    assert pipe.analyze("fake", vision, _png("red"), "describe").text == "a red square"
+    assert pipe.analyze("fake", vision, _png("red"), "describe").cached
+    assert vision.calls == 2
+
+def test_cache_trims_below_its_limit(tmp_path):
+    cache = VisionCache(tmp_path / "vision.sqlite", 10)
+    for i in range(11):
+        cache.put(f"k{i}", f"text {i}")
+    cache.put("k10", "again")  # an existing key is not counted twice
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"]) == (9, 2)
+    assert sum(cache.get(f"k{i}") is not None for i in range(11)) == 9
+
+def test_staged_uploads_outlive_the_form_files(tmp_path):
+    files = [UploadFile(io.BytesIO(_png("red")), filename="a.png"),
+             UploadFile(io.BytesIO(_zip({"b.png": _png("blue"), "notes.txt": b"x"})), filename="more.zip")]
+    staging, paths, total = main._stage_vision_batch(files, 10 * 1024 * 1024)
+    try:
+        for f in files:
+            f.file.close()  # what the framework does once the handler has returned
+        assert total == 2
+        assert [name for name, _ in main._iter_vision_uploads(paths, 10 * 1024 * 1024)] == ["a.png", "b.png"]
+    finally:
+        main.shutil.rmtree(staging)
+
+def test_batch_endpoint_streams_every_image(client, monkeypatch):
+    vision = FakeVision()
+    monkeypatch.setattr(main, "get_vision_client", lambda: ("fake", vision))
+    files = [
+        ("images", ("a.png", _png("red"), "image/png")),
+        ("images", ("pics.zip", _zip({"x/b.png": _png("green"), "c.png": _png("blue"), "readme.md": b"#"}),
+                    "application/zip")),
+    ]
+    res = client.post("/api/vision/analyze/batch", data={"prompt": "batch-endpoint"}, files=files)
+
+    assert res.status_code == 200
+    events = _events(res.text)
+    assert events[0][0] == "meta" and events[0][1]["total"] == 3
+    results = {e["name"]: e for kind, e in events if kind == "result"}
+    assert sorted(results) == ["a.png", "c.png", "x/b.png"]
+    assert all(r["text"] == "batch-endpoint: image/png" or r["cached"] for r in results.values())
+    assert events[-1][0] == "done" and events[-1][1]["succeeded"] == 3
+
+def test_batch_endpoint_rejects_uploads_without_images(client, monkeypatch):
+    monkeypatch.setattr(main, "get_vision_client", lambda: ("fake", FakeVision()))
+    res = client.post("/api/vision/analyze/batch", files=[("images", ("notes.zip", _zip({"a.txt": b"x"})))])
+    assert res.status_code == 400 and res.json()["error"]["code"] == "VALIDATION"
@@ -1,9 +1,12 @@
 from __future__ import annotations
 from fastapi import Request
 from fastapi.responses import ORJSONResponse
+import logging
 import uuid
 import traceback
 
+log = logging.getLogger(__name__)
+
 def json_error(message: str, code: str = "ERROR", status: int = 400, trace_id: str | None = None):
     return ORJSONResponse(
         status_code=status,
@@ -11,6 +14,7 @@ def json_error(message: str, code: str = "ERROR", status: int = 400, trace_id: s
     )
 
 async def unhandled_exception_handler(request: Request, exc: Exception):
-    trace_id = str(uuid.uuid4())
-    _ = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+    trace_id = getattr(request.state, "trace_id", None) or str(uuid.uuid4())
+    tb = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+    log.error("unhandled error trace_id=%s %s %s\n%s", trace_id, request.method, request.url.path, tb)
     return json_error("Internal server error", code="INTERNAL", status=500, trace_id=trace_id)
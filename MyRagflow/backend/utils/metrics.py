@@ -0,0 +1,174 @@
+from __future__ import annotations
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# seconds; covers sub-ms SQLite lookups up to minute-long ingest stages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_value(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """Prometheus-style histogram (cumulative buckets, sum, count) per label set; thread-safe."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for key, (counts, total, n) in series:
+            base = ",".join(f'{l}="{_label_value(v)}"' for l, v in zip(self.labelnames, key))
+            sep = "," if base else ""
+            acc = 0
+            for le, c in zip((*self.buckets, "+Inf"), counts):
+                acc += c
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {acc}')
+            tail = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{tail} {total:.6f}")
+            lines.append(f"{self.name}_count{tail} {n}")
+        return lines
+
+_registry: list[Histogram] = []
+
+def histogram(name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    h = Histogram(name, help, labelnames, buckets)
+    _registry.append(h)
+    return h
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    return "\n".join(line for h in _registry for line in h.render()) + "\n"
+
+STAGE_SECONDS = histogram("rag_stage_seconds", "Time spent in instrumented pipeline stages.", ("stage",))
+HTTP_SECONDS = histogram("rag_http_request_seconds", "HTTP request duration until the response is complete.",
+                         ("method", "endpoint", "status"))
+
+class Trace:
+    """Per-request (or per-job) stage breakdown, shared by every thread working for it.
+
+    Stages may nest (e.g. `search` includes an `index_load` on a cache miss) and
+    accumulate when a stage runs more than once.
+    """
+
+    def __init__(self, trace_id: str | None = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.t0 = time.perf_counter()
+        self._stages: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def stages_ms(self) -> dict[str, float]:
+        with self._lock:
+            return {k: round(v * 1000, 2) for k, v in self._stages.items()}
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 2)
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+def start_trace(trace_id: str | None = None) -> Trace:
+    """Make a new trace current for this context (threads started from it via
+    run_in_threadpool or copy_context().run see the same trace)."""
+    trace = Trace(trace_id)
+    _trace.set(trace)
+    return trace
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def timed(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+def timed_iter(stage: str, items: Iterable[T]) -> Iterator[T]:
+    """Yield from `items`, charging only the time spent producing each item to `stage`."""
+    it = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            observe(stage, time.perf_counter() - t0)
+            return
+        observe(stage, time.perf_counter() - t0)
+        yield item
+
+def log_trace(event: str, trace: Trace, **fields):
+    """One structured (JSON) log line with the trace id and its stage breakdown."""
+    log.info(json.dumps({"event": event, "trace_id": trace.trace_id, "total_ms": trace.elapsed_ms(),
+                         "stages_ms": trace.stages_ms(), **fields}, ensure_ascii=False, default=str))
+
+_TRACE_ID = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+class TraceMiddleware:
+    """ASGI middleware: a trace per HTTP request, its id in `X-Trace-Id` and
+    `request.state.trace_id`, and the request duration in `rag_http_request_seconds`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # a caller-supplied id (e.g. from a proxy) is kept so logs can be joined across services
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id", b"").decode("latin-1")
+        trace = start_trace(incoming if _TRACE_ID.fullmatch(incoming) else None)
+        scope.setdefault("state", {})["trace_id"] = trace.trace_id
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            HTTP_SECONDS.observe(time.perf_counter() - trace.t0, method=scope.get("method", ""),
+                                 endpoint=getattr(endpoint, "__name__", "unmatched"), status=status)
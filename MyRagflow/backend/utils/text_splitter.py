@@ -1,36 +1,149 @@
 from __future__ import annotations
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+# counts the size of a piece of text in whatever unit chunks are measured in
+Tokenizer = Callable[[str], int]
+
+class Chunk(NamedTuple):
+    text: str
+    start: int          # character offsets of `text` in the stream's segments joined with "\n"
+    end: int
+    segment: int        # index of the segment the chunk starts in
+    page: int | None    # that segment's page, when segments carry one
+
+def estimate_tokens(text: str) -> int:
+    """Cheap estimate of cl100k tokens: ~4 ASCII chars per token, ~1 per CJK/other char."""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+TOKENIZERS: dict[str, Tokenizer] = {"chars": len, "estimate": estimate_tokens}
+
+def get_tokenizer(name: str) -> Tokenizer:
+    try:
+        return TOKENIZERS[(name or "chars").strip().lower()]
+    except KeyError:
+        raise ValueError(f"unknown tokenizer {name!r}; expected one of {', '.join(TOKENIZERS)}") from None
+
+# preferred cut points, strongest first; a cut lands just after the separator
+_BOUNDARIES = (("\n\n",), ("\n",), ("。", "！", "？", "；", ". ", "! ", "? "), (" ", "，", ", "))
+
+def _cut(s: str, lo: int, end: int) -> int:
+    for seps in _BOUNDARIES:
+        best = -1
+        for sep in seps:
+            i = s.rfind(sep, lo, end)
+            if i != -1:
+                best = max(best, i + len(sep))
+        if best > lo:
+            return best
+    return end
+
+def _fit(s: str, pos: int, guess: int, limit: int, count: Tokenizer) -> tuple[int, int]:
+    """Largest-ish end with count(s[pos:end]) <= limit, in a few tokenizer calls.
+
+    Starts from the current chars-per-token estimate and rescales; each call is
+    O(chunk), so a chunk costs a small constant number of passes over its text.
+    """
+    n = len(s)
+    end = min(n, pos + max(1, guess))
+    t = count(s[pos:end])
+    while t > limit and end - pos > 1:
+        end = pos + max(1, int((end - pos) * limit / t * 0.97))
+        t = count(s[pos:end])
+    for _ in range(3):
+        if end >= n or t >= limit * 0.9:
+            break
+        cand = min(n, pos + int((end - pos) * limit / max(t, 1)))
+        ct = count(s[pos:cand])
+        if ct > limit:
+            break
+        end, t = cand, ct
+    return end, t
+
+def split_segments(
+    segments: Iterable,
+    max_tokens: int = 900,
+    overlap: int = 120,
+    tokenizer: Tokenizer = len,
+) -> Iterator[Chunk]:
+    """Split a stream of segments into chunks of at most `max_tokens` as measured by `tokenizer`.
+
+    Segments are strings or objects with `.text` (and optionally `.page`), e.g.
+    PDF pages. They are treated as one text joined with "\n", empty segments
+    included, so a chunk can run across a page break; it reports the segment
+    and page it starts in. Chunks are yielded as soon as they are cut and only
+    the unfinished tail is carried into the next segment, so memory is bounded
+    by about one segment plus one chunk. Cuts prefer paragraph, line, sentence and word boundaries in the
+    second half of the chunk. Consecutive chunks share about `overlap` tokens,
+    but each chunk advances by at least half its length, which keeps the whole
+    pass linear in the input size.
+    """
+    max_tokens = max(1, int(max_tokens))
+    overlap = max(0, min(int(overlap), max_tokens - 1))
+    ratio = 1.0   # chars per token, refined as chunks are measured
+    buf = ""      # the joined text from offset `base` on
+    base = 0
+    pos = 0       # start of the next chunk, relative to buf
+    origins: list[tuple[int, int, int | None]] = []  # (offset, segment, page) of segments still in buf
+
+    def emit(final: bool) -> Iterator[Chunk]:
+        nonlocal ratio, pos
+        n = len(buf)
+        while pos < n and buf[pos].isspace():
+            pos += 1
+        while pos < n:
+            end, t = _fit(buf, pos, int(max_tokens * ratio), max_tokens, tokenizer)
+            if t:
+                ratio = (end - pos) / t
+            if end >= n and not final:
+                return  # the rest fits in one chunk: it may still grow with the next segment
+            if end < n:
+                end = _cut(buf, pos + (end - pos) // 2, end)
+            raw = buf[pos:end]
+            text = raw.strip()
+            if text:
+                a = base + pos + (len(raw) - len(raw.lstrip()))
+                _, seg_no, page = next(o for o in reversed(origins) if o[0] <= a)
+                yield Chunk(text, a, a + len(text), seg_no, page)
+            if end >= n:
+                pos = n
+                return
+            nxt = max(end - int(overlap * ratio), pos + (end - pos + 1) // 2) if overlap else end
+            if nxt < end and not buf[nxt - 1].isspace():
+                # start the overlap on a word boundary when there is one close by
+                sp = buf.find(" ", nxt, min(end, nxt + 32))
+                if sp != -1:
+                    nxt = sp + 1
+            pos = nxt
+            while pos < n and buf[pos].isspace():
+                pos += 1
+
+    joined = 0  # length of the joined text so far
+    for seg_no, seg in enumerate(segments):
+        s = seg if isinstance(seg, str) else seg.text
+        page = None if isinstance(seg, str) else getattr(seg, "page", None)
+        if seg_no:
+            # the separator is counted for empty segments too, so offsets match "\n".join(segments)
+            buf += "\n"
+            joined += 1
+        if not s:
+            continue
+        origins.append((joined, seg_no, page))
+        buf += s
+        joined += len(s)
+        yield from emit(final=False)
+        # drop the text before the next chunk start, and the segments that lie wholly inside it
+        base += pos
+        buf = buf[pos:]
+        pos = 0
+        while len(origins) > 1 and origins[1][0] <= base:
+            origins.pop(0)
+    yield from emit(final=True)
 
 def chunk_text(text: str, chunk_size: int = 900, overlap: int = 120) -> list[str]:
+    """Character-sized chunks of one string (the original API, on top of `split_segments`)."""
     text = (text or "").replace("\r\n", "\n").strip()
     if not text:
         return []
     chunk_size = max(200, int(chunk_size))
-    overlap = max(0, min(int(overlap), chunk_size - 1))
-
-    chunks: list[str] = []
-    start = 0
-    n = len(text)
-
-    while start < n:
-        end = min(n, start + chunk_size)
-
-        # softer cut: try newline or sentence boundary near the end
-        if end < n:
-            window = 220
-            cut = text.rfind("\n\n", start, end)
-            if cut != -1 and end - cut < window:
-                end = cut
-            else:
-                cut = text.rfind(". ", start, end)
-                if cut != -1 and end - cut < window:
-                    end = cut + 1
-
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-        if end >= n:
-            break
-        start = max(0, end - overlap)
-
-    return chunks
+    return [c.text for c in split_segments([text], chunk_size, overlap, len)]
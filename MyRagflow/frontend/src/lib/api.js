@@ -34,6 +34,16 @@ export async function apiUpload(kbId, file, opts = {}) {
   return data.data ?? data;
 }
 
+export async function apiWaitJob(kbId, jobId, onProgress, intervalMs = 1000) {
+  for (;;) {
+    const job = await apiGet(`/kbs/${kbId}/jobs/${jobId}`);
+    onProgress?.(job);
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "ingest failed");
+    await new Promise(r => setTimeout(r, intervalMs));
+  }
+}
+
 export async function apiVision(prompt, file) {
   const fd = new FormData();
   fd.append("prompt", prompt || "");
@@ -14,7 +14,7 @@ function SourceCard({ s }) {
         <div className="text-xs text-zinc-400">{s.tag}</div>
         <div className="text-xs text-zinc-400">{(s.score ?? 0).toFixed(3)}</div>
       </div>
-      <div className="mt-1 font-semibold text-sm truncate">{s.filename}</div>
+      <div className="mt-1 font-semibold text-sm truncate">{s.filename}{s.page ? ` · p.${s.page}` : ""}</div>
       <div className="mt-2 text-xs text-zinc-300 leading-relaxed whitespace-pre-wrap line-clamp-6">
         {s.text}
       </div>
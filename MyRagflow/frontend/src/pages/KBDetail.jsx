@@ -3,7 +3,7 @@ import { useParams, Link } from "react-router-dom";
 import Topbar from "../components/Topbar";
 import Card from "../components/Card";
 import Dropzone from "../components/Dropzone";
-import { apiDelete, apiGet, apiPost, apiUpload } from "../lib/api";
+import { apiDelete, apiGet, apiPost, apiUpload, apiWaitJob } from "../lib/api";
 import { FileText, RefreshCw, Trash2, MessageSquare, ArrowLeft } from "lucide-react";
 
 function fmtSize(n) {
@@ -37,7 +37,8 @@ export default function KBDetail({ toast }) {
     setBusy(true);
     try {
       for (const f of files) {
-        const res = await apiUpload(kbId, f, { chunk_size: chunkSize, chunk_overlap: overlap });
+        const job = await apiUpload(kbId, f, { chunk_size: chunkSize, chunk_overlap: overlap });
+        const res = await apiWaitJob(kbId, job.job_id);
         toast?.success("已上传并索引", `${res.filename} · ${res.chunks} chunks`);
       }
       refresh();
@@ -62,7 +63,7 @@ export default function KBDetail({ toast }) {
   }
 
   async function delDoc(doc) {
-    if (!confirm(`删除文档：${doc.filename} ?（会触发重建索引）`)) return;
+    if (!confirm(`删除文档：${doc.filename} ?`)) return;
     setBusy(true);
     try {
       await apiDelete(`/kbs/${kbId}/docs/${doc.doc_id}`);
@@ -114,13 +115,13 @@ export default function KBDetail({ toast }) {
             </div>
           </div>
           <div className="mt-4">
-            <Dropzone onFiles={uploadFiles} accept={[".pdf",".docx",".txt",".md",".csv"]} />
+            <Dropzone onFiles={uploadFiles} accept={[".pdf",".docx",".txt",".md",".csv",".png",".jpg",".jpeg",".webp"]} />
           </div>
         </Card>
 
         <Card className="p-5">
           <div className="font-semibold">文档列表</div>
-          <div className="text-xs text-zinc-400 mt-1">删除文档会触发索引重建（安全优先）。</div>
+          <div className="text-xs text-zinc-400 mt-1">删除文档只移除该文档的向量，不会重新计算 embedding。</div>
 
           <div className="mt-4 overflow-x-auto">
             <table className="w-full text-sm">